@@ -13,6 +13,8 @@ import math
 
 from pid import PID
 from node_executor import execute_next_node
+from rpc_profiler import NullProfiler
+from vessel_context import context_for
 
 # ----------------------------------------------------------------------------
 # Script parameters
@@ -23,6 +25,7 @@ TELEM_DELAY = 5     #number of seconds between telemetry updates
 ALL_FUELS = ('LiquidFuel', 'SolidFuel')
 MAX_PHYSICS_WARP = 3 # valid values are 0 (none) through 3 (4x)
 next_telem_time=time.time()
+telemetry_streams = {}   # open TelemetryStreams for each connection
 
 class MissionParameters(object):
     '''
@@ -49,6 +52,7 @@ class MissionParameters(object):
        
 class Telemetry(object):
     def __init__(self, vessel, flight):
+        self.ut = None
         self.apoapsis = vessel.orbit.apoapsis_altitude
         self.periapsis = vessel.orbit.periapsis_altitude
         self.time_to_apo = vessel.orbit.time_to_apoapsis
@@ -62,6 +66,55 @@ class Telemetry(object):
         self.q = flight.dynamic_pressure
         self.g = flight.g_force
 
+    @classmethod
+    def from_values(cls, ut, values):
+        '''
+        build a Telemetry from already fetched values, tagged with their UT
+        '''
+        t = cls.__new__(cls)
+        t.__dict__.update(values)
+        t.inclination = math.radians(t.inclination)
+        t.ut = ut
+        return t
+
+class TelemetryStreams(object):
+    '''
+    Keeps a stream open for every Telemetry field, so a snapshot costs
+    no round trips.  The values are read while holding the connection's
+    stream update lock, so they all come from the same physics tick.
+    '''
+    FIELDS = (('apoapsis', 'orbit', 'apoapsis_altitude'),
+              ('periapsis', 'orbit', 'periapsis_altitude'),
+              ('time_to_apo', 'orbit', 'time_to_apoapsis'),
+              ('time_to_peri', 'orbit', 'time_to_periapsis'),
+              ('velocity', 'orbit', 'speed'),
+              ('inclination', 'orbit', 'inclination'),
+              ('altitude', 'flight', 'mean_altitude'),
+              ('vertical_speed', 'flight', 'vertical_speed'),
+              ('lat', 'flight', 'latitude'),
+              ('lon', 'flight', 'longitude'),
+              ('q', 'flight', 'dynamic_pressure'),
+              ('g', 'flight', 'g_force'))
+
+    def __init__(self, conn, vessel, flight):
+        self.conn = conn
+        self.vessel = vessel
+        sources = {'orbit': vessel.orbit, 'flight': flight}
+        self.ut = conn.add_stream(getattr, conn.space_center, 'ut')
+        self.streams = [(name, conn.add_stream(getattr, sources[source], attr))
+                        for name, source, attr in self.FIELDS]
+
+    def snapshot(self):
+        with self.conn.stream_update_condition:
+            ut = self.ut()
+            values = dict((name, stream()) for name, stream in self.streams)
+        return Telemetry.from_values(ut, values)
+
+    def remove(self):
+        self.ut.remove()
+        for name, stream in self.streams:
+            stream.remove()
+
  
 
 # ----------------------------------------------------------------------------
@@ -80,15 +133,17 @@ def main():
     launch_params = MissionParameters() 
     ascent(conn,launch_params)
     
-def ascent(conn, launch_params):
+def ascent(conn, launch_params, profiler=None):
     '''
     Ascent Autopilot function.  Goes to space, or dies trying.
+    Pass an rpc_profiler.RPCProfiler to get the RPC calls of each phase.
+    conn can be a connection or a vessel_context.VesselContext.
     '''
     #Setup KRPC and PIDs
-    conn = krpc.connect(name='Launch')
-    sc = conn.space_center
-    v = sc.active_vessel
-    telem=v.flight(v.orbit.body.reference_frame)
+    profiler = profiler or NullProfiler()
+    ctx = context_for(conn)
+    sc = ctx.space_center
+    v = ctx.vessel
     thrust_controller = PID(P=.001, I=0.0001, D=0.01)
     thrust_controller.ClampI = launch_params.max_q
     thrust_controller.setpoint(launch_params.max_q) 
@@ -102,41 +157,47 @@ def ascent(conn, launch_params):
     v.control.throttle=1.0
     
     #Gravity Turn Loop
+    profiler.start_phase('gravity turn')
     while apoapsis_way_low(v, launch_params.orbit_alt):
-        gravturn(conn, launch_params)
+        profiler.iteration()
+        gravturn(ctx, launch_params)
         autostage(v , launch_params.max_auto_stage)
-        limitq(conn, thrust_controller)
-        telemetry(conn)
+        limitq(ctx, thrust_controller)
+        telemetry(ctx)
         time.sleep(1.0 / REFRESH_FREQ)        
     v.control.throttle = 0.0
     
     # Fine Tune APA
+    profiler.start_phase('boost apoapsis')
     v.auto_pilot.disengage()
     v.auto_pilot.sas=True
     time.sleep(.1)
     v.auto_pilot.sas_mode = v.auto_pilot.sas_mode.prograde
     v.auto_pilot.wait()
-    boostAPA(conn, launch_params)  #fine tune APA
+    boostAPA(ctx, launch_params)  #fine tune APA
 
     # Coast Phase
+    profiler.start_phase('coast')
     sc.physics_warp_factor = MAX_PHYSICS_WARP
-    while still_in_atmosphere(conn):   
+    while still_in_atmosphere(ctx):   
+        profiler.iteration()
         if apoapsis_little_low(v , launch_params.orbit_alt):
             sc.physics_warp_factor = 0
-            boostAPA(conn, launch_params)
+            boostAPA(ctx, launch_params)
             sc.physics_warp_factor = MAX_PHYSICS_WARP
-        telemetry(conn)  
+        telemetry(ctx)  
         time.sleep(1.0 / REFRESH_FREQ)       
     
     # Circularization Burn
+    profiler.start_phase('circularize')
     sc.physics_warp_factor = 0
-    planCirc(conn)
-    telemetry(conn)
-    execute_next_node(conn)
+    planCirc(ctx)
+    telemetry(ctx)
+    execute_next_node(ctx.conn)
 
     # Finish Up
     if launch_params.deploy_solar: v.control.solar_panels=True 
-    telemetry(conn)
+    telemetry(ctx)
     v.auto_pilot.sas_mode= v.auto_pilot.sas_mode.prograde
  
 # ----------------------------------------------------------------------------
@@ -169,24 +230,24 @@ def gravturn(conn, launch_params):
     Execute quadratic gravity turn -  
     based on Robert Penner's easing equations (EaseOut)
     '''
-    vessel = conn.space_center.active_vessel
-    flight = vessel.flight(vessel.orbit.body.non_rotating_reference_frame)
+    ctx = context_for(conn)
+    flight = ctx.flight(ctx.non_rotating_reference_frame)
     progress=flight.mean_altitude/launch_params.grav_turn_finish
-    vessel.auto_pilot.target_pitch= 90-(-90 * progress*(progress-2))
+    ctx.auto_pilot.target_pitch= 90-(-90 * progress*(progress-2))
      
 def boostAPA(conn, launch_params):
     '''
     function to increase Apoapsis using low thrust on a 
     tight loop with no delay for increased precision.
     '''
-    vessel = conn.space_center.active_vessel
-    flight = vessel.flight(vessel.orbit.body.non_rotating_reference_frame)
+    ctx = context_for(conn)
+    vessel = ctx.vessel
 
-    vessel.control.throttle=.2
+    ctx.control.throttle=.2
     while apoapsis_little_low(vessel, launch_params.orbit_alt):
         autostage(vessel, launch_params.max_auto_stage)
-        telemetry(conn) 
-    vessel.control.throttle=0
+        telemetry(ctx) 
+    ctx.control.throttle=0
 
 def planCirc(conn):
 
@@ -196,15 +257,15 @@ def planCirc(conn):
     V2 is the velocity at apoapsis of a circular orbit.   
     Burn time uses Tsiolkovsky rocket equation.
     '''
-    vessel = conn.space_center.active_vessel
-    ut = conn.space_center.ut
-    grav_param = vessel.orbit.body.gravitational_parameter
-    apo = vessel.orbit.apoapsis
-    sma = vessel.orbit.semi_major_axis
+    ctx = context_for(conn)
+    ut = ctx.space_center.ut
+    grav_param = ctx.body.gravitational_parameter
+    apo = ctx.orbit.apoapsis
+    sma = ctx.orbit.semi_major_axis
     v1 = math.sqrt(grav_param * ((2.0 / apo) - (1.0 / sma)))
     v2 = math.sqrt(grav_param * ((2.0 / apo) - (1.0 / apo)))
-    vessel.control.add_node(ut + vessel.orbit.time_to_apoapsis, 
-                            prograde=(v2 - v1))
+    ctx.control.add_node(ut + ctx.orbit.time_to_apoapsis, 
+                         prograde=(v2 - v1))
 
 def inc_to_heading(inc):
     '''
@@ -227,9 +288,9 @@ def limitq(conn, controller):
     '''
     limits vessel's throttle to stay under MAX_Q using PID controller
     '''
-    vessel = conn.space_center.active_vessel
-    flight = vessel.flight(vessel.orbit.body.non_rotating_reference_frame)
-    vessel.control.throttle= controller.update(flight.dynamic_pressure)
+    ctx = context_for(conn)
+    flight = ctx.flight(ctx.non_rotating_reference_frame)
+    ctx.control.throttle= controller.update(flight.dynamic_pressure)
  
  
 # ----------------------------------------------------------------------------
@@ -244,14 +305,28 @@ def telemetry(conn):
     GUI later on. For this reason, no attempts to fit the lines has been
     made (yet)
     '''
-    vessel = conn.space_center.active_vessel
-    flight = vessel.flight(vessel.orbit.body.non_rotating_reference_frame)
     global next_telem_time
     
     if time.time() > next_telem_time:
-        display_telemetry(Telemetry(vessel, flight))
+        display_telemetry(telemetry_snapshot(conn))
         next_telem_time += TELEM_DELAY
 
+def telemetry_snapshot(conn):
+    '''
+    returns a Telemetry of the active vessel from one physics tick.  The
+    streams behind it are opened on first use and kept until the active
+    vessel changes.
+    '''
+    ctx = context_for(conn)
+    vessel = ctx.vessel
+    streams = telemetry_streams.get(ctx.conn)
+    if streams is None or streams.vessel != vessel:
+        if streams is not None:
+            streams.remove()
+        flight = ctx.flight(ctx.non_rotating_reference_frame)
+        streams = telemetry_streams[ctx.conn] = TelemetryStreams(ctx.conn, vessel, flight)
+    return streams.snapshot()
+
 def display_telemetry(t):
     '''
     Take a Telemetry object t and display it in a pleasing way
@@ -283,9 +358,9 @@ def display_telemetry(t):
 # ----------------------------------------------------------------------------                
 
 def still_in_atmosphere(conn):
-    vessel = conn.space_center.active_vessel
-    flight = vessel.flight(vessel.orbit.body.non_rotating_reference_frame)
-    return flight.mean_altitude<vessel.orbit.body.atmosphere_depth
+    ctx = context_for(conn)
+    flight = ctx.flight(ctx.non_rotating_reference_frame)
+    return flight.mean_altitude<ctx.body.atmosphere_depth
 
 def apoapsis_way_low(vessel, ORBIT_ALT):
     '''
@@ -0,0 +1,269 @@
+######################################################################
+### Suicide Burn Integrator Library and Example
+######################################################################
+###   Like all of the scripts in my folder here, this file contains
+###   functions you might want to include into your own scripts for
+###   actual use and a demo in the 'main' function that you can just
+###   run to see how it works.
+###
+###   The suicide burn estimate in landing.py is a closed-form formula
+###   that assumes the rocket's mass and the body's gravity stay the
+###   same for the whole burn.  Neither does - the rocket gets lighter
+###   and pulls harder as it burns, gravity gets stronger as it drops -
+###   so it has to plan on 95% throttle to leave room for the error.
+###
+###   This file flies the burn numerically instead: a point mass over
+###   a spherical body, burning retrograde, with the mass flow that the
+###   engines' Isp gives, stepped with RK4.  Everything works on whole
+###   arrays of starting states at once, so
+###
+###       burn_start(state, mu, thrust, isp, target_radius, horizon)
+###
+###   tries a spread of burn start times in one go and narrows down on
+###   the last one that still stops above the target.  A BurnTable
+###   precomputes burns over a grid of speeds, flight path angles,
+###   TWRs and altitudes, for lookups that cost next to nothing.
+###
+###   States are 4 by N arrays: radius from the body's centre, vertical
+###   speed (up is positive), horizontal speed and mass.
+######################################################################
+
+import itertools
+import math
+import time
+
+import numpy as np
+
+from constants import G0
+
+
+def derivatives(y, mu, thrust, mdot):
+    '''
+    rates of change of the states y while burning retrograde with
+    thrust (zero to coast)
+    '''
+    r, vr, vt, m = y
+    speed = np.maximum(np.hypot(vr, vt), 1e-6)
+    a = thrust / (m * speed)      # thrust acceleration per unit of speed
+    return np.array([vr,
+                     -mu / (r * r) + vt * vt / r - a * vr,
+                     -vr * vt / r - a * vt,
+                     -mdot * np.ones_like(m)])
+
+
+def rk4_step(y, dt, mu, thrust, mdot):
+    k1 = derivatives(y, mu, thrust, mdot)
+    k2 = derivatives(y + dt / 2 * k1, mu, thrust, mdot)
+    k3 = derivatives(y + dt / 2 * k2, mu, thrust, mdot)
+    k4 = derivatives(y + dt * k3, mu, thrust, mdot)
+    return y + dt / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+
+
+def coast(y, mu, times, dt=1.0, floor=None):
+    '''
+    the single state y (4 numbers) coasted to each of times (sorted,
+    seconds from now), as a 4 by len(times) array.  Given a floor
+    radius it stops there - later times get the state it stopped in.
+    '''
+    y = np.asarray(y, dtype=float).reshape(4, 1)
+    states = np.empty((4, len(times)))
+    t = 0.0
+    for k, target in enumerate(times):
+        steps = int(math.ceil((target - t) / dt)) if target > t else 0
+        for _ in range(steps):
+            if floor is not None and y[0, 0] <= floor:
+                break
+            y = rk4_step(y, (target - t) / steps, mu, 0.0, 0.0)
+        t = max(t, target)
+        states[:, k] = y[:, 0]
+    return states
+
+
+def simulate_burn(y, mu, thrust, isp, dt=.2, max_time=1200.0, floor=0.0, stop_speed=.5):
+    '''
+    Burns retrograde from every state in y until it stops descending, or
+    has slowed to stop_speed.  thrust and isp can be numbers or one per
+    state.  Steps get shorter as a burn runs out of speed, so no step
+    takes off more than half of what's left.
+
+    Returns arrays of the radius it stops at, how long the burn took
+    and the mass left.  A burn still descending when it reaches floor
+    radius, runs out of mass or reaches max_time has crashed - it
+    reports where it got to and a duration of NaN.
+    '''
+    y = np.array(y, dtype=float)
+    n = y.shape[1]
+    thrust = np.broadcast_to(np.asarray(thrust, dtype=float), (n,))
+    mdot = thrust / (np.broadcast_to(np.asarray(isp, dtype=float), (n,)) * G0)
+    end = y.copy()
+    duration = np.full(n, np.nan)
+    t = np.zeros(n)
+    active = (y[1] < 0) & (np.hypot(y[1], y[2]) > stop_speed)
+    duration[~active] = 0.0
+    while active.any():
+        idx = np.nonzero(active)[0]
+        before = y[:, idx]
+        speed = np.hypot(before[1], before[2])
+        step = np.minimum(dt, .5 * speed * before[3] / thrust[idx])
+        after = rk4_step(before, step, mu, thrust[idx], mdot[idx])
+        y[:, idx] = after
+        t[idx] += step
+
+        stopped = after[1] >= 0
+        f = np.ones(len(idx))
+        f[stopped] = before[1, stopped] / (before[1, stopped] - after[1, stopped])   # part of the step before it stopped
+        stopped |= np.hypot(after[1], after[2]) <= stop_speed
+        k = idx[stopped]
+        end[:, k] = before[:, stopped] + f[stopped] * (after[:, stopped] - before[:, stopped])
+        duration[k] = t[k] - (1 - f[stopped]) * step[stopped]
+        active[k] = False
+
+        crashed = ~stopped & ((after[0] <= floor) | (after[3] <= 0) | (t[idx] >= max_time))
+        end[:, idx[crashed]] = after[:, crashed]
+        active[idx[crashed]] = False
+    return end[0], duration, end[3]
+
+
+def burn_start(y, mu, thrust, isp, target_radius, horizon, samples=16, passes=3, dt=.2,
+               guess=None, window=2.0):
+    '''
+    Seconds from now to the latest moment a burn can start from state y
+    (4 numbers) and still stop at or above target_radius, and how long
+    that burn lasts.  horizon is how far ahead to look - the time until
+    the coasting orbit reaches target_radius is the natural choice.
+
+    Each pass coasts to samples start times and flies all of those
+    burns at once, then the next pass looks between the last start
+    that made it and the first that didn't.  If it's already too late
+    the start time is negative - an estimate of how late.  Already
+    below target_radius there's nothing to search: it's how long ago
+    it went through, and a burn started now.
+
+    Given a guess - last time's answer less the time since, say - the
+    first pass only looks within window seconds of it, with half the
+    samples, and it falls back to the whole horizon if the answer
+    isn't in there.
+    '''
+    y = np.asarray(y, dtype=float).ravel()
+    floor = min(y[0], target_radius) - 10 * max(abs(y[1]), 100.0)
+    if y[0] <= target_radius:
+        _, duration, _ = simulate_burn(y.reshape(4, 1), mu, thrust, isp, dt, floor=floor)
+        return float(-(target_radius - y[0]) / max(-y[1], 1e-3)), float(duration[0])
+    horizon = horizon if horizon > dt else dt    # and if it's nan
+    ranges = [(0.0, horizon, samples)]
+    if guess is not None and 0 < guess < horizon:
+        ranges.insert(0, (max(guess - window, 0.0), min(guess + window, horizon), max(samples // 2, 4)))
+
+    for lo, hi, n in ranges:
+        for _ in range(passes):
+            times = np.linspace(lo, hi, n)
+            end_r, duration, _ = simulate_burn(coast(y, mu, times, floor=floor), mu, thrust, isp, dt,
+                                               floor=floor)
+            margin = end_r - target_radius
+            ok = margin >= 0
+            if not ok[0]:
+                if times[0] > 0:
+                    break       # the guess was too late - search it all
+                slope = (margin[1] - margin[0]) / (times[1] - times[0])
+                late = times[0] - margin[0] / slope if slope < 0 else times[0]
+                return float(late), float(duration[0])
+            if ok.all():
+                if times[-1] < horizon:
+                    break       # too early
+                return float(times[-1]), float(duration[-1])
+            k = np.argmin(ok) - 1
+            lo, hi = times[k], times[k + 1]
+        else:
+            f = margin[k] / (margin[k] - margin[k + 1])
+            return float(lo + f * (hi - lo)), float(duration[k] + f * (duration[k + 1] - duration[k]))
+
+
+class BurnTable(object):
+    '''
+    Burns flown ahead of time over a grid, for one body and Isp.
+
+    speeds are in m/s, angles are flight path angles below the horizon
+    in degrees, twrs are thrust to weight at the body's surface gravity
+    and altitudes are above the body's radius.  lookup() interpolates
+    how much altitude a burn started there loses before it stops, and
+    how long it takes.  Building the default grid takes a few seconds;
+    lookups take microseconds.
+    '''
+    def __init__(self, mu, body_radius, isp,
+                 speeds=np.linspace(0.0, 800.0, 33),
+                 angles=np.linspace(0.0, 90.0, 10),
+                 twrs=np.linspace(1.5, 6.0, 10),
+                 altitudes=np.linspace(0.0, 15000.0, 6),
+                 dt=.2):
+        self.mu = mu
+        self.body_radius = body_radius
+        self.isp = isp
+        self.axes = [np.asarray(a, dtype=float) for a in (speeds, angles, twrs, altitudes)]
+        speed, angle, twr, alt = np.meshgrid(*self.axes, indexing='ij')
+        gamma = np.radians(angle.ravel())
+        surface_g = mu / (body_radius * body_radius)
+        r0 = body_radius + alt.ravel()
+        y = np.array([r0,
+                      -speed.ravel() * np.sin(gamma),
+                      speed.ravel() * np.cos(gamma),
+                      np.ones(r0.size)])
+        end_r, duration, _ = simulate_burn(y, mu, twr.ravel() * surface_g, isp, dt,
+                                           floor=body_radius / 2)
+        self.drop = (r0 - end_r).reshape(speed.shape)
+        self.duration = duration.reshape(speed.shape)
+
+    def lookup(self, speed, angle, twr, altitude):
+        '''
+        (altitude lost, burn duration) for a burn started now
+        '''
+        index = []
+        for axis, x in zip(self.axes, (speed, angle, twr, altitude)):
+            i = min(max(np.searchsorted(axis, x) - 1, 0), len(axis) - 2)
+            f = min(max((x - axis[i]) / (axis[i + 1] - axis[i]), 0.0), 1.0)
+            index.append(((i, 1 - f), (i + 1, f)))
+        drop = duration = 0.0
+        for corner in itertools.product(*index):
+            weight = np.prod([w for _, w in corner])
+            if weight:
+                at = tuple(i for i, _ in corner)
+                drop += weight * self.drop[at]
+                duration += weight * self.duration[at]
+        return float(drop), float(duration)
+
+
+##############################################################################
+## Main  -- only run when we execute this file directly.  Plans a burn
+##          for a lander falling towards the Mun both ways, and shows
+##          how quick table lookups are.  No game needed.
+##############################################################################
+def main():
+    mu, radius = 6.5138398e10, 200000.0
+    isp, mass, thrust = 320.0, 4000.0, 30000.0
+    target = radius + 2000.0
+    y = [radius + 12000.0, -200.0, 500.0, mass]
+
+    start = time.time()
+    countdown, duration = burn_start(y, mu, thrust, isp, target, horizon=60.0)
+    print('integrated: burn in {:.2f}s for {:.1f}s ({:.0f}ms to work out)'.format(
+        countdown, duration, (time.time() - start) * 1000))
+    end_r, _, end_m = simulate_burn(coast(y, mu, [countdown]), mu, thrust, isp)
+    print('  stops {:.1f}m above the target using {:.0f}kg of propellant'.format(
+        end_r[0] - target, mass - end_m[0]))
+
+    start = time.time()
+    table = BurnTable(mu, radius, isp)
+    print('table built in {:.1f}s'.format(time.time() - start))
+    speed = math.hypot(y[1], y[2])
+    twr = thrust / (mass * mu / radius ** 2)
+    args = (speed, math.degrees(math.atan2(-y[1], y[2])), twr, y[0] - radius)
+    start = time.time()
+    for _ in range(1000):
+        drop, duration = table.lookup(*args)
+    print('table: burning now loses {:.0f}m over {:.1f}s ({:.0f}us a lookup)'.format(
+        drop, duration, (time.time() - start) * 1000))
+    end_r, duration, _ = simulate_burn(np.reshape(y, (4, 1)), mu, thrust, isp)
+    print('  integrated directly: {:.0f}m over {:.1f}s'.format(y[0] - end_r[0], duration[0]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+######################################################################
+### Server-side Condition Waits Library and Example
+######################################################################
+###   Like all of the scripts in my folder here, this file contains
+###   functions you might want to include into your own scripts for
+###   actual use and a demo in the 'main' function that you can just
+###   run to see how it works.
+###
+###   The easy way to wait for something in kRPC is a loop:
+###
+###       while flight.speed > 0.01:
+###           pass
+###
+###   which asks the game for the speed thousands of times a second
+###   and keeps a CPU core busy doing it.  The kRPC server can do the
+###   watching itself: send it an expression once and it sends back a
+###   single event when the expression comes true.  wait_until builds
+###   that expression from plain comparisons:
+###
+###       wait_until(conn, attr(flight, 'speed') <= 0.01)
+###       wait_until(conn, (attr(orbit, 'eccentricity') >= .3) &
+###                        (attr(orbit, 'periapsis_altitude') <= 0))
+###
+###   Conditions combine with & (and), | (or) and ~ (not).  Against a
+###   server without expressions - or for a comparison it can't do -
+###   it falls back to streams of the values, checked hz times a second
+###   under the stream update lock, which still costs no round trips.
+###
+###   The expression has to compare like with like: values are taken to
+###   be doubles, so pass kind='float' for the ones kRPC returns as
+###   floats (a vessel's mass, resource amounts).
+######################################################################
+
+import operator
+import time
+
+_clock = getattr(time, 'monotonic', time.time)
+
+
+class Condition(object):
+    '''
+    Something that is either true or false on the server - build them by
+    comparing Values, and combine them with &, | and ~.
+    '''
+    def __and__(self, other):
+        return Combined('and_', operator.and_, self, other)
+
+    def __or__(self, other):
+        return Combined('or_', operator.or_, self, other)
+
+    def __invert__(self):
+        return Not(self)
+
+
+class Value(object):
+    '''
+    func(*args) on the server, the same as you would pass to add_stream
+    - Value(getattr, flight, 'speed'), Value(resources.amount, 'Ore').
+    kind is 'double', 'float', 'int' or 'bool': the type kRPC returns.
+    '''
+    def __init__(self, func, *args, **kwargs):
+        self.func = func
+        self.args = args
+        self.kind = kwargs.pop('kind', 'double')
+
+    def __lt__(self, other):
+        return Compare('less_than', operator.lt, self, other)
+
+    def __le__(self, other):
+        return Compare('less_than_or_equal', operator.le, self, other)
+
+    def __gt__(self, other):
+        return Compare('greater_than', operator.gt, self, other)
+
+    def __ge__(self, other):
+        return Compare('greater_than_or_equal', operator.ge, self, other)
+
+    def expression(self, conn, E):
+        return E.call(conn.get_call(self.func, *self.args))
+
+
+def attr(obj, name, kind='double'):
+    '''
+    the attribute name of a remote object, as a Value
+    '''
+    return Value(getattr, obj, name, kind=kind)
+
+
+class Compare(Condition):
+    def __init__(self, name, op, value, other):
+        self.name = name
+        self.op = op
+        self.value = value
+        self.other = other
+
+    def values(self):
+        return [v for v in (self.value, self.other) if isinstance(v, Value)]
+
+    def expression(self, conn, E):
+        if isinstance(self.other, Value):
+            other = self.other.expression(conn, E)
+        else:
+            kind = self.value.kind
+            cast = {'int': int, 'bool': bool}.get(kind, float)
+            other = getattr(E, 'constant_' + kind)(cast(self.other))
+        return getattr(E, self.name)(self.value.expression(conn, E), other)
+
+    def evaluate(self, read):
+        other = read(self.other) if isinstance(self.other, Value) else self.other
+        return self.op(read(self.value), other)
+
+
+class Combined(Condition):
+    def __init__(self, name, op, a, b):
+        self.name = name
+        self.op = op
+        self.a = a
+        self.b = b
+
+    def values(self):
+        return self.a.values() + self.b.values()
+
+    def expression(self, conn, E):
+        return getattr(E, self.name)(self.a.expression(conn, E), self.b.expression(conn, E))
+
+    def evaluate(self, read):
+        return self.op(bool(self.a.evaluate(read)), bool(self.b.evaluate(read)))
+
+
+class Not(Condition):
+    def __init__(self, a):
+        self.a = a
+
+    def values(self):
+        return self.a.values()
+
+    def expression(self, conn, E):
+        return E.not_(self.a.expression(conn, E))
+
+    def evaluate(self, read):
+        return not self.a.evaluate(read)
+
+
+def add_event(conn, condition):
+    '''
+    a kRPC event that fires when condition comes true
+    '''
+    return conn.krpc.add_event(condition.expression(conn, conn.krpc.Expression))
+
+
+def wait_until(conn, condition, timeout=None, hz=20, on_true=None):
+    '''
+    Blocks until condition is true, on a single server-side event if the
+    server can do it and on streams checked hz times a second if not.
+    Returns True, or False if timeout seconds went by first.  on_true,
+    if given, is called as soon as the condition is seen to be true -
+    before the event or streams are removed, which is another round
+    trip.
+    '''
+    try:
+        event = add_event(conn, condition)
+    except Exception:       # no expressions on this server, or one it can't build
+        return _wait_on_streams(conn, condition, timeout, hz, on_true)
+    end = None if timeout is None else _clock() + timeout
+    try:
+        with event.condition:
+            while not event.stream():
+                remaining = None if end is None else end - _clock()
+                if remaining is not None and remaining <= 0:
+                    return False
+                event.wait(remaining)
+        if on_true is not None:
+            on_true()
+        return True
+    finally:
+        event.remove()
+
+
+def _wait_on_streams(conn, condition, timeout, hz, on_true=None):
+    streams = {}
+    for value in condition.values():
+        if value not in streams:
+            streams[value] = conn.add_stream(value.func, *value.args)
+            streams[value].rate = hz
+    end = None if timeout is None else _clock() + timeout
+    try:
+        with conn.stream_update_condition:
+            while not condition.evaluate(lambda value: streams[value]()):
+                remaining = None if end is None else end - _clock()
+                if remaining is not None and remaining <= 0:
+                    return False
+                conn.wait_for_stream_update(remaining)
+        if on_true is not None:
+            on_true()
+        return True
+    finally:
+        for stream in streams.values():
+            stream.remove()
+
+
+##############################################################################
+## Main  -- only run when we execute this file directly.  Throttles up
+##          and waits on the server for the apoapsis to reach 10km,
+##          without polling.
+##############################################################################
+def main():
+    import krpc
+
+    conn = krpc.connect(name='Condition Waits')
+    vessel = conn.space_center.active_vessel
+    vessel.control.throttle = 1.0
+    vessel.control.activate_next_stage()
+    start = time.time()
+    wait_until(conn, attr(vessel.orbit, 'apoapsis_altitude') >= 10000)
+    vessel.control.throttle = 0.0
+    print('apoapsis reached 10km after {:.1f}s'.format(time.time() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,8 @@
+######################################################################
+### Physical Constants
+######################################################################
+###   Numbers more than one of the libraries here need, kept in one
+###   place so none of them has to import another just for a constant.
+######################################################################
+
+G0 = 9.80665   # standard gravity in m/s^2 - what Isp in seconds is measured against
@@ -19,7 +19,8 @@ import krpc
 import collections
 import math
 
-from pid import PID
+from pid import PIDBank
+from scheduler import FixedRateLoop
 
 v3 = collections.namedtuple('v3', 'right forward up') 
 
@@ -35,7 +36,7 @@ def main():
 ## works by lining vessel up parallel, with 10m of separation between
 ## docking ports.  When this is confirmed, it moves forward slowly to dock.
 ##############################################################################
-def dock(conn, speed_limit = 1.0):
+def dock(conn, speed_limit = 1.0, hz = 10):
 
     #Setup KRPC
     sc = conn.space_center
@@ -49,33 +50,31 @@ def dock(conn, speed_limit = 1.0):
     ap.target_direction = tuple(x * -1 for x in t.direction(rf))
     ap.engage()
 
-    #create PIDs
-    upPID = PID(.75,.25,1)   
-    rightPID = PID(.75,.25,1)
-    forwardPID = PID(.75,.2,.5)
+    #create PIDs - one bank of three, in (right, forward, up) order
+    pids = PIDBank(3, P=.75, I=v3(.25, .2, .25), D=v3(1, .5, 1))
 
-    proceed=False  
+    proceed=[False]  
     #'proceed' is a flag that signals that we're lined up and ready to dock.
     # Otherwise the program will try to line up 10m from the docking port.
+    # (it's in a list so the tick function below can change it)
  
     #LineUp and then dock  - in the same loop with 'proceed' controlling whether
     #we're headed for the 10m safe point, or headed forward to dock.
-    while True:
+    def tick():
         offset = getOffsets(v, t)  #grab data and compute setpoints
         velocity = getVelocities(v, t)
         if proceedCheck(offset):  #Check whether we're lined up and ready to dock
-            proceed = True
-        setpoints = getSetpoints(offset, proceed, speed_limit)  
+            proceed[0] = True
+        setpoints = getSetpoints(offset, proceed[0], speed_limit)  
         
-        upPID.setpoint(setpoints.up)  #set PID setpoints
-        rightPID.setpoint(setpoints.right)
-        forwardPID.setpoint(setpoints.forward)
+        pids.setpoint(setpoints)  #set PID setpoints
         
-        v.control.up = -upPID.update(velocity.up)  #steer vessel
-        v.control.right = -rightPID.update(velocity.right)
-        v.control.forward = -forwardPID.update(velocity.forward)
-     
-        time.sleep(.1)
+        steer = v3._make(-pids.update(velocity))  #steer vessel
+        v.control.up = float(steer.up)
+        v.control.right = float(steer.right)
+        v.control.forward = float(steer.forward)
+
+    FixedRateLoop(hz).run(tick)
              
 ##############################################################################
 ##  Helper Functions
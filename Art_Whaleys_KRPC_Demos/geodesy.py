@@ -0,0 +1,141 @@
+######################################################################
+### Geodesy Library and Example
+######################################################################
+###   Like all of the scripts in my folder here, this file contains
+###   functions you might want to include into your own scripts for
+###   actual use and a demo in the 'main' function that you can just
+###   run to see how it works.
+###
+###   Great circle math on a spherical body - where you end up going a
+###   distance along a bearing, which way to point to get somewhere,
+###   how far away it is and the points along the way.  Everything
+###   takes numbers or numpy arrays of any matching shape (and gives
+###   back the same), so a whole ground track or route is one call:
+###
+###       lats, lons = destination(lat, lon, bearing, np.arange(0, 5000, 10), radius)
+###       heights = terrain_cache(body).height(lats, lons)
+###
+###   Angles are in degrees, distances in the same units as radius -
+###   meters if you pass body.equatorial_radius.  Longitudes come back
+###   between -180 and 180.
+######################################################################
+
+import time
+
+import numpy as np
+
+
+def _out(x):
+    '''
+    plain floats for scalar results, arrays otherwise
+    '''
+    x = np.asarray(x)
+    return float(x) if x.ndim == 0 else x
+
+
+def normalize_longitude(lon):
+    return _out((np.asarray(lon, dtype=float) + 180.0) % 360.0 - 180.0)
+
+
+def destination(lat, lon, bearing, distance, radius):
+    '''
+    (lat, lon) reached going distance from lat, lon along bearing
+    '''
+    lat = np.radians(lat)
+    lon = np.radians(lon)
+    bearing = np.radians(bearing)
+    d = np.asarray(distance, dtype=float) / radius
+    lat2 = np.arcsin(np.sin(lat) * np.cos(d) + np.cos(lat) * np.sin(d) * np.cos(bearing))
+    lon2 = lon + np.arctan2(np.sin(bearing) * np.sin(d) * np.cos(lat),
+                            np.cos(d) - np.sin(lat) * np.sin(lat2))
+    return _out(np.degrees(lat2)), normalize_longitude(np.degrees(lon2))
+
+
+def initial_bearing(lat1, lon1, lat2, lon2):
+    '''
+    compass bearing, 0 to 360, to set off on from the first point to
+    reach the second
+    '''
+    lat1 = np.radians(lat1)
+    lat2 = np.radians(lat2)
+    dlon = np.radians(np.asarray(lon2, dtype=float) - lon1)
+    x = np.sin(dlon) * np.cos(lat2)
+    y = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlon)
+    return _out((np.degrees(np.arctan2(x, y)) + 360.0) % 360.0)
+
+
+def central_angle(lat1, lon1, lat2, lon2):
+    '''
+    angle in radians between two points, seen from the body's centre
+    (haversine formula)
+    '''
+    lat1 = np.radians(lat1)
+    lat2 = np.radians(lat2)
+    dlat = lat2 - lat1
+    dlon = np.radians(np.asarray(lon2, dtype=float) - lon1)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return _out(2 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0))))
+
+
+def distance(lat1, lon1, lat2, lon2, radius):
+    '''
+    great circle distance between two points
+    '''
+    return _out(radius * np.asarray(central_angle(lat1, lon1, lat2, lon2)))
+
+
+def interpolate(lat1, lon1, lat2, lon2, fraction):
+    '''
+    (lat, lon) of the point fraction of the way along the great circle
+    from the first point to the second.  fraction can be an array to get
+    a whole path at once.
+    '''
+    f = np.asarray(fraction, dtype=float)
+    delta = np.asarray(central_angle(lat1, lon1, lat2, lon2))
+    lat1, lon1, lat2, lon2 = (np.radians(x) for x in (lat1, lon1, lat2, lon2))
+    sin_delta = np.sin(delta)
+    safe = np.where(sin_delta > 1e-12, sin_delta, 1.0)
+    a = np.where(sin_delta > 1e-12, np.sin((1 - f) * delta) / safe, 1 - f)
+    b = np.where(sin_delta > 1e-12, np.sin(f * delta) / safe, f)
+    x = a * np.cos(lat1) * np.cos(lon1) + b * np.cos(lat2) * np.cos(lon2)
+    y = a * np.cos(lat1) * np.sin(lon1) + b * np.cos(lat2) * np.sin(lon2)
+    z = a * np.sin(lat1) + b * np.sin(lat2)
+    lat = np.degrees(np.arctan2(z, np.hypot(x, y)))
+    return _out(lat), normalize_longitude(np.degrees(np.arctan2(y, x)))
+
+
+def bearing_difference(heading, bearing):
+    '''
+    how far to turn, -180 to 180 degrees, to go from heading to bearing
+    '''
+    return _out((np.asarray(bearing, dtype=float) - heading + 180.0) % 360.0 - 180.0)
+
+
+##############################################################################
+## Main  -- only run when we execute this file directly.  Works out a
+##          route across the Mun one point at a time and all at once.
+##          No game needed.
+##############################################################################
+def main():
+    radius = 200000.0
+    start = (-0.5, 30.0)
+    end = (12.0, 48.0)
+    print('{:.0f}m away, set off on {:.1f} degrees'.format(
+        distance(start[0], start[1], end[0], end[1], radius),
+        initial_bearing(start[0], start[1], end[0], end[1])))
+
+    fractions = np.linspace(0.0, 1.0, 10000)
+    begin = time.time()
+    slow = [interpolate(start[0], start[1], end[0], end[1], f) for f in fractions]
+    one_at_a_time = time.time() - begin
+    begin = time.time()
+    lats, lons = interpolate(start[0], start[1], end[0], end[1], fractions)
+    all_at_once = time.time() - begin
+    print('{} route points: {:.0f}ms one at a time, {:.1f}ms all at once'.format(
+        len(fractions), one_at_a_time * 1000, all_at_once * 1000))
+    print('largest difference {:.2e} degrees'.format(
+        max(abs(np.array(slow)[:, 0] - lats).max(), abs(np.array(slow)[:, 1] - lons).max())))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+######################################################################
+### Heightmap Store Library and Example
+######################################################################
+###   Like all of the scripts in my folder here, this file contains
+###   functions you might want to include into your own scripts for
+###   actual use and a demo in the 'main' function that you can just
+###   run to see how it works.
+###
+###   terrain.TerrainCache stops a script asking for the same height
+###   twice, but it is gone when the script ends and the next run has
+###   to sample the same ground all over again.  A HeightmapStore keeps
+###   the grid heights on disk instead, one directory per body and grid:
+###
+###       ~/.krpc_heightmaps/Mun/0.01deg_16/tile_-12_340.npy
+###
+###   Every tile is a small .npy file opened with numpy.memmap, so a
+###   lookup reads just the pages it needs, heights that aren't known
+###   yet are NaN, and any number of scripts can read a store while
+###   another one fills it in.  To use it, attach it to the shared
+###   terrain cache:
+###
+###       heightmap.attach(body)
+###
+###   after which the cache's grid heights come from disk when they're
+###   there and are written to disk when they're not - for
+###   interpolated_height(), for height() at points on the grid, and so
+###   for highest(), which sticks to grid points when there's a store.
+###   survey() fills in a region ahead of time on a background thread.
+######################################################################
+
+import os
+import threading
+import time
+
+import numpy as np
+
+import terrain
+
+DEFAULT_DIRECTORY = os.path.join(os.path.expanduser('~'), '.krpc_heightmaps')
+
+
+def attach(body, directory=None):
+    '''
+    backs the shared terrain cache for body with the on-disk store and
+    returns the store
+    '''
+    cache = terrain.terrain_cache(body)
+    cache.store = HeightmapStore(body.name, cache.resolution, cache.tile_size, directory)
+    return cache.store
+
+
+class HeightmapStore(object):
+    '''
+    On-disk grid heights for one body, at resolution degrees and in
+    tiles of tile_size by tile_size grid points - the same grid a
+    TerrainCache with those settings uses.
+
+    Tiles are created the first time a height in them is written.
+    A new tile is written to a temporary file and linked into place,
+    so a reader never sees half a file and two writers can't both
+    create the same tile.
+    '''
+    def __init__(self, body_name, resolution=0.01, tile_size=16, directory=None):
+        self.resolution = float(resolution)
+        self.tile_size = tile_size
+        self.path = os.path.join(directory or DEFAULT_DIRECTORY, body_name,
+                                 '{:g}deg_{}'.format(self.resolution, tile_size))
+        self.tiles = {}     # (tile row, tile col) -> (writable, memmap)
+        self.lock = threading.Lock()
+
+    def _tile_path(self, key):
+        return os.path.join(self.path, 'tile_{}_{}.npy'.format(*key))
+
+    def _create(self, path):
+        if not os.path.isdir(self.path):
+            try:
+                os.makedirs(self.path)
+            except OSError:
+                if not os.path.isdir(self.path):
+                    raise
+        temp = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.current_thread().ident)
+        tile = np.lib.format.open_memmap(temp, mode='w+', dtype=np.float64,
+                                         shape=(self.tile_size, self.tile_size))
+        tile[:] = np.nan
+        tile.flush()
+        del tile
+        try:
+            os.link(temp, path)
+        except OSError:
+            pass        # someone else made it first - use theirs
+        finally:
+            os.remove(temp)
+
+    def tile(self, key, create=False):
+        '''
+        the memmap for a tile, or None if it hasn't been created and
+        create is False.  Tiles are opened read only until written to.
+        '''
+        with self.lock:
+            writable, tile = self.tiles.get(key, (False, None))
+            if tile is not None and (writable or not create):
+                return tile
+            path = self._tile_path(key)
+            if not os.path.exists(path):
+                if not create:
+                    return None
+                self._create(path)
+            tile = np.load(path, mmap_mode='r+' if create else 'r')
+            self.tiles[key] = (create, tile)
+            return tile
+
+    def _by_tile(self, i, j):
+        n = self.tile_size
+        i = np.asarray(i).ravel()
+        j = np.asarray(j).ravel()
+        keys = np.stack([i // n, j // n], axis=1)
+        for key in set(map(tuple, keys.tolist())):
+            index = np.nonzero((keys[:, 0] == key[0]) & (keys[:, 1] == key[1]))[0]
+            yield key, index, i[index] % n, j[index] % n
+
+    def read(self, i, j):
+        '''
+        heights at grid rows i, columns j (integer arrays), NaN where
+        they aren't in the store
+        '''
+        heights = np.full(np.shape(i), np.nan)
+        flat = heights.reshape(-1)
+        for key, index, rows, cols in self._by_tile(i, j):
+            tile = self.tile(key)
+            if tile is not None:
+                flat[index] = tile[rows, cols]
+        return heights
+
+    def write(self, i, j, heights):
+        '''
+        stores heights at grid rows i, columns j and flushes them to disk
+        '''
+        heights = np.asarray(heights, dtype=float).ravel()
+        for key, index, rows, cols in self._by_tile(i, j):
+            tile = self.tile(key, create=True)
+            tile[rows, cols] = heights[index]
+            tile.flush()
+
+    def tile_keys(self):
+        '''
+        every tile on disk
+        '''
+        if not os.path.isdir(self.path):
+            return []
+        keys = []
+        for name in os.listdir(self.path):
+            if name.startswith('tile_') and name.endswith('.npy'):
+                row, col = name[len('tile_'):-len('.npy')].split('_')
+                keys.append((int(row), int(col)))
+        return sorted(keys)
+
+
+class Survey(threading.Thread):
+    '''
+    Background thread that fills in every grid height the store is
+    missing over the box between two lat/lon corners - the short way
+    round in longitude - batch heights at a time.  fetch(lats, lons) gets the heights - by default from
+    body.surface_height - so it can use its own connection.
+
+    done and total count grid points; stop() ends it after the current
+    batch.
+    '''
+    def __init__(self, store, lat1, lon1, lat2, lon2, body=None, fetch=None, batch=256):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.store = store
+        self.body = body
+        self.fetch = fetch or self._fetch_from_body
+        self.batch = batch
+        res = store.resolution
+        r1, r2 = sorted(int(np.floor(lat / res)) for lat in (lat1, lat2))
+        columns = terrain.grid_columns(lon1, lon2, res, extra=1)
+        self.i, self.j = (a.ravel() for a in np.meshgrid(np.arange(r1, r2 + 2), columns, indexing='ij'))
+        self.total = self.i.size
+        self.done = 0
+        self.fetched = 0
+        self._stop_requested = threading.Event()
+
+    def _fetch_from_body(self, lats, lons):
+        return np.array([self.body.surface_height(float(lat), float(lon))
+                         for lat, lon in zip(lats, lons)])
+
+    def stop(self):
+        self._stop_requested.set()
+
+    def run(self):
+        res = self.store.resolution
+        for start in range(0, self.total, self.batch):
+            if self._stop_requested.is_set():
+                return
+            i = self.i[start:start + self.batch]
+            j = self.j[start:start + self.batch]
+            missing = np.isnan(self.store.read(i, j))
+            if missing.any():
+                heights = self.fetch(i[missing] * res, j[missing] * res)
+                self.store.write(i[missing], j[missing], heights)
+                self.fetched += int(missing.sum())
+            self.done += i.size
+
+
+def survey(store, lat1, lon1, lat2, lon2, body=None, fetch=None, batch=256):
+    '''
+    starts and returns a Survey of the box between two corners
+    '''
+    job = Survey(store, lat1, lon1, lat2, lon2, body, fetch, batch)
+    job.start()
+    return job
+
+
+##############################################################################
+## Main  -- only run when we execute this file directly.  Surveys the
+##          ground around the active vessel in the background on its own
+##          connection, then checks the terrain there without any RPCs.
+##############################################################################
+def main():
+    import krpc
+
+    conn = krpc.connect(name='Heightmap')
+    vessel = conn.space_center.active_vessel
+    body = vessel.orbit.body
+    flight = vessel.flight(body.reference_frame)
+    lat, lon = flight.latitude, flight.longitude
+    store = attach(body)
+
+    survey_conn = krpc.connect(name='Heightmap Survey')
+    survey_body = survey_conn.space_center.active_vessel.orbit.body
+    job = survey(store, lat - .1, lon - .1, lat + .1, lon + .1, body=survey_body)
+    while job.is_alive():
+        print('surveyed {} of {} heights ({} fetched)'.format(job.done, job.total, job.fetched))
+        time.sleep(1)
+
+    cache = terrain.terrain_cache(body)
+    lats, lons = np.mgrid[lat - .05:lat + .05:11j, lon - .05:lon + .05:11j]
+    heights = cache.interpolated_height(lats, lons)
+    print('highest {:.0f}m lowest {:.0f}m, {} heights fetched over RPC'.format(
+        heights.max(), heights.min(), cache.fetched))
+
+
+if __name__ == '__main__':
+    main()
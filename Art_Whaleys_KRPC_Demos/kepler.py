@@ -0,0 +1,293 @@
+######################################################################
+### Local Kepler Orbit Library and Example
+######################################################################
+###   Like all of the scripts in my folder here, this file contains
+###   functions you might want to include into your own scripts for
+###   actual use and a demo in the 'main' function that you can just
+###   run to see how it works.
+###
+###   Questions like "where will I be at this time" or "what's my mean
+###   anomaly then" are each a round trip to the game, and a search
+###   over time asks them hundreds of times.  But an orbit with no
+###   engines burning is fixed by a handful of numbers, so
+###
+###       orbit = KeplerOrbit.from_orbit(vessel.orbit)
+###
+###   fetches those once and answers everything else here:
+###
+###       orbit.position_at(ut)          # or an array of uts at once
+###       orbit.mean_anomaly_at(ut)
+###       orbit.radius_at(np.linspace(ut, ut + orbit.period, 1000))
+###
+###   closest_approaches(orbit, other, ut, revolutions=3) finds every
+###   time two orbits come closest over the next few orbits, nearest
+###   first, the same way.
+###
+###   Kepler's equation is solved with Newton's method on whole numpy
+###   arrays.  Positions and velocities are in the body's non-rotating
+###   reference frame, the same as vessel.position(body.non_rotating_
+###   reference_frame) - so they stop being right once the vessel
+###   burns or leaves the body's sphere of influence.  Elliptical
+###   orbits only.
+######################################################################
+
+import math
+import time
+from collections import namedtuple
+
+import numpy as np
+
+TWO_PI = 2 * math.pi
+GOLDEN = (math.sqrt(5) - 1) / 2
+
+Approach = namedtuple('Approach', 'ut distance')
+
+
+def _out(x):
+    '''
+    plain floats for scalar results, arrays otherwise
+    '''
+    x = np.asarray(x)
+    return float(x) if x.ndim == 0 else x
+
+
+def solve_kepler(M, e, tolerance=1e-12, iterations=30):
+    '''
+    eccentric anomaly E with E - e sin(E) = M, for a number or an array
+    of mean anomalies M and eccentricity e < 1
+    '''
+    M = np.mod(np.asarray(M, dtype=float), TWO_PI)
+    E = np.where(e < .8, M, math.pi)
+    for _ in range(iterations):
+        delta = (E - e * np.sin(E) - M) / (1 - e * np.cos(E))
+        E = E - delta
+        if np.all(np.abs(delta) < tolerance):
+            break
+    return E
+
+
+class KeplerOrbit(object):
+    '''
+    An elliptical orbit around a body with gravitational parameter mu,
+    that propagates itself.  The attributes are named like kRPC's Orbit
+    (semi_major_axis, eccentricity, inclination, longitude_of_ascending_
+    node, argument_of_periapsis, mean_anomaly_at_epoch, epoch, period,
+    ...) so it can stand in for one in code that only reads those.
+    Angles are in radians.
+
+    Make one with from_orbit (the orbital elements, in one go),
+    from_vessel (a state vector) or from_state.
+    '''
+    def __init__(self, mu, semi_major_axis, eccentricity, inclination,
+                 longitude_of_ascending_node, argument_of_periapsis, mean_anomaly_at_epoch, epoch):
+        if not (0 <= eccentricity < 1 and semi_major_axis > 0):
+            raise ValueError('KeplerOrbit only handles elliptical orbits')
+        self.mu = mu
+        self.semi_major_axis = a = semi_major_axis
+        self.eccentricity = e = eccentricity
+        self.inclination = inclination
+        self.longitude_of_ascending_node = lan = longitude_of_ascending_node
+        self.argument_of_periapsis = argp = argument_of_periapsis
+        self.mean_anomaly_at_epoch = mean_anomaly_at_epoch
+        self.epoch = epoch
+        self.semi_minor_axis = a * math.sqrt(1 - e * e)
+        self.periapsis = a * (1 - e)
+        self.apoapsis = a * (1 + e)
+        self.n = math.sqrt(mu / a ** 3)
+        self.period = TWO_PI / self.n
+
+        # axes of the orbit in the body's frame, y towards the north pole:
+        # W along the angular momentum, P to periapsis and Q 90 degrees on
+        node = np.array([math.cos(lan), 0.0, -math.sin(lan)])
+        self.W = np.array([math.sin(inclination) * math.sin(lan), math.cos(inclination),
+                           math.sin(inclination) * math.cos(lan)])
+        self.P = math.cos(argp) * node + math.sin(argp) * np.cross(self.W, node)
+        self.Q = np.cross(self.W, self.P)
+
+    @classmethod
+    def from_orbit(cls, orbit, mu=None):
+        '''
+        from a kRPC Orbit's elements - eight calls, or seven if you
+        already have the body's gravitational parameter
+        '''
+        if mu is None:
+            mu = orbit.body.gravitational_parameter
+        return cls(mu, orbit.semi_major_axis, orbit.eccentricity, orbit.inclination,
+                   orbit.longitude_of_ascending_node, orbit.argument_of_periapsis,
+                   orbit.mean_anomaly_at_epoch, orbit.epoch)
+
+    @classmethod
+    def from_vessel(cls, vessel, ut, mu=None, reference_frame=None):
+        '''
+        from a vessel's position and velocity now, ut being the time
+        now.  reference_frame must be its body's non-rotating frame -
+        pass it in if you have it to save asking for it.
+        '''
+        body = None
+        if mu is None or reference_frame is None:
+            body = vessel.orbit.body
+        if mu is None:
+            mu = body.gravitational_parameter
+        if reference_frame is None:
+            reference_frame = body.non_rotating_reference_frame
+        return cls.from_state(mu, vessel.position(reference_frame),
+                              vessel.velocity(reference_frame), ut)
+
+    @classmethod
+    def from_state(cls, mu, position, velocity, ut):
+        '''
+        from a position and velocity in the body's non-rotating frame
+        '''
+        r = np.asarray(position, dtype=float)
+        v = np.asarray(velocity, dtype=float)
+        h = np.cross(r, v)
+        hn = np.linalg.norm(h)
+        a = 1.0 / (2.0 / np.linalg.norm(r) - v.dot(v) / mu)
+        e_vec = np.cross(v, h) / mu - r / np.linalg.norm(r)
+        e = np.linalg.norm(e_vec)
+        inclination = math.acos(max(-1.0, min(1.0, h[1] / hn)))
+        node = np.cross([0.0, 1.0, 0.0], h)
+        if np.linalg.norm(node) < 1e-9 * max(hn, 1.0):
+            node = np.array([1.0, 0.0, 0.0])      # equatorial - any node will do
+        node /= np.linalg.norm(node)
+        lan = math.atan2(-node[2], node[0]) % TWO_PI
+        W = h / hn
+        P = e_vec / e if e > 1e-9 else node
+        argp = math.atan2(np.cross(node, P).dot(W), node.dot(P)) % TWO_PI
+        nu = math.atan2(r.dot(np.cross(W, P)), r.dot(P))
+        E = math.atan2(math.sqrt(1 - e * e) * math.sin(nu), e + math.cos(nu))
+        return cls(mu, a, e, inclination, lan, argp, (E - e * math.sin(E)) % TWO_PI, ut)
+
+    def mean_anomaly_at(self, ut):
+        return _out(np.mod(self.mean_anomaly_at_epoch + self.n * (np.asarray(ut, dtype=float) - self.epoch),
+                           TWO_PI))
+
+    def eccentric_anomaly_at(self, ut):
+        return _out(solve_kepler(self.mean_anomaly_at(ut), self.eccentricity))
+
+    def true_anomaly_at(self, ut):
+        '''
+        true anomaly at ut, 0 to 2 pi
+        '''
+        E = np.asarray(self.eccentric_anomaly_at(ut))
+        e = self.eccentricity
+        nu = np.arctan2(math.sqrt(1 - e * e) * np.sin(E), np.cos(E) - e)
+        return _out(np.mod(nu, TWO_PI))
+
+    def mean_longitude_at(self, ut):
+        '''
+        longitude of ascending node + argument of periapsis + mean
+        anomaly, 0 to 2 pi - how far round the orbit the vessel has got,
+        measured from the body's reference direction
+        '''
+        return _out(np.mod(self.longitude_of_ascending_node + self.argument_of_periapsis
+                           + np.asarray(self.mean_anomaly_at(ut)), TWO_PI))
+
+    def true_longitude_at(self, ut):
+        '''
+        the same but with the true anomaly - the direction the vessel
+        actually is in, which the mean longitude only matches on a
+        circular orbit
+        '''
+        return _out(np.mod(self.longitude_of_ascending_node + self.argument_of_periapsis
+                           + np.asarray(self.true_anomaly_at(ut)), TWO_PI))
+
+    def radius_at(self, ut):
+        E = np.asarray(self.eccentric_anomaly_at(ut))
+        return _out(self.semi_major_axis * (1 - self.eccentricity * np.cos(E)))
+
+    def state_at(self, ut):
+        '''
+        (position, velocity) at ut - 3-vectors, or arrays with a last
+        axis of 3 for an array of uts
+        '''
+        E = np.asarray(self.eccentric_anomaly_at(ut))[..., np.newaxis]
+        a, e, b = self.semi_major_axis, self.eccentricity, self.semi_minor_axis
+        cos_e, sin_e = np.cos(E), np.sin(E)
+        position = a * (cos_e - e) * self.P + b * sin_e * self.Q
+        k = math.sqrt(self.mu * a) / (a * (1 - e * cos_e))
+        velocity = -k * sin_e * self.P + k * math.sqrt(1 - e * e) * cos_e * self.Q
+        return position, velocity
+
+    def position_at(self, ut):
+        return self.state_at(ut)[0]
+
+    def velocity_at(self, ut):
+        return self.state_at(ut)[1]
+
+    def ut_at_mean_anomaly(self, M, after):
+        '''
+        the first ut at or after after with mean anomaly M
+        '''
+        return _out(after + np.mod(np.asarray(M, dtype=float) - self.mean_anomaly_at(after), TWO_PI)
+                    / self.n)
+
+    def ut_at_true_anomaly(self, nu, after):
+        '''
+        the first ut at or after after with true anomaly nu
+        '''
+        e = self.eccentricity
+        nu = np.asarray(nu, dtype=float)
+        E = np.arctan2(math.sqrt(1 - e * e) * np.sin(nu), e + np.cos(nu))
+        return self.ut_at_mean_anomaly(E - e * np.sin(E), after)
+
+
+def closest_approaches(orbit, other, ut, revolutions=1, samples=360, tolerance=.01):
+    '''
+    Every local minimum of the distance between two KeplerOrbits around
+    the same body over the next revolutions orbits (of whichever of the
+    two takes longer) from ut, as a list
+    of Approach(ut, distance) sorted nearest first.  Both are sampled
+    samples times a revolution in one go, then all the minima are
+    narrowed down together by golden section search to within tolerance
+    seconds.  If they're moving apart at ut that counts as an approach
+    too (at ut), as it does for kRPC's time_of_closest_approach.
+    '''
+    period = max(orbit.period, other.period)
+    uts = np.linspace(ut, ut + revolutions * period, int(revolutions * samples) + 1)
+    distance = np.linalg.norm(orbit.position_at(uts) - other.position_at(uts), axis=1)
+    k = np.flatnonzero((distance[1:-1] <= distance[:-2]) & (distance[1:-1] < distance[2:])) + 1
+
+    lo, hi = uts[k - 1], uts[k + 1]
+    separation = lambda t: np.linalg.norm(orbit.position_at(t) - other.position_at(t), axis=-1)
+    while len(k) and np.max(hi - lo) > tolerance:
+        a = hi - GOLDEN * (hi - lo)
+        b = lo + GOLDEN * (hi - lo)
+        closer = separation(a) < separation(b)
+        hi = np.where(closer, b, hi)
+        lo = np.where(closer, lo, a)
+    best = (lo + hi) / 2
+    approaches = [Approach(float(t), float(d)) for t, d in zip(best, np.atleast_1d(separation(best)))]
+    if distance[1] > distance[0]:
+        approaches.append(Approach(float(ut), float(distance[0])))
+    return sorted(approaches, key=lambda approach: approach.distance)
+
+
+##############################################################################
+## Main  -- only run when we execute this file directly.  Works out the
+##          active vessel's position over the next orbit both ways and
+##          compares the time taken.
+##############################################################################
+def main():
+    import krpc
+
+    conn = krpc.connect(name='Kepler Orbit')
+    sc = conn.space_center
+    vessel = sc.active_vessel
+    rf = vessel.orbit.body.non_rotating_reference_frame
+    orbit = KeplerOrbit.from_orbit(vessel.orbit)
+    now = sc.ut
+    uts = np.linspace(now, now + orbit.period, 100)
+
+    start = time.time()
+    remote = np.array([vessel.orbit.position_at(ut, rf) for ut in uts])
+    over_rpc = time.time() - start
+    start = time.time()
+    local = orbit.position_at(uts)
+    here = time.time() - start
+    print('{} positions: {:.0f}ms over RPC, {:.2f}ms locally, {:.2f}m apart at most'.format(
+        len(uts), over_rpc * 1000, here * 1000, np.linalg.norm(remote - local, axis=1).max()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,2268 @@
+######################################################################
+### Local kRPC Stand-in Server and Benchmark Harness
+######################################################################
+###   Like all of the scripts in my folder here, this file contains
+###   functions you might want to include into your own scripts for
+###   actual use and a demo in the 'main' function that you can just
+###   run to see how it works.
+###
+###   Every other script in this folder needs a running copy of KSP
+###   with the kRPC server installed.  This file fakes just enough of
+###   the krpc.connect() surface (SpaceCenter, Vessel, Flight, Orbit,
+###   Control, AutoPilot, maneuver nodes, the UI service, streams and
+###   server-side expression events)
+###   to let the demos run on a machine without the game.  Behind it
+###   sits a very simple point mass physics simulation - central
+###   gravity, an exponential atmosphere, staged rocket engines, RCS
+###   translation, rover wheels and an analytic terrain function.
+###
+###   Every remote procedure call goes through SimConnection._invoke,
+###   which sleeps for a configurable latency and counts the call, so
+###   the number of round trips a control loop makes - and how long it
+###   takes on a slow link - can be measured on a CI box.
+###
+###   Use it in one of two ways:
+###
+###       conn = krpc_sim.connect(scenario='landing', latency=0.002)
+###
+###   or, for scripts that call krpc.connect() themselves:
+###
+###       krpc_sim.install(scenario='launch')
+###       import pid
+###       pid.main()
+###
+###   Running this file benchmarks the demos in this folder against
+###   the simulator and prints a table of RPC counts and timings.
+######################################################################
+
+import argparse
+import collections
+import math
+import sys
+import threading
+import time
+
+_clock = getattr(time, 'monotonic', time.time)
+
+G0 = 9.80665  # standard gravity, used for Isp and g-force
+
+FUEL_DENSITY = {'LiquidFuel': 5.0, 'SolidFuel': 7.5}   # kg per unit
+
+RAILS_WARP_RATES = (1, 5, 10, 50, 100, 1000, 10000, 100000)
+PHYSICS_WARP_RATES = (1, 2, 3, 4)
+
+
+class RPCError(RuntimeError):
+    '''
+    Raised for calls the real server would reject, such as using a
+    maneuver node after it has been removed.
+    '''
+    pass
+
+
+class SimulationStopped(Exception):
+    '''
+    Raised from the next remote call or stream read once a connection's
+    time limit has run out.  Lets a benchmark stop demos that loop
+    forever.
+    '''
+    pass
+
+
+##############################################################################
+##  Vector Math  -  plain tuples, so the simulator needs nothing but the
+##                  standard library.
+##############################################################################
+
+def v_add(a, b):
+    return (a[0] + b[0], a[1] + b[1], a[2] + b[2])
+
+def v_sub(a, b):
+    return (a[0] - b[0], a[1] - b[1], a[2] - b[2])
+
+def v_scale(a, s):
+    return (a[0] * s, a[1] * s, a[2] * s)
+
+def v_dot(a, b):
+    return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
+
+def v_cross(a, b):
+    return (a[1] * b[2] - a[2] * b[1],
+            a[2] * b[0] - a[0] * b[2],
+            a[0] * b[1] - a[1] * b[0])
+
+def v_norm(a):
+    return math.sqrt(v_dot(a, a))
+
+def v_unit(a):
+    n = v_norm(a)
+    if n == 0.0:
+        return (0.0, 0.0, 0.0)
+    return v_scale(a, 1.0 / n)
+
+def v_perpendicular(a):
+    '''
+    returns a unit vector perpendicular to a
+    '''
+    other = (1.0, 0.0, 0.0) if abs(a[0]) < 0.9 else (0.0, 1.0, 0.0)
+    return v_unit(v_cross(a, other))
+
+def clamp_2pi(x):
+    return x % (2 * math.pi)
+
+
+##############################################################################
+##  Enumerations  -  members can reach their siblings, so scripts can write
+##                   ap.sas_mode = ap.sas_mode.retrograde like with kRPC.
+##############################################################################
+
+class _SimEnum(object):
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return '{}.{}'.format(type(self).__name__, self.name)
+
+def _make_enum(class_name, names):
+    cls = type(class_name, (_SimEnum,), {})
+    for name in names:
+        setattr(cls, name, cls(name))
+    return cls
+
+VesselSituation = _make_enum('VesselSituation', (
+    'pre_launch', 'orbiting', 'sub_orbital', 'escaping',
+    'flying', 'landed', 'splashed', 'docked'))
+SASMode = _make_enum('SASMode', (
+    'stability_assist', 'maneuver', 'prograde', 'retrograde', 'normal',
+    'anti_normal', 'radial', 'anti_radial', 'target', 'anti_target'))
+SpeedMode = _make_enum('SpeedMode', ('orbit', 'surface', 'target'))
+
+
+##############################################################################
+##  Physics Model
+##############################################################################
+
+class SimBody(object):
+    '''
+    A non-rotating spherical body.  Terrain is an analytic function of
+    latitude and longitude so it is smooth, repeatable and costs nothing.
+    '''
+    def __init__(self, name, radius, mu, atmosphere_depth=0.0,
+                 sea_level_density=0.0, scale_height=5600.0,
+                 terrain_base=0.0, terrain_amplitude=0.0):
+        self.name = name
+        self.radius = radius
+        self.mu = mu
+        self.atmosphere_depth = atmosphere_depth
+        self.sea_level_density = sea_level_density
+        self.scale_height = scale_height
+        self.terrain_base = terrain_base
+        self.terrain_amplitude = terrain_amplitude
+
+    @property
+    def surface_gravity(self):
+        return self.mu / (self.radius * self.radius)
+
+    def surface_height(self, lat, lon):
+        lat = math.radians(lat)
+        lon = math.radians(lon)
+        shape = (math.sin(3 * lat + 1.3) * math.cos(2 * lon)
+                 + 0.5 * math.sin(7 * lon + 0.4) * math.cos(5 * lat)
+                 + 0.25 * math.sin(23 * lat) * math.sin(19 * lon + 2.1))
+        return self.terrain_base + self.terrain_amplitude * (1.0 + shape / 1.75)
+
+    def density(self, altitude):
+        if altitude >= self.atmosphere_depth or not self.sea_level_density:
+            return 0.0
+        return self.sea_level_density * math.exp(-altitude / self.scale_height)
+
+    def position_at(self, lat, lon, altitude):
+        '''
+        body centred position of a lat/lon in degrees.  y is the north
+        pole and longitude increases towards -z, so eastward equatorial
+        orbits have an angular momentum along +y.
+        '''
+        lat = math.radians(lat)
+        lon = math.radians(lon)
+        r = self.radius + altitude
+        return (r * math.cos(lat) * math.cos(lon),
+                r * math.sin(lat),
+                -r * math.cos(lat) * math.sin(lon))
+
+    def lat_lon(self, position):
+        r = v_norm(position)
+        lat = math.degrees(math.asin(max(-1.0, min(1.0, position[1] / r))))
+        lon = math.degrees(math.atan2(-position[2], position[0]))
+        return lat, lon
+
+
+def surface_axes(position):
+    '''
+    returns the (up, north, east) unit vectors at a position
+    '''
+    up = v_unit(position)
+    north = v_sub((0.0, 1.0, 0.0), v_scale(up, up[1]))
+    if v_norm(north) < 1e-9:
+        north = (1.0, 0.0, 0.0)
+    north = v_unit(north)
+    east = v_cross(north, up)
+    return up, north, east
+
+
+class Elements(object):
+    '''
+    Keplerian elements of a state vector, valid for elliptical orbits.
+    Used by the Orbit proxy for all of the "at time" questions.
+    '''
+    def __init__(self, position, velocity, mu, ut):
+        self.mu = mu
+        self.epoch = ut
+        r = v_norm(position)
+        speed2 = v_dot(velocity, velocity)
+        h = v_cross(position, velocity)
+        self.h = h
+        energy = speed2 / 2.0 - mu / r
+        self.a = -mu / (2.0 * energy) if energy != 0.0 else float('inf')
+        e_vec = v_sub(v_scale(v_cross(velocity, h), 1.0 / mu),
+                      v_scale(position, 1.0 / r))
+        self.e = v_norm(e_vec)
+        if energy < 0:
+            # a vessel going straight up is on a degenerate ellipse
+            self.e = min(self.e, 1.0 - 1e-9)
+        hn = v_norm(h)
+        self.inclination = math.acos(max(-1.0, min(1.0, h[1] / hn))) if hn else 0.0
+        node = v_cross((0.0, 1.0, 0.0), h)
+        if v_norm(node) < 1e-9 * max(hn, 1.0):
+            node = (1.0, 0.0, 0.0)
+        node = v_unit(node)
+        self.lan = clamp_2pi(math.atan2(-node[2], node[0]))
+        if self.e > 1e-9:
+            P = v_unit(e_vec)
+        else:
+            P = node
+        W = v_unit(h) if hn else v_perpendicular(P)
+        self.P = P
+        self.Q = v_cross(W, P)
+        self.W = W
+        arg = math.atan2(v_dot(v_cross(node, P), W), v_dot(node, P))
+        self.argument_of_periapsis = clamp_2pi(arg)
+        nu = math.atan2(v_dot(position, self.Q), v_dot(position, P))
+        self.true_anomaly = nu
+        if self.elliptical:
+            self.n = math.sqrt(mu / self.a ** 3)
+            self.mean_anomaly = clamp_2pi(self.mean_from_true(nu))
+        else:
+            self.n = 0.0
+            self.mean_anomaly = 0.0
+
+    @property
+    def elliptical(self):
+        return self.e < 1.0 and self.a > 0.0
+
+    @property
+    def period(self):
+        if not self.elliptical:
+            return float('inf')
+        return 2 * math.pi / self.n
+
+    def mean_from_true(self, nu):
+        e = self.e
+        E = math.atan2(math.sqrt(1 - e * e) * math.sin(nu), e + math.cos(nu))
+        return E - e * math.sin(E)
+
+    def eccentric_from_mean(self, M):
+        e = self.e
+        M = clamp_2pi(M)
+        E = M if e < 0.8 else math.pi
+        for _ in range(50):
+            delta = (E - e * math.sin(E) - M) / (1 - e * math.cos(E))
+            E -= delta
+            if abs(delta) < 1e-12:
+                break
+        return E
+
+    def state_at(self, ut):
+        '''
+        position and velocity at ut, by solving Kepler's equation
+        '''
+        E = self.eccentric_from_mean(self.mean_anomaly + self.n * (ut - self.epoch))
+        a, e = self.a, self.e
+        b = a * math.sqrt(1 - e * e)
+        cos_e, sin_e = math.cos(E), math.sin(E)
+        r = a * (1 - e * cos_e)
+        pos = v_add(v_scale(self.P, a * (cos_e - e)), v_scale(self.Q, b * sin_e))
+        k = math.sqrt(self.mu * a) / r
+        vel = v_add(v_scale(self.P, -k * sin_e),
+                    v_scale(self.Q, k * math.sqrt(1 - e * e) * cos_e))
+        return pos, vel
+
+    def time_to_mean_anomaly(self, M):
+        return clamp_2pi(M - self.mean_anomaly) / self.n
+
+    def radius_at_true_anomaly(self, nu):
+        return self.a * (1 - self.e ** 2) / (1 + self.e * math.cos(nu))
+
+
+class SimStage(object):
+    '''
+    One stage of a simple rocket.  The engine (if any) ignites when
+    activation_stage is activated and drinks only from its own tank;
+    the whole stage falls off when decouple_stage is activated.
+    '''
+    def __init__(self, name, activation_stage, decouple_stage, dry_mass,
+                 fuel_mass=0.0, thrust=0.0, isp=0.0, fuel_type='LiquidFuel',
+                 parachute=False):
+        self.name = name
+        self.activation_stage = activation_stage
+        self.decouple_stage = decouple_stage
+        self.dry_mass = dry_mass
+        self.fuel_capacity = fuel_mass
+        self.fuel_mass = fuel_mass
+        self.thrust = thrust
+        self.isp = isp
+        self.fuel_type = fuel_type
+        self.parachute = parachute
+
+
+class SimVessel(object):
+    def __init__(self, sim, name, body, position, velocity, stages=(),
+                 rcs_thrust=0.0, cd_area=0.0, electric_charge=0.0,
+                 wheel_acceleration=0.0, landed=False, direction=None):
+        self.sim = sim
+        self.name = name
+        self.body = body
+        self.position = position
+        self.velocity = velocity
+        self.stages = list(stages)
+        self.rcs_thrust = rcs_thrust
+        self.cd_area = cd_area
+        self.max_charge = electric_charge
+        self.charge = electric_charge
+        self.wheel_acceleration = wheel_acceleration
+        self.landed = landed
+        self.pre_launch = landed and any(s.thrust for s in self.stages)
+        # sitting on the pad nothing is lit yet, anywhere else the engines are
+        if self.pre_launch:
+            self.current_stage = max(s.activation_stage for s in self.stages) + 1
+        else:
+            self.current_stage = 0
+        self.docked_to = None
+        self.impact_speed = 0.0
+        self.direction = direction or v_unit(position)
+        self.roll_reference = None   # None keeps the vessel's bottom towards the ground
+        self.last_acceleration = (0.0, 0.0, 0.0)
+        self.nodes = []
+        self.docking_port = None
+        # control state
+        self.throttle = 0.0
+        self.translation = [0.0, 0.0, 0.0]   # right, forward, up
+        self.wheel_throttle = 0.0
+        self.wheel_steering = 0.0
+        self.brakes = False
+        self.solar_panels = False
+        self.rcs = False
+        self.speed_mode = SpeedMode.orbit
+        # autopilot / SAS state
+        self.sas = False
+        self.sas_mode = SASMode.stability_assist
+        self.ap_engaged = False
+        self.ap_reference_frame = None
+        self.ap_target_direction = None
+        self.ap_target_pitch = 0.0
+        self.ap_target_heading = 0.0
+        self.ap_target_roll = float('nan')
+
+    # -- mass and propulsion -------------------------------------------------
+    def attached_stages(self):
+        return [s for s in self.stages if s.decouple_stage < self.current_stage]
+
+    def active_engines(self):
+        return [s for s in self.attached_stages()
+                if s.thrust > 0 and s.activation_stage >= self.current_stage]
+
+    @property
+    def mass(self):
+        return sum(s.dry_mass + s.fuel_mass for s in self.attached_stages())
+
+    def available_thrust(self):
+        return sum(s.thrust for s in self.active_engines() if s.fuel_mass > 0)
+
+    def engine_throttle(self, stage):
+        if stage.fuel_type == 'SolidFuel':
+            return 1.0
+        return self.throttle
+
+    def current_thrust(self):
+        return sum(s.thrust * self.engine_throttle(s)
+                   for s in self.active_engines() if s.fuel_mass > 0)
+
+    def specific_impulse(self):
+        engines = [s for s in self.active_engines() if s.fuel_mass > 0]
+        thrust = sum(s.thrust for s in engines)
+        if not thrust:
+            return 0.0
+        return thrust / sum(s.thrust / s.isp for s in engines)
+
+    def activate_next_stage(self):
+        if self.current_stage <= 0:
+            return
+        self.current_stage -= 1
+
+    # -- attitude --------------------------------------------------------------
+    def vessel_axes(self):
+        '''
+        returns (right, forward, down) unit vectors of the vessel frame
+        '''
+        forward = self.direction
+        reference = self.roll_reference or v_scale(v_unit(self.position), -1)
+        down = v_sub(reference, v_scale(forward, v_dot(reference, forward)))
+        if v_norm(down) < 1e-6:
+            down = v_perpendicular(forward)
+        down = v_unit(down)
+        return v_cross(forward, down), forward, down
+
+    def update_attitude(self):
+        sim = self.sim
+        if self.ap_engaged:
+            if self.ap_target_direction is not None:
+                frame = self.ap_reference_frame or sim.surface_frame(self)
+                d = frame.direction_to_inertial(sim, self.ap_target_direction)
+            else:
+                up, north, east = surface_axes(self.position)
+                p = math.radians(self.ap_target_pitch)
+                h = math.radians(self.ap_target_heading)
+                d = v_add(v_scale(up, math.sin(p)),
+                          v_scale(v_add(v_scale(north, math.cos(h)),
+                                        v_scale(east, math.sin(h))),
+                                  math.cos(p)))
+            if v_norm(d) > 0:
+                self.direction = v_unit(d)
+            return
+        if not self.sas:
+            return
+        mode = self.sas_mode
+        d = None
+        if mode in (SASMode.prograde, SASMode.retrograde):
+            velocity = self.velocity
+            if self.speed_mode is SpeedMode.target and sim.target_vessel:
+                velocity = v_sub(velocity, sim.target_vessel.velocity)
+            if v_norm(velocity) > 1e-3:
+                d = velocity if mode is SASMode.prograde else v_scale(velocity, -1)
+        elif mode is SASMode.maneuver and self.nodes:
+            d = self.nodes[0].remaining_vector()
+        elif mode in (SASMode.normal, SASMode.anti_normal):
+            d = v_cross(self.position, self.velocity)
+            if mode is SASMode.anti_normal:
+                d = v_scale(d, -1)
+        elif mode in (SASMode.radial, SASMode.anti_radial):
+            d = self.position if mode is SASMode.radial else v_scale(self.position, -1)
+        elif mode in (SASMode.target, SASMode.anti_target) and sim.target_vessel:
+            d = v_sub(sim.target_vessel.position, self.position)
+            if mode is SASMode.anti_target:
+                d = v_scale(d, -1)
+        if d is not None and v_norm(d) > 0:
+            self.direction = v_unit(d)
+
+    # -- integration ------------------------------------------------------------
+    def altitude(self):
+        return v_norm(self.position) - self.body.radius
+
+    def terrain_height(self):
+        lat, lon = self.body.lat_lon(self.position)
+        return self.body.surface_height(lat, lon)
+
+    def coasting(self):
+        return (not self.landed and self.docked_to is None
+                and (self.current_thrust() == 0.0 or self.sim.on_rails)
+                and not any(self.translation)
+                and self.altitude() > max(self.body.atmosphere_depth, 20000.0))
+
+    def gravity(self, position):
+        r = v_norm(position)
+        return v_scale(position, -self.body.mu / (r * r * r))
+
+    def step(self, dt):
+        if self.docked_to is not None:
+            self.position = self.docked_to.position
+            self.velocity = self.docked_to.velocity
+            return
+        if self.landed:
+            self.step_landed(dt)
+            return
+        self.update_attitude()
+        accel = (0.0, 0.0, 0.0)
+        mass = self.mass
+        thrust = 0.0 if self.sim.on_rails else self.current_thrust()
+        if thrust:
+            accel = v_add(accel, v_scale(self.direction, thrust / mass))
+            self.burn_fuel(dt)
+            for node in self.nodes[:1]:
+                node.freeze()
+        if self.rcs_thrust and any(self.translation) and not self.sim.on_rails:
+            right, forward, down = self.vessel_axes()
+            t = self.translation
+            push = v_add(v_add(v_scale(right, t[0]), v_scale(forward, t[1])),
+                         v_scale(down, -t[2]))
+            accel = v_add(accel, v_scale(push, self.rcs_thrust / mass))
+        rho = self.body.density(self.altitude())
+        speed = v_norm(self.velocity)
+        if rho and speed and self.cd_area:
+            drag = 0.5 * rho * speed * speed * self.cd_area / mass
+            accel = v_add(accel, v_scale(self.velocity, -drag / speed))
+        self.last_acceleration = accel
+        # semi implicit Euler, plenty for a 50Hz point mass
+        self.velocity = v_add(self.velocity,
+                              v_scale(v_add(accel, self.gravity(self.position)), dt))
+        self.position = v_add(self.position, v_scale(self.velocity, dt))
+        self.check_ground()
+
+    def coast(self, dt):
+        '''
+        fourth order Runge-Kutta step for unpowered flight
+        '''
+        r, v = self.position, self.velocity
+        k1v = self.gravity(r)
+        k1r = v
+        k2v = self.gravity(v_add(r, v_scale(k1r, dt / 2)))
+        k2r = v_add(v, v_scale(k1v, dt / 2))
+        k3v = self.gravity(v_add(r, v_scale(k2r, dt / 2)))
+        k3r = v_add(v, v_scale(k2v, dt / 2))
+        k4v = self.gravity(v_add(r, v_scale(k3r, dt)))
+        k4r = v_add(v, v_scale(k3v, dt))
+        self.position = v_add(r, v_scale(v_add(v_add(k1r, v_scale(k2r, 2)),
+                                               v_add(v_scale(k3r, 2), k4r)), dt / 6))
+        self.velocity = v_add(v, v_scale(v_add(v_add(k1v, v_scale(k2v, 2)),
+                                               v_add(v_scale(k3v, 2), k4v)), dt / 6))
+        self.last_acceleration = (0.0, 0.0, 0.0)
+        self.update_attitude()
+
+    def burn_fuel(self, dt):
+        for s in self.active_engines():
+            if s.fuel_mass <= 0:
+                continue
+            flow = s.thrust * self.engine_throttle(s) / (s.isp * G0)
+            s.fuel_mass = max(0.0, s.fuel_mass - flow * dt)
+
+    def check_ground(self):
+        height = self.terrain_height()
+        if self.altitude() > height:
+            return
+        up = v_unit(self.position)
+        self.impact_speed = v_norm(self.velocity)
+        self.position = v_scale(up, self.body.radius + height)
+        self.velocity = (0.0, 0.0, 0.0)
+        self.landed = True
+
+    def step_landed(self, dt):
+        self.update_attitude()
+        up, north, east = surface_axes(self.position)
+        thrust = self.current_thrust()
+        if thrust:
+            self.burn_fuel(dt)
+            lift = v_dot(self.direction, up) * thrust / self.mass
+            if lift > self.body.surface_gravity:
+                self.landed = False
+                self.pre_launch = False
+                self.velocity = v_scale(self.direction, (lift - self.body.surface_gravity) * dt)
+                self.position = v_add(self.position, v_scale(up, 0.1))
+                return
+        if self.solar_panels and self.max_charge:
+            self.charge = min(self.max_charge, self.charge + 5.0 * dt)
+        if not self.wheel_acceleration:
+            return
+        # rover: drive along the nose direction flattened onto the surface
+        heading = math.atan2(v_dot(self.direction, east), v_dot(self.direction, north))
+        speed = v_dot(self.velocity, v_add(v_scale(north, math.cos(heading)),
+                                           v_scale(east, math.sin(heading))))
+        throttle = self.wheel_throttle if self.charge > 0 else 0.0
+        accel = throttle * self.wheel_acceleration - 0.05 * speed
+        if self.brakes:
+            accel -= math.copysign(min(abs(speed) / dt, 4.0), speed)
+        speed += accel * dt
+        if abs(speed) < 1e-3 and not throttle:
+            speed = 0.0
+        heading -= self.wheel_steering * 0.02 * speed * dt
+        if self.max_charge:
+            self.charge = max(0.0, self.charge - abs(throttle) * 0.5 * dt)
+        forward = v_add(v_scale(north, math.cos(heading)), v_scale(east, math.sin(heading)))
+        self.direction = forward
+        self.velocity = v_scale(forward, speed)
+        moved = v_add(self.position, v_scale(self.velocity, dt))
+        lat, lon = self.body.lat_lon(moved)
+        self.position = self.body.position_at(lat, lon, self.body.surface_height(lat, lon))
+
+    def situation(self):
+        if self.docked_to is not None:
+            return VesselSituation.docked
+        if self.landed:
+            return VesselSituation.pre_launch if self.pre_launch else VesselSituation.landed
+        if self.altitude() < self.body.atmosphere_depth:
+            return VesselSituation.flying
+        el = Elements(self.position, self.velocity, self.body.mu, self.sim.ut)
+        if not el.elliptical:
+            return VesselSituation.escaping
+        if el.a * (1 - el.e) < self.body.radius + self.body.atmosphere_depth:
+            return VesselSituation.sub_orbital
+        return VesselSituation.orbiting
+
+    def elements(self):
+        return Elements(self.position, self.velocity, self.body.mu, self.sim.ut)
+
+    def state_at(self, ut):
+        el = self.elements()
+        if el.elliptical:
+            return el.state_at(ut)
+        return self.position, self.velocity
+
+
+class SimNode(object):
+    '''
+    A maneuver node.  Once the vessel starts burning on it, the orbit the
+    node asks for is fixed, and "remaining" is the difference between the
+    velocity on that orbit and the vessel's velocity - as in KSP.
+    '''
+    def __init__(self, vessel, ut, prograde=0.0, normal=0.0, radial=0.0):
+        self.vessel = vessel
+        self.ut = ut
+        self.prograde = prograde
+        self.normal = normal
+        self.radial = radial
+        self.frozen = None
+        self.removed = False
+
+    @property
+    def delta_v(self):
+        return math.sqrt(self.prograde ** 2 + self.normal ** 2 + self.radial ** 2)
+
+    def burn_vector(self):
+        pos, vel = self.vessel.state_at(self.ut)
+        prograde = v_unit(vel)
+        normal = v_unit(v_cross(pos, vel))
+        radial = v_cross(prograde, normal)
+        return v_add(v_add(v_scale(prograde, self.prograde),
+                           v_scale(normal, self.normal)),
+                     v_scale(radial, self.radial))
+
+    def freeze(self):
+        if self.frozen is None:
+            pos, vel = self.vessel.state_at(self.ut)
+            burn = self.burn_vector()
+            self.frozen = (burn, self.vessel.velocity,
+                           Elements(pos, v_add(vel, burn), self.vessel.body.mu, self.ut))
+
+    def remaining_vector(self):
+        if self.frozen is None:
+            return self.burn_vector()
+        burn, start_velocity, planned = self.frozen
+        if planned.elliptical:
+            return v_sub(planned.state_at(self.vessel.sim.ut)[1], self.vessel.velocity)
+        return v_sub(burn, v_sub(self.vessel.velocity, start_velocity))
+
+
+##############################################################################
+##  Reference Frames  -  evaluated against the simulation whenever used, so
+##                       a frame attached to a vessel moves with it.
+##############################################################################
+
+class SimFrame(object):
+    def __init__(self, kind, owner=None, position=None, rotation=None, velocity=None):
+        self.kind = kind
+        self.owner = owner
+        self.position_frame = position
+        self.rotation_frame = rotation
+        self.velocity_frame = velocity
+
+    def origin(self, sim):
+        '''
+        returns (position, velocity) of the frame origin in the inertial frame
+        '''
+        if self.kind == 'hybrid':
+            pos = self.position_frame.origin(sim)[0]
+            vel = (self.velocity_frame or self.position_frame).origin(sim)[1]
+            return pos, vel
+        if self.kind == 'body':
+            return (0.0, 0.0, 0.0), (0.0, 0.0, 0.0)
+        if self.kind == 'node':
+            vessel = self.owner.vessel
+            return vessel.position, vessel.velocity
+        if self.kind == 'port':
+            return self.owner.position, self.owner.velocity
+        return self.owner.position, self.owner.velocity
+
+    def axes(self, sim):
+        if self.kind == 'hybrid':
+            return self.rotation_frame.axes(sim)
+        if self.kind == 'body':
+            return (1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 0.0, 1.0)
+        if self.kind == 'surface':
+            return surface_axes(self.owner.position)
+        if self.kind == 'vessel':
+            return self.owner.vessel_axes()
+        if self.kind == 'orbital':
+            prograde = v_unit(self.owner.velocity)
+            if not v_norm(prograde):
+                return surface_axes(self.owner.position)
+            normal = v_unit(v_cross(self.owner.position, self.owner.velocity))
+            return v_cross(normal, prograde), prograde, normal
+        if self.kind == 'node':
+            y = v_unit(self.owner.remaining_vector())
+            if not v_norm(y):
+                y = (0.0, 1.0, 0.0)
+            x = v_perpendicular(y)
+            return x, y, v_cross(x, y)
+        if self.kind == 'port':
+            return self.owner.docking_port
+        raise RPCError('unknown reference frame')
+
+    def to_frame(self, vector, axes):
+        return (v_dot(vector, axes[0]), v_dot(vector, axes[1]), v_dot(vector, axes[2]))
+
+    def position_in(self, sim, position):
+        origin = self.origin(sim)[0]
+        return self.to_frame(v_sub(position, origin), self.axes(sim))
+
+    def velocity_in(self, sim, velocity):
+        origin_velocity = self.origin(sim)[1]
+        return self.to_frame(v_sub(velocity, origin_velocity), self.axes(sim))
+
+    def direction_in(self, sim, direction):
+        return self.to_frame(direction, self.axes(sim))
+
+    def direction_to_inertial(self, sim, direction):
+        x, y, z = self.axes(sim)
+        return v_add(v_add(v_scale(x, direction[0]), v_scale(y, direction[1])),
+                     v_scale(z, direction[2]))
+
+    def position_to_inertial(self, sim, position):
+        return v_add(self.origin(sim)[0], self.direction_to_inertial(sim, position))
+
+    def attached_to_vessel(self):
+        return self.kind in ('surface', 'vessel', 'orbital', 'node')
+
+
+class Simulation(object):
+    '''
+    The simulated universe.  Game time runs in step with the wall clock
+    (scaled by time_scale and the current warp rate) and physics is
+    integrated lazily, in fixed steps, whenever a call needs the state.
+    '''
+    physics_dt = 0.02
+    coast_dt = 1.0
+
+    def __init__(self, time_scale=1.0, ut=0.0):
+        self.lock = threading.RLock()
+        self.time_scale = time_scale
+        self.ut = ut
+        self.bodies = {}
+        self.vessels = []
+        self.active_vessel = None
+        self.target_vessel = None
+        self.target_port_vessel = None
+        self.waypoints = []
+        self.saves = []
+        self.rails_warp_factor = 0
+        self.physics_warp_factor = 0
+        self.on_rails = False
+        self.rpc_count = 0
+        self.ui = _UIState()
+        self.ticks = 0
+        self.hold = 0
+        self.pending = 0.0
+        self._wall = _clock()
+
+    def add_body(self, body):
+        self.bodies[body.name] = body
+        return body
+
+    def add_vessel(self, vessel):
+        self.vessels.append(vessel)
+        if self.active_vessel is None:
+            self.active_vessel = vessel
+        return vessel
+
+    def warp_rate(self):
+        if self.rails_warp_factor:
+            return RAILS_WARP_RATES[self.rails_warp_factor]
+        return PHYSICS_WARP_RATES[self.physics_warp_factor]
+
+    def set_warp(self, rails=None, physics=None):
+        with self.lock:
+            self.advance()
+            if rails is not None:
+                self.rails_warp_factor = max(0, min(rails, len(RAILS_WARP_RATES) - 1))
+            if physics is not None:
+                self.physics_warp_factor = max(0, min(physics, len(PHYSICS_WARP_RATES) - 1))
+
+    def advance(self):
+        '''
+        bring the simulation up to the current wall clock time.  Time moves
+        in whole physics ticks, like the game.  While a client holds the
+        stream update lock the clock is frozen, and the time that passes
+        is caught up once it lets go.
+        '''
+        with self.lock:
+            if self.hold:
+                return
+            now = _clock()
+            self.pending += (now - self._wall) * self.time_scale * self.warp_rate()
+            self._wall = now
+            self.on_rails = self.rails_warp_factor > 0
+            start = self.ut
+            self.integrate_to(self.ut + self.pending)
+            self.pending -= self.ut - start
+            self.on_rails = False
+
+    def integrate_to(self, target, partial=False):
+        '''
+        step up to target - in whole ticks, unless partial is set
+        '''
+        while target - self.ut >= self.physics_dt - 1e-9 or (partial and self.ut < target):
+            if (target - self.ut >= self.coast_dt
+                    and all(v.coasting() for v in self.vessels)):
+                dt = self.coast_dt
+                for v in self.vessels:
+                    v.coast(dt)
+            else:
+                dt = min(self.physics_dt, target - self.ut)
+                for v in self.vessels:
+                    v.step(dt)
+            self.ut += dt
+            self.ticks += 1
+            self.check_docking()
+
+    def warp_to(self, ut):
+        with self.lock:
+            self.advance()
+            if ut <= self.ut:
+                return
+            self.on_rails = True
+            self.integrate_to(ut, partial=True)
+            self.on_rails = False
+            self.pending = 0.0
+            self._wall = _clock()
+
+    def check_docking(self):
+        chaser = self.active_vessel
+        target = self.target_port_vessel
+        if (target is None or chaser is target or chaser.docked_to is not None
+                or target.docking_port is None):
+            return
+        offset = v_sub(chaser.position, target.position)
+        port_y = target.docking_port[1]
+        along = v_dot(offset, port_y)
+        lateral = v_norm(v_sub(offset, v_scale(port_y, along)))
+        if 0 <= along < 0.5 and lateral < 0.3:
+            chaser.docked_to = target
+
+    def surface_frame(self, vessel):
+        return SimFrame('surface', vessel)
+
+
+##############################################################################
+##  Scenarios  -  starting states for the demos in this folder.
+##############################################################################
+
+def kerbin():
+    return SimBody('Kerbin', 600000.0, 3.5316e12, atmosphere_depth=70000.0,
+                   sea_level_density=1.225, scale_height=5600.0,
+                   terrain_base=0.0, terrain_amplitude=150.0)
+
+def mun():
+    return SimBody('Mun', 200000.0, 6.5138398e10, terrain_amplitude=3000.0)
+
+def circular_state(body, altitude, lon=0.0, inclination=0.0):
+    '''
+    state vector of an eastward circular orbit, starting over the equator
+    at the given longitude
+    '''
+    position = body.position_at(0.0, lon, altitude)
+    up, north, east = surface_axes(position)
+    speed = math.sqrt(body.mu / v_norm(position))
+    inc = math.radians(inclination)
+    velocity = v_scale(v_add(v_scale(east, math.cos(inc)), v_scale(north, math.sin(inc))), speed)
+    return position, velocity
+
+def _launch_scenario(sim):
+    body = sim.add_body(kerbin())
+    pad = body.position_at(-0.0972, -74.5577, body.surface_height(-0.0972, -74.5577))
+    stages = [SimStage('payload', 0, -1, 1000.0),
+              SimStage('upper', 0, -1, 1500.0, 4000.0, 60000.0, 345.0),
+              SimStage('booster', 1, 0, 3000.0, 16000.0, 300000.0, 300.0)]
+    sim.add_vessel(SimVessel(sim, 'Launcher', body, pad, (0.0, 0.0, 0.0), stages,
+                             cd_area=0.6, electric_charge=200.0, landed=True))
+
+def _orbit_scenario(sim):
+    body = sim.add_body(kerbin())
+    pos, vel = circular_state(body, 100000.0)
+    stages = [SimStage('payload', 0, -1, 1000.0),
+              SimStage('transfer', 0, -1, 2000.0, 2000.0, 60000.0, 345.0)]
+    sim.add_vessel(SimVessel(sim, 'Orbiter', body, pos, vel, stages,
+                             rcs_thrust=2000.0, electric_charge=200.0,
+                             direction=v_unit(vel)))
+
+def _landing_scenario(sim):
+    body = sim.add_body(mun())
+    pos, vel = circular_state(body, 30000.0, lon=-20.0)
+    stages = [SimStage('lander', 0, -1, 1500.0, 2000.0, 60000.0, 320.0)]
+    sim.add_vessel(SimVessel(sim, 'Lander', body, pos, vel, stages,
+                             electric_charge=200.0, direction=v_unit(vel)))
+
+def _rover_scenario(sim):
+    body = sim.add_body(kerbin())
+    start = body.position_at(0.0, -74.56, body.surface_height(0.0, -74.56))
+    up, north, east = surface_axes(start)
+    sim.add_vessel(SimVessel(sim, 'Rover', body, start, (0.0, 0.0, 0.0),
+                             [SimStage('chassis', 0, -1, 1000.0)],
+                             electric_charge=500.0, wheel_acceleration=1.0,
+                             landed=True, direction=north))
+
+def _rendezvous_scenario(sim):
+    body = sim.add_body(kerbin())
+    pos, vel = circular_state(body, 100000.0)
+    stages = [SimStage('payload', 0, -1, 1000.0),
+              SimStage('transfer', 0, -1, 2000.0, 3000.0, 60000.0, 345.0)]
+    chaser = sim.add_vessel(SimVessel(sim, 'Chaser', body, pos, vel, stages,
+                                      rcs_thrust=2000.0, electric_charge=200.0,
+                                      direction=v_unit(vel)))
+    pos, vel = circular_state(body, 120000.0, lon=60.0, inclination=1.0)
+    target = sim.add_vessel(SimVessel(sim, 'Station', body, pos, vel,
+                                      [SimStage('station', 0, -1, 20000.0)]))
+    sim.active_vessel = chaser
+    sim.target_vessel = target
+
+def _docking_scenario(sim):
+    body = sim.add_body(kerbin())
+    pos, vel = circular_state(body, 100000.0)
+    target = SimVessel(sim, 'Station', body, pos, vel,
+                       [SimStage('station', 0, -1, 20000.0)])
+    # port faces north, out of the orbit plane, so relative drift is slow
+    target.docking_port = ((1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 0.0, 1.0))
+    offset = (2.0, 30.0, 1.5)
+    chaser = SimVessel(sim, 'Ferry', body, v_add(pos, offset), vel,
+                       [SimStage('ferry', 0, -1, 3000.0, 500.0, 20000.0, 300.0)],
+                       rcs_thrust=2000.0, electric_charge=200.0,
+                       direction=(0.0, -1.0, 0.0))
+    chaser.roll_reference = (0.0, 0.0, 1.0)
+    sim.add_vessel(chaser)
+    sim.add_vessel(target)
+    sim.target_vessel = target
+    sim.target_port_vessel = target
+
+SCENARIOS = {
+    'launch': _launch_scenario,
+    'orbit': _orbit_scenario,
+    'landing': _landing_scenario,
+    'rover': _rover_scenario,
+    'rendezvous': _rendezvous_scenario,
+    'docking': _docking_scenario,
+}
+
+def create_simulation(scenario='orbit', time_scale=1.0):
+    '''
+    returns a new Simulation set up with one of the SCENARIOS
+    '''
+    sim = Simulation(time_scale=time_scale)
+    SCENARIOS[scenario](sim)
+    return sim
+
+
+##############################################################################
+##  Remote Object Proxies
+##
+##  Each attribute declared with _Remote becomes a property (or method)
+##  that goes through the connection, and so costs one round trip, just
+##  like the generated classes in the real krpc client.
+##############################################################################
+
+class _Remote(object):
+    def __init__(self, getter, setter=None, method=False):
+        self.getter = getter
+        self.setter = setter
+        self.method = method
+
+    def build(self, cls, attr):
+        service = cls._service
+        camel = ''.join(part.capitalize() for part in attr.split('_'))
+        getter, setter = self.getter, self.setter
+        if self.method:
+            procedure = '{}_{}'.format(cls.__name__, camel)
+            def call(proxy, *args, **kwargs):
+                return proxy._conn._call(service, procedure, getter, proxy, *args, **kwargs)
+            call.__name__ = attr
+            return call
+        get_procedure = '{}_get_{}'.format(cls.__name__, camel)
+        set_procedure = '{}_set_{}'.format(cls.__name__, camel)
+        def fget(proxy):
+            return proxy._conn._call(service, get_procedure, getter, proxy)
+        fset = None
+        if setter is not None:
+            def fset(proxy, value):
+                proxy._conn._call(service, set_procedure, setter, proxy, value)
+        return property(fget, fset)
+
+def _remote_method(impl):
+    return _Remote(impl, method=True)
+
+def _remote_class(cls):
+    for attr, value in list(cls.__dict__.items()):
+        if isinstance(value, _Remote):
+            setattr(cls, attr, value.build(cls, attr))
+    return cls
+
+
+class _Proxy(object):
+    _service = 'SpaceCenter'
+
+    def __init__(self, conn, obj):
+        self._conn = conn
+        self._object = obj
+
+    @property
+    def _sim(self):
+        return self._conn.sim
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self._object is other._object
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((type(self).__name__, id(self._object)))
+
+    def __repr__(self):
+        return '<{} remote object>'.format(type(self).__name__)
+
+
+def _frame(rf):
+    return rf._object if rf is not None else None
+
+
+@_remote_class
+class ReferenceFrame(_Proxy):
+    def _create_hybrid(self, position, rotation=None, velocity=None, angular_velocity=None):
+        return ReferenceFrame(self._conn, SimFrame('hybrid', position=_frame(position),
+                                                   rotation=_frame(rotation or position),
+                                                   velocity=_frame(velocity)))
+    create_hybrid = _remote_method(_create_hybrid)
+
+
+@_remote_class
+class CelestialBody(_Proxy):
+    def _frame(self):
+        return ReferenceFrame(self._conn, SimFrame('body', self._object))
+
+    name = _Remote(lambda self: self._object.name)
+    equatorial_radius = _Remote(lambda self: self._object.radius)
+    gravitational_parameter = _Remote(lambda self: self._object.mu)
+    surface_gravity = _Remote(lambda self: self._object.surface_gravity)
+    atmosphere_depth = _Remote(lambda self: self._object.atmosphere_depth)
+    has_atmosphere = _Remote(lambda self: self._object.atmosphere_depth > 0)
+    rotational_period = _Remote(lambda self: float('inf'))
+    rotational_speed = _Remote(lambda self: 0.0)
+    sphere_of_influence = _Remote(lambda self: float('inf'))
+    reference_frame = _Remote(_frame)
+    non_rotating_reference_frame = _Remote(_frame)
+    surface_height = _remote_method(lambda self, lat, lon: self._object.surface_height(lat, lon))
+    bedrock_height = _remote_method(lambda self, lat, lon: self._object.surface_height(lat, lon))
+
+    def _surface_position(self, lat, lon, rf):
+        body = self._object
+        position = body.position_at(lat, lon, body.surface_height(lat, lon))
+        return rf._object.position_in(self._sim, position)
+    surface_position = _remote_method(_surface_position)
+
+    def _position_at_altitude(self, lat, lon, altitude, rf):
+        return rf._object.position_in(self._sim, self._object.position_at(lat, lon, altitude))
+    position_at_altitude = _remote_method(_position_at_altitude)
+
+
+@_remote_class
+class Orbit(_Proxy):
+    '''
+    Orbit of a vessel.  Everything is derived from the vessel's current
+    state vector, so it follows burns immediately.
+    '''
+    def _el(self):
+        return self._object.elements()
+
+    def _apoapsis(self):
+        el = self._el()
+        return el.a * (1 + el.e) if el.elliptical else float('inf')
+
+    def _time_to(self, mean_anomaly):
+        el = self._el()
+        return el.time_to_mean_anomaly(mean_anomaly) if el.elliptical else float('inf')
+
+    def _ut_at_true_anomaly(self, true_anomaly):
+        el = self._el()
+        return self._sim.ut + el.time_to_mean_anomaly(el.mean_from_true(true_anomaly))
+
+    def _true_anomaly_at_radius(self, radius):
+        el = self._el()
+        if not el.e:
+            return 0.0
+        cos_nu = (el.a * (1 - el.e ** 2) / radius - 1) / el.e
+        return math.acos(max(-1.0, min(1.0, cos_nu)))
+
+    def _relative_inclination(self, target):
+        h1 = self._el().h
+        h2 = target._object.elements().h
+        cos_i = v_dot(h1, h2) / (v_norm(h1) * v_norm(h2))
+        return math.acos(max(-1.0, min(1.0, cos_i)))
+
+    def _true_anomaly_an(self, target):
+        el = self._el()
+        line = v_cross(target._object.elements().h, el.h)
+        if not v_norm(line):
+            return 0.0
+        return clamp_2pi(math.atan2(v_dot(line, el.Q), v_dot(line, el.P)))
+
+    def _true_anomaly_dn(self, target):
+        return clamp_2pi(self._true_anomaly_an(target) + math.pi)
+
+    def _closest_approach(self, target):
+        '''
+        coarse sampling over one period then golden section refinement
+        '''
+        mine, theirs = self._el(), target._object.elements()
+        start = self._sim.ut
+        period = mine.period if mine.elliptical else 3600.0
+        def separation(ut):
+            return v_norm(v_sub(mine.state_at(ut)[0], theirs.state_at(ut)[0]))
+        samples = 360
+        step = period / samples
+        best = min(range(samples + 1), key=lambda i: separation(start + i * step))
+        lo, hi = start + max(best - 1, 0) * step, start + (best + 1) * step
+        ratio = (math.sqrt(5) - 1) / 2
+        for _ in range(60):
+            a = hi - ratio * (hi - lo)
+            b = lo + ratio * (hi - lo)
+            if separation(a) < separation(b):
+                hi = b
+            else:
+                lo = a
+        ut = (lo + hi) / 2
+        return ut, separation(ut)
+
+    body = _Remote(lambda self: CelestialBody(self._conn, self._object.body))
+    apoapsis = _Remote(_apoapsis)
+    periapsis = _Remote(lambda self: self._el().a * (1 - self._el().e))
+    apoapsis_altitude = _Remote(lambda self: self._apoapsis() - self._object.body.radius)
+    periapsis_altitude = _Remote(
+        lambda self: self._el().a * (1 - self._el().e) - self._object.body.radius)
+    semi_major_axis = _Remote(lambda self: self._el().a)
+    semi_minor_axis = _Remote(lambda self: self._el().a * math.sqrt(abs(1 - self._el().e ** 2)))
+    radius = _Remote(lambda self: v_norm(self._object.position))
+    speed = _Remote(lambda self: v_norm(self._object.velocity))
+    orbital_speed = _Remote(lambda self: v_norm(self._object.velocity))
+    period = _Remote(lambda self: self._el().period)
+    eccentricity = _Remote(lambda self: self._el().e)
+    inclination = _Remote(lambda self: self._el().inclination)
+    longitude_of_ascending_node = _Remote(lambda self: self._el().lan)
+    argument_of_periapsis = _Remote(lambda self: self._el().argument_of_periapsis)
+    mean_anomaly = _Remote(lambda self: self._el().mean_anomaly)
+    true_anomaly = _Remote(lambda self: clamp_2pi(self._el().true_anomaly))
+    # elements here are always fresh from the state vector, so report them
+    # against an epoch of 0 - that way epoch and mean_anomaly_at_epoch
+    # agree whenever each of them is read
+    epoch = _Remote(lambda self: 0.0)
+    mean_anomaly_at_epoch = _Remote(
+        lambda self: clamp_2pi(self._el().mean_anomaly - self._el().n * self._sim.ut))
+    time_to_apoapsis = _Remote(lambda self: self._time_to(math.pi))
+    time_to_periapsis = _Remote(lambda self: self._time_to(0.0))
+    time_to_soi_change = _Remote(lambda self: float('nan'))
+    mean_anomaly_at_ut = _remote_method(
+        lambda self, ut: clamp_2pi(self._el().mean_anomaly + self._el().n * (ut - self._sim.ut)))
+    radius_at = _remote_method(lambda self, ut: v_norm(self._object.state_at(ut)[0]))
+    orbital_speed_at = _remote_method(lambda self, ut: v_norm(self._object.state_at(ut)[1]))
+    position_at = _remote_method(
+        lambda self, ut, rf: rf._object.position_in(self._sim, self._object.state_at(ut)[0]))
+    ut_at_true_anomaly = _remote_method(_ut_at_true_anomaly)
+    true_anomaly_at_radius = _remote_method(_true_anomaly_at_radius)
+    radius_at_true_anomaly = _remote_method(lambda self, ta: self._el().radius_at_true_anomaly(ta))
+    relative_inclination = _remote_method(_relative_inclination)
+    true_anomaly_an = _remote_method(_true_anomaly_an)
+    true_anomaly_dn = _remote_method(_true_anomaly_dn)
+    true_anomaly_at_an = _remote_method(_true_anomaly_an)
+    true_anomaly_at_dn = _remote_method(_true_anomaly_dn)
+    time_of_closest_approach = _remote_method(lambda self, target: self._closest_approach(target)[0])
+    distance_at_closest_approach = _remote_method(
+        lambda self, target: self._closest_approach(target)[1])
+
+
+@_remote_class
+class Flight(_Proxy):
+    '''
+    Flight telemetry of a vessel in a reference frame.  Frames attached
+    to the vessel measure velocity relative to the body, as kRPC does.
+    '''
+    def _velocity(self):
+        vessel, frame = self._object
+        if frame.attached_to_vessel():
+            return frame.direction_in(self._sim, vessel.velocity)
+        return frame.velocity_in(self._sim, vessel.velocity)
+
+    def _lat_lon(self):
+        vessel = self._object[0]
+        return vessel.body.lat_lon(vessel.position)
+
+    def _vertical_speed(self):
+        vessel = self._object[0]
+        return v_dot(vessel.velocity, v_unit(vessel.position))
+
+    def _heading(self):
+        vessel = self._object[0]
+        up, north, east = surface_axes(vessel.position)
+        d = vessel.direction
+        return math.degrees(math.atan2(v_dot(d, east), v_dot(d, north))) % 360
+
+    def _pitch(self):
+        vessel = self._object[0]
+        up = v_unit(vessel.position)
+        return math.degrees(math.asin(max(-1.0, min(1.0, v_dot(vessel.direction, up)))))
+
+    def _roll(self):
+        vessel = self._object[0]
+        right = vessel.vessel_axes()[0]
+        up = v_unit(vessel.position)
+        return math.degrees(math.asin(max(-1.0, min(1.0, -v_dot(right, up)))))
+
+    def _dynamic_pressure(self):
+        vessel = self._object[0]
+        rho = vessel.body.density(vessel.altitude())
+        return 0.5 * rho * v_dot(vessel.velocity, vessel.velocity)
+
+    def _g_force(self):
+        vessel = self._object[0]
+        if vessel.landed:
+            return vessel.body.surface_gravity / G0
+        return v_norm(vessel.last_acceleration) / G0
+
+    mean_altitude = _Remote(lambda self: self._object[0].altitude())
+    surface_altitude = _Remote(
+        lambda self: self._object[0].altitude() - self._object[0].terrain_height())
+    bedrock_altitude = _Remote(
+        lambda self: self._object[0].altitude() - self._object[0].terrain_height())
+    elevation = _Remote(lambda self: self._object[0].terrain_height())
+    latitude = _Remote(lambda self: self._lat_lon()[0])
+    longitude = _Remote(lambda self: self._lat_lon()[1])
+    velocity = _Remote(_velocity)
+    speed = _Remote(lambda self: v_norm(self._velocity()))
+    vertical_speed = _Remote(_vertical_speed)
+    horizontal_speed = _Remote(
+        lambda self: math.sqrt(max(0.0, v_dot(self._object[0].velocity, self._object[0].velocity)
+                                   - self._vertical_speed() ** 2)))
+    direction = _Remote(lambda self: self._object[1].direction_in(self._sim, self._object[0].direction))
+    heading = _Remote(_heading)
+    pitch = _Remote(_pitch)
+    roll = _Remote(_roll)
+    dynamic_pressure = _Remote(_dynamic_pressure)
+    atmosphere_density = _Remote(lambda self: self._object[0].body.density(self._object[0].altitude()))
+    g_force = _Remote(_g_force)
+    center_of_mass = _Remote(
+        lambda self: self._object[1].position_in(self._sim, self._object[0].position))
+
+
+@_remote_class
+class Node(_Proxy):
+    def _node(self):
+        node = self._object
+        if node.removed:
+            raise RPCError('maneuver node has been removed')
+        return node
+
+    def _set(attr):
+        def setter(self, value):
+            node = self._node()
+            setattr(node, attr, value)
+            node.frozen = None
+        return setter
+
+    def _vector(self, vector, rf):
+        frame = _frame(rf) or SimFrame('node', self._node())
+        return frame.direction_in(self._sim, vector)
+
+    def _remove(self):
+        node = self._node()
+        node.removed = True
+        node.vessel.nodes.remove(node)
+
+    prograde = _Remote(lambda self: self._node().prograde, _set('prograde'))
+    normal = _Remote(lambda self: self._node().normal, _set('normal'))
+    radial = _Remote(lambda self: self._node().radial, _set('radial'))
+    ut = _Remote(lambda self: self._node().ut, _set('ut'))
+    delta_v = _Remote(lambda self: self._node().delta_v)
+    remaining_delta_v = _Remote(lambda self: v_norm(self._node().remaining_vector()))
+    time_to = _Remote(lambda self: self._node().ut - self._sim.ut)
+    reference_frame = _Remote(lambda self: ReferenceFrame(self._conn, SimFrame('node', self._node())))
+    burn_vector = _remote_method(
+        lambda self, rf=None: self._vector(self._node().burn_vector(), rf))
+    remaining_burn_vector = _remote_method(
+        lambda self, rf=None: self._vector(self._node().remaining_vector(), rf))
+    remove = _remote_method(_remove)
+    del _set
+
+
+@_remote_class
+class Control(_Proxy):
+    def _attr(attr):
+        return _Remote(lambda self: getattr(self._object, attr),
+                       lambda self, value: setattr(self._object, attr, value))
+
+    def _axis(index):
+        def setter(self, value):
+            self._object.translation[index] = max(-1.0, min(1.0, value))
+        return _Remote(lambda self: self._object.translation[index], setter)
+
+    def _set_throttle(self, value):
+        self._object.throttle = max(0.0, min(1.0, value))
+
+    def _set_wheel(attr):
+        def setter(self, value):
+            setattr(self._object, attr, max(-1.0, min(1.0, value)))
+        return setter
+
+    def _add_node(self, ut, prograde=0.0, normal=0.0, radial=0.0):
+        node = SimNode(self._object, ut, prograde, normal, radial)
+        self._object.nodes.append(node)
+        self._object.nodes.sort(key=lambda n: n.ut)
+        return Node(self._conn, node)
+
+    def _remove_nodes(self):
+        for node in self._object.nodes:
+            node.removed = True
+        del self._object.nodes[:]
+
+    def _activate_next_stage(self):
+        self._object.activate_next_stage()
+        return []
+
+    throttle = _Remote(lambda self: self._object.throttle, _set_throttle)
+    sas = _attr('sas')
+    sas_mode = _attr('sas_mode')
+    speed_mode = _attr('speed_mode')
+    rcs = _attr('rcs')
+    brakes = _attr('brakes')
+    solar_panels = _attr('solar_panels')
+    right = _axis(0)
+    forward = _axis(1)
+    up = _axis(2)
+    wheel_throttle = _Remote(lambda self: self._object.wheel_throttle, _set_wheel('wheel_throttle'))
+    wheel_steering = _Remote(lambda self: self._object.wheel_steering, _set_wheel('wheel_steering'))
+    current_stage = _Remote(lambda self: self._object.current_stage)
+    activate_next_stage = _remote_method(_activate_next_stage)
+    nodes = _Remote(lambda self: [Node(self._conn, n) for n in self._object.nodes])
+    add_node = _remote_method(_add_node)
+    remove_nodes = _remote_method(_remove_nodes)
+    del _attr, _axis, _set_wheel
+
+
+@_remote_class
+class AutoPilot(_Proxy):
+    def _attr(attr):
+        return _Remote(lambda self: getattr(self._object, attr),
+                       lambda self, value: setattr(self._object, attr, value))
+
+    def _set_direction(self, value):
+        self._object.ap_target_direction = tuple(value)
+
+    def _set_angle(attr):
+        def setter(self, value):
+            setattr(self._object, attr, value)
+            self._object.ap_target_direction = None
+        return setter
+
+    def _pitch_and_heading(self, pitch, heading):
+        self._object.ap_target_pitch = pitch
+        self._object.ap_target_heading = heading
+        self._object.ap_target_direction = None
+
+    def _target_direction(self):
+        vessel = self._object
+        if vessel.ap_target_direction is not None:
+            return vessel.ap_target_direction
+        frame = vessel.ap_reference_frame or self._sim.surface_frame(vessel)
+        return frame.direction_in(self._sim, vessel.direction)
+
+    def _engage(self):
+        self._object.ap_engaged = True
+
+    def _disengage(self):
+        self._object.ap_engaged = False
+
+    def _set_frame(self, rf):
+        self._object.ap_reference_frame = rf._object
+
+    def _get_frame(self):
+        frame = self._object.ap_reference_frame or self._sim.surface_frame(self._object)
+        return ReferenceFrame(self._conn, frame)
+
+    engage = _remote_method(_engage)
+    disengage = _remote_method(_disengage)
+    wait = _remote_method(lambda self: None)   # attitude changes are instant here
+    error = _Remote(lambda self: 0.0)
+    sas = _attr('sas')
+    sas_mode = _attr('sas_mode')
+    reference_frame = _Remote(_get_frame, _set_frame)
+    target_direction = _Remote(_target_direction, _set_direction)
+    target_pitch = _Remote(lambda self: self._object.ap_target_pitch, _set_angle('ap_target_pitch'))
+    target_heading = _Remote(lambda self: self._object.ap_target_heading,
+                             _set_angle('ap_target_heading'))
+    target_roll = _Remote(lambda self: self._object.ap_target_roll,
+                          lambda self, value: setattr(self._object, 'ap_target_roll', value))
+    target_pitch_and_heading = _remote_method(_pitch_and_heading)
+    del _attr, _set_angle
+
+
+@_remote_class
+class Resources(_Proxy):
+    '''
+    Resources of a vessel, or of one decouple stage of it.  Object is
+    (vessel, stages) with stages None for the whole vessel.
+    '''
+    def _stages(self):
+        vessel, stages = self._object
+        return vessel.attached_stages() if stages is None else stages
+
+    def _total(self, name, capacity):
+        vessel, stages = self._object
+        if name == 'ElectricCharge':
+            if stages is not None:
+                return 0.0
+            return vessel.max_charge if capacity else vessel.charge
+        density = FUEL_DENSITY.get(name)
+        if density is None:
+            return 0.0
+        return sum((s.fuel_capacity if capacity else s.fuel_mass) / density
+                   for s in self._stages() if s.fuel_type == name)
+
+    names = _Remote(lambda self: sorted(set(s.fuel_type for s in self._stages() if s.fuel_capacity)
+                                        | set(['ElectricCharge'] if self._object[0].max_charge else [])))
+    amount = _remote_method(lambda self, name: self._total(name, False))
+    max = _remote_method(lambda self, name: self._total(name, True))
+    has_resource = _remote_method(lambda self, name: self._total(name, True) > 0)
+
+
+@_remote_class
+class Engine(_Proxy):
+    active = _Remote(lambda self: self._object[1] in self._object[0].active_engines())
+    has_fuel = _Remote(lambda self: self._object[1].fuel_mass > 0)
+    max_thrust = _Remote(lambda self: self._object[1].thrust)
+    available_thrust = _Remote(lambda self: self._object[1].thrust)
+    specific_impulse = _Remote(lambda self: self._object[1].isp)
+    vacuum_specific_impulse = _Remote(lambda self: self._object[1].isp)
+    thrust = _Remote(lambda self: (self._object[1].thrust * self._object[0].engine_throttle(self._object[1])
+                                   if self._object[1] in self._object[0].active_engines()
+                                   and self._object[1].fuel_mass > 0 else 0.0))
+
+
+@_remote_class
+class Parachute(_Proxy):
+    deployed = _Remote(lambda self: False)
+    deploy = _remote_method(lambda self: None)
+
+
+@_remote_class
+class Part(_Proxy):
+    '''
+    A vessel is the root part plus one part per stage.  Object is
+    (vessel, stage), stage None for the root.
+    '''
+    def _engine(self):
+        vessel, stage = self._object
+        if stage is None or not stage.thrust:
+            return None
+        return Engine(self._conn, (vessel, stage))
+
+    def _parachute(self):
+        stage = self._object[1]
+        return Parachute(self._conn, stage) if stage is not None and stage.parachute else None
+
+    name = _Remote(lambda self: self._object[1].name if self._object[1] else 'root')
+    stage = _Remote(lambda self: self._object[1].activation_stage if self._object[1] else -1)
+    decouple_stage = _Remote(lambda self: self._object[1].decouple_stage if self._object[1] else -1)
+    mass = _Remote(lambda self: self._object[1].dry_mass + self._object[1].fuel_mass if self._object[1] else 0.0)
+    dry_mass = _Remote(lambda self: self._object[1].dry_mass if self._object[1] else 0.0)
+    engine = _Remote(_engine)
+    parachute = _Remote(_parachute)
+    reference_frame = _Remote(lambda self: ReferenceFrame(self._conn, SimFrame('vessel', self._object[0])))
+    position = _remote_method(lambda self, rf: rf._object.position_in(self._sim, self._object[0].position))
+
+
+@_remote_class
+class Parts(_Proxy):
+    def _parts(self, stages):
+        return [Part(self._conn, (self._object, s)) for s in stages]
+
+    def _all(self):
+        return [Part(self._conn, (self._object, None))] + self._parts(self._object.attached_stages())
+
+    all = _Remote(_all)
+    root = _Remote(lambda self: Part(self._conn, (self._object, None)))
+    controlling = _Remote(lambda self: Part(self._conn, (self._object, None)))
+    in_stage = _remote_method(lambda self, stage: self._parts(
+        [s for s in self._object.attached_stages() if s.activation_stage == stage]))
+    in_decouple_stage = _remote_method(lambda self, stage: self._parts(
+        [s for s in self._object.attached_stages() if s.decouple_stage == stage]))
+
+
+@_remote_class
+class DockingPort(_Proxy):
+    '''
+    The docking port of a target vessel, at the vessel's centre.
+    '''
+    def _port_frame(self):
+        return ReferenceFrame(self._conn, SimFrame('port', self._object))
+
+    part = _Remote(lambda self: Part(self._conn, (self._object, None)))
+    reference_frame = _Remote(_port_frame)
+    direction = _remote_method(
+        lambda self, rf: rf._object.direction_in(self._sim, self._object.docking_port[1]))
+    position = _remote_method(lambda self, rf: rf._object.position_in(self._sim, self._object.position))
+    state = _Remote(lambda self: 'docked' if any(v.docked_to is self._object
+                                                 for v in self._sim.vessels) else 'ready')
+
+
+@_remote_class
+class Vessel(_Proxy):
+    def _frame(kind):
+        return _Remote(lambda self: ReferenceFrame(self._conn, SimFrame(kind, self._object)))
+
+    def _flight(self, rf=None):
+        frame = _frame(rf) or SimFrame('surface', self._object)
+        return Flight(self._conn, (self._object, frame))
+
+    def _resources_in_decouple_stage(self, stage, cumulative=True):
+        vessel = self._object
+        stages = [s for s in vessel.attached_stages()
+                  if s.decouple_stage == stage or (cumulative and s.decouple_stage > stage)]
+        return Resources(self._conn, (vessel, stages))
+
+    name = _Remote(lambda self: self._object.name)
+    situation = _Remote(lambda self: self._object.situation())
+    mass = _Remote(lambda self: self._object.mass)
+    dry_mass = _Remote(lambda self: sum(s.dry_mass for s in self._object.attached_stages()))
+    thrust = _Remote(lambda self: self._object.current_thrust())
+    available_thrust = _Remote(lambda self: self._object.available_thrust())
+    max_thrust = _Remote(lambda self: self._object.available_thrust())
+    max_vacuum_thrust = _Remote(lambda self: self._object.available_thrust())
+    specific_impulse = _Remote(lambda self: self._object.specific_impulse())
+    vacuum_specific_impulse = _Remote(lambda self: self._object.specific_impulse())
+    orbit = _Remote(lambda self: Orbit(self._conn, self._object))
+    control = _Remote(lambda self: Control(self._conn, self._object))
+    auto_pilot = _Remote(lambda self: AutoPilot(self._conn, self._object))
+    parts = _Remote(lambda self: Parts(self._conn, self._object))
+    resources = _Remote(lambda self: Resources(self._conn, (self._object, None)))
+    reference_frame = _frame('vessel')
+    surface_reference_frame = _frame('surface')
+    surface_velocity_reference_frame = _frame('surface')
+    orbital_reference_frame = _frame('orbital')
+    flight = _remote_method(_flight)
+    resources_in_decouple_stage = _remote_method(_resources_in_decouple_stage)
+    position = _remote_method(lambda self, rf: rf._object.position_in(self._sim, self._object.position))
+    velocity = _remote_method(lambda self, rf: rf._object.velocity_in(self._sim, self._object.velocity))
+    direction = _remote_method(lambda self, rf: rf._object.direction_in(self._sim, self._object.direction))
+    del _frame
+
+
+class _SimWaypoint(object):
+    def __init__(self, lat, lon, body, name):
+        self.lat = lat
+        self.lon = lon
+        self.body = body
+        self.name = name
+
+
+@_remote_class
+class Waypoint(_Proxy):
+    def _remove(self):
+        if self._object in self._sim.waypoints:
+            self._sim.waypoints.remove(self._object)
+
+    latitude = _Remote(lambda self: self._object.lat)
+    longitude = _Remote(lambda self: self._object.lon)
+    name = _Remote(lambda self: self._object.name)
+    body = _Remote(lambda self: CelestialBody(self._conn, self._object.body))
+    remove = _remote_method(_remove)
+
+
+@_remote_class
+class WaypointManager(_Proxy):
+    def _add_waypoint(self, lat, lon, body, name):
+        waypoint = _SimWaypoint(lat, lon, body._object, name)
+        self._sim.waypoints.append(waypoint)
+        return Waypoint(self._conn, waypoint)
+
+    add_waypoint = _remote_method(_add_waypoint)
+    waypoints = _Remote(lambda self: [Waypoint(self._conn, w) for w in self._sim.waypoints])
+
+
+@_remote_class
+class SpaceCenter(_Proxy):
+    VesselSituation = VesselSituation
+    SASMode = SASMode
+    SpeedMode = SpeedMode
+
+    def _vessel(self, vessel):
+        return Vessel(self._conn, vessel) if vessel is not None else None
+
+    def _set_active(self, vessel):
+        self._sim.active_vessel = vessel._object
+
+    def _set_target(self, vessel):
+        self._sim.target_vessel = vessel._object if vessel is not None else None
+
+    def _target_port(self):
+        target = self._sim.target_port_vessel
+        return DockingPort(self._conn, target) if target is not None else None
+
+    def _warp_to(self, ut, max_rails_rate=100000.0, max_physics_rate=2.0):
+        self._sim.warp_to(ut)
+
+    def _maximum_rails_warp_factor(self):
+        vessel = self._sim.active_vessel
+        if not vessel.landed and vessel.altitude() < vessel.body.atmosphere_depth:
+            return 0
+        return len(RAILS_WARP_RATES) - 1
+
+    def _save(self, name):
+        self._sim.saves.append((name, self._sim.ut))
+
+    def _transform_position(self, position, from_rf, to_rf):
+        inertial = from_rf._object.position_to_inertial(self._sim, position)
+        return to_rf._object.position_in(self._sim, inertial)
+
+    def _transform_direction(self, direction, from_rf, to_rf):
+        inertial = from_rf._object.direction_to_inertial(self._sim, direction)
+        return to_rf._object.direction_in(self._sim, inertial)
+
+    @property
+    def ReferenceFrame(self):
+        return ReferenceFrame(self._conn, None)
+
+    active_vessel = _Remote(lambda self: self._vessel(self._sim.active_vessel), _set_active)
+    target_vessel = _Remote(lambda self: self._vessel(self._sim.target_vessel), _set_target)
+    target_docking_port = _Remote(_target_port)
+    vessels = _Remote(lambda self: [Vessel(self._conn, v) for v in self._sim.vessels])
+    bodies = _Remote(lambda self: dict((name, CelestialBody(self._conn, body))
+                                       for name, body in self._sim.bodies.items()))
+    ut = _Remote(lambda self: self._sim.ut)
+    g = _Remote(lambda self: 6.67408e-11)
+    warp_rate = _Remote(lambda self: self._sim.warp_rate())
+    rails_warp_factor = _Remote(lambda self: self._sim.rails_warp_factor,
+                                lambda self, value: self._sim.set_warp(rails=value))
+    physics_warp_factor = _Remote(lambda self: self._sim.physics_warp_factor,
+                                  lambda self, value: self._sim.set_warp(physics=value))
+    maximum_rails_warp_factor = _Remote(_maximum_rails_warp_factor)
+    can_rails_warp_at = _remote_method(
+        lambda self, factor=1: factor <= self._maximum_rails_warp_factor())
+    warp_to = _remote_method(_warp_to)
+    save = _remote_method(_save)
+    quicksave = _remote_method(lambda self: self._save('quicksave'))
+    waypoint_manager = _Remote(lambda self: WaypointManager(self._conn, self._sim))
+    transform_position = _remote_method(_transform_position)
+    transform_direction = _remote_method(_transform_direction)
+
+
+##############################################################################
+##  UI Service  -  keeps the widget state so scripts can be driven by
+##                 "clicking" buttons from a test harness.
+##############################################################################
+
+class _Widget(object):
+    def __init__(self, **state):
+        self.__dict__.update(state)
+        self.children = []
+        self.removed = False
+
+
+@_remote_class
+class RectTransform(_Proxy):
+    _service = 'UI'
+
+    def _attr(attr):
+        return _Remote(lambda self: getattr(self._object, attr),
+                       lambda self, value: setattr(self._object, attr, tuple(value)))
+
+    size = _attr('size')
+    position = _attr('position')
+    del _attr
+
+
+@_remote_class
+class Button(_Proxy):
+    _service = 'UI'
+
+    def click(self):
+        '''
+        simulator only - pretend the player clicked the button
+        '''
+        self._object.clicked = True
+
+    def _set_clicked(self, value):
+        self._object.clicked = value
+
+    clicked = _Remote(lambda self: self._object.clicked, _set_clicked)
+    rect_transform = _Remote(lambda self: RectTransform(self._conn, self._object.rect))
+    visible = _Remote(lambda self: self._object.visible,
+                      lambda self, value: setattr(self._object, 'visible', value))
+    remove = _remote_method(lambda self: setattr(self._object, 'removed', True))
+
+
+@_remote_class
+class Panel(_Proxy):
+    _service = 'UI'
+
+    def _add_button(self, content, visible=True):
+        button = _Widget(text=content, clicked=False, visible=visible,
+                         rect=_Widget(size=(100.0, 30.0), position=(0.0, 0.0)))
+        self._object.children.append(button)
+        return Button(self._conn, button)
+
+    def _add_panel(self, visible=True):
+        panel = _Widget(visible=visible, rect=_Widget(size=(100.0, 100.0), position=(0.0, 0.0)))
+        self._object.children.append(panel)
+        return Panel(self._conn, panel)
+
+    rect_transform = _Remote(lambda self: RectTransform(self._conn, self._object.rect))
+    visible = _Remote(lambda self: self._object.visible,
+                      lambda self, value: setattr(self._object, 'visible', value))
+    add_button = _remote_method(_add_button)
+    add_panel = _remote_method(_add_panel)
+    remove = _remote_method(lambda self: setattr(self._object, 'removed', True))
+
+
+@_remote_class
+class Canvas(Panel):
+    _service = 'UI'
+
+
+@_remote_class
+class UI(_Proxy):
+    _service = 'UI'
+
+    def _message(self, content, duration=1.0, position=None, color=None, size=20):
+        self._object.messages.append((self._sim.ut, content, duration))
+
+    stock_canvas = _Remote(lambda self: Canvas(self._conn, self._object.canvas))
+    message = _remote_method(_message)
+
+
+class _UIState(object):
+    def __init__(self):
+        self.canvas = _Widget(visible=True, rect=_Widget(size=(1920.0, 1080.0), position=(0.0, 0.0)))
+        self.messages = []
+
+
+class _Expression(object):
+    '''
+    A server-side expression.  evaluate() runs it, so it must be called
+    where the connection is already evaluating - inside a stream update.
+    '''
+    def __init__(self, evaluate):
+        self.evaluate = evaluate
+
+
+def _binary(op):
+    return lambda a, b: _Expression(lambda: op(a.evaluate(), b.evaluate()))
+
+
+class _ExpressionService(object):
+    '''
+    Stands in for conn.krpc.Expression.  Building every node of an
+    expression is a round trip, just as it is with the real server.
+    '''
+    _OPERATORS = {
+        'equal': _binary(lambda a, b: a == b),
+        'not_equal': _binary(lambda a, b: a != b),
+        'greater_than': _binary(lambda a, b: a > b),
+        'greater_than_or_equal': _binary(lambda a, b: a >= b),
+        'less_than': _binary(lambda a, b: a < b),
+        'less_than_or_equal': _binary(lambda a, b: a <= b),
+        'and_': _binary(lambda a, b: a and b),
+        'or_': _binary(lambda a, b: a or b),
+        'add': _binary(lambda a, b: a + b),
+        'subtract': _binary(lambda a, b: a - b),
+        'multiply': _binary(lambda a, b: a * b),
+        'divide': _binary(lambda a, b: a / b),
+        'not_': lambda a: _Expression(lambda: not a.evaluate()),
+        'call': lambda call: _Expression(lambda: call[0](*call[1], **call[2])),
+        'constant_double': lambda x: _Expression(lambda: float(x)),
+        'constant_float': lambda x: _Expression(lambda: float(x)),
+        'constant_int': lambda x: _Expression(lambda: int(x)),
+        'constant_bool': lambda x: _Expression(lambda: bool(x)),
+    }
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        build = self._OPERATORS[name]
+        procedure = 'Expression_static_' + ''.join(p.capitalize() for p in name.split('_'))
+        def static(*args):
+            return self._conn._invoke('KRPC', procedure, (build, args, {}))
+        return static
+
+
+class Event(object):
+    '''
+    Stands in for a krpc Event: a stream of a boolean expression that
+    wakes up waiters when the expression becomes true.
+    '''
+    def __init__(self, stream):
+        self.stream = stream
+        self.condition = stream.condition
+
+    def start(self):
+        self.stream.start()
+
+    def wait(self, timeout=None):
+        self.stream.wait(timeout)
+
+    def add_callback(self, callback):
+        self.stream.add_callback(lambda value: value and callback())
+
+    def remove(self):
+        self.stream.remove()
+
+
+@_remote_class
+class KRPC(_Proxy):
+    _service = 'KRPC'
+
+    get_status = _remote_method(lambda self: collections.namedtuple('Status', 'version')('sim'))
+
+    @property
+    def Expression(self):
+        return _ExpressionService(self._conn)
+
+    def add_event(self, expression):
+        conn = self._conn
+        def create():
+            stream = Stream(conn, expression.evaluate, (), {})
+            stream._value = conn._evaluate(expression.evaluate, (), {})
+            return Event(stream)
+        event = conn._invoke('KRPC', 'AddEvent', (create, (), {}))
+        conn.stream_count += 1
+        return event
+
+
+##############################################################################
+##  Streams and Connections
+##############################################################################
+
+class Stream(object):
+    '''
+    A stream reads its value without a round trip.  The simulator simply
+    evaluates the call locally whenever it is read; callbacks and wait()
+    are served by one background thread per connection.
+    '''
+    def __init__(self, conn, func, args, kwargs):
+        self._conn = conn
+        self._call = (func, args, kwargs)
+        self._callbacks = []
+        self._value = None
+        self._updates = 0
+        self._rate = 0.0
+        self._next_update = 0.0
+        self._started = True
+        self.condition = threading.Condition()
+
+    def __call__(self):
+        self._conn._check_deadline()
+        return self._conn._evaluate(*self._call)
+
+    def start(self, wait=True):
+        self._started = True
+
+    @property
+    def started(self):
+        return self._started
+
+    def _get_rate(self):
+        return self._rate
+
+    def _set_rate(self, value):
+        self._rate = value
+
+    rate = property(_get_rate, _set_rate)
+
+    def add_callback(self, callback):
+        self._callbacks.append(callback)
+        self._conn._watch(self)
+
+    def remove_callback(self, callback):
+        self._callbacks.remove(callback)
+
+    def wait(self, timeout=None):
+        '''
+        Block until the value changes.  Like kRPC, call this while
+        holding self.condition.
+        '''
+        self._conn._watch(self)
+        seen = self._updates
+        end = None if timeout is None else _clock() + timeout
+        while self._updates == seen:
+            self._conn._check_deadline()
+            remaining = 0.1 if end is None else min(0.1, end - _clock())
+            if remaining <= 0:
+                return
+            self.condition.wait(remaining)
+
+    def remove(self):
+        self._conn._unwatch(self)
+        self._started = False
+
+    def _update(self, now):
+        if self._rate and now < self._next_update:
+            return
+        if self._rate:
+            self._next_update = now + 1.0 / self._rate
+        try:
+            value = self._conn._evaluate(*self._call)
+        except Exception:
+            return
+        if value == self._value and self._updates:
+            return
+        self._value = value
+        with self.condition:
+            self._updates += 1
+            self.condition.notify_all()
+        for callback in list(self._callbacks):
+            callback(value)
+
+
+class _StreamUpdateLock(object):
+    '''
+    Stands in for the krpc client's stream_update_condition.  Holding it
+    stops the simulation clock, just as holding the real one stops stream
+    values changing, so everything read under it is from one tick.
+    '''
+    def __init__(self, sim):
+        self.sim = sim
+
+    def acquire(self, blocking=True):
+        self.sim.lock.acquire()
+        if not self.sim.hold:
+            self.sim.advance()
+        self.sim.hold += 1
+        return True
+
+    def release(self):
+        self.sim.hold -= 1
+        self.sim.lock.release()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class SimConnection(object):
+    '''
+    Stand-in for the object returned by krpc.connect().
+    '''
+    stream_update_period = 0.01
+
+    def __init__(self, sim, name=None, latency=0.0):
+        self.sim = sim
+        self.name = name
+        self.latency = latency
+        self.rpc_count = 0
+        self.stream_count = 0
+        self._local = threading.local()
+        self._deadline = None
+        self._watched = []
+        self._thread = None
+        self._closed = False
+        self.stream_update_condition = _StreamUpdateLock(sim)
+        self.space_center = SpaceCenter(self, sim)
+        self.ui = UI(self, sim.ui)
+        self.krpc = KRPC(self, sim)
+
+    def time_limit(self, seconds):
+        '''
+        make every call after the given number of wall seconds raise
+        SimulationStopped
+        '''
+        self._deadline = _clock() + seconds
+
+    def _check_deadline(self):
+        if self._deadline is not None and _clock() > self._deadline:
+            raise SimulationStopped()
+
+    def _evaluating(self):
+        return getattr(self._local, 'depth', 0) > 0
+
+    def _evaluate(self, func, args, kwargs):
+        '''
+        run a call locally, with no round trip - as a stream update would
+        '''
+        self._local.depth = getattr(self._local, 'depth', 0) + 1
+        try:
+            with self.sim.lock:
+                self.sim.advance()
+                return func(*args, **kwargs)
+        finally:
+            self._local.depth -= 1
+
+    def _call(self, service, procedure, func, *args, **kwargs):
+        if self._evaluating():
+            return func(*args, **kwargs)
+        return self._invoke(service, procedure, (func, args, kwargs))
+
+    def _invoke(self, service, procedure, args=None, param_types=None, return_type=None):
+        '''
+        The single point every remote procedure call passes through.  In
+        the simulator args carries the local implementation in place of
+        the encoded arguments.
+        '''
+        self._check_deadline()
+        if self.latency:
+            time.sleep(self.latency)
+        with self.sim.lock:
+            self.rpc_count += 1
+            self.sim.rpc_count += 1
+        func, call_args, call_kwargs = args
+        return self._evaluate(func, call_args, call_kwargs)
+
+    def get_call(self, func, *args, **kwargs):
+        '''
+        a call to pass to krpc.Expression.call - no round trip
+        '''
+        return (func, args, kwargs)
+
+    def add_stream(self, func, *args, **kwargs):
+        def create():
+            stream = Stream(self, func, args, kwargs)
+            stream._value = self._evaluate(func, args, kwargs)
+            return stream
+        stream = self._invoke('KRPC', 'AddStream', (create, (), {}))
+        self.stream_count += 1
+        return stream
+
+    def _watch(self, stream):
+        with self.sim.lock:
+            if stream not in self._watched:
+                self._watched.append(stream)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._update_streams)
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _unwatch(self, stream):
+        with self.sim.lock:
+            if stream in self._watched:
+                self._watched.remove(stream)
+
+    def _update_streams(self):
+        while not self._closed:
+            now = _clock()
+            for stream in list(self._watched):
+                stream._update(now)
+            time.sleep(self.stream_update_period)
+
+    def wait_for_stream_update(self, timeout=None):
+        '''
+        wait for the next physics tick, releasing stream_update_condition
+        while waiting if the caller holds it
+        '''
+        sim = self.sim
+        with sim.lock:
+            held = sim.hold   # only ever non-zero here if this thread holds it
+        for _ in range(held):
+            self.stream_update_condition.release()
+        try:
+            ticks = sim.ticks
+            end = None if timeout is None else _clock() + timeout
+            while sim.ticks == ticks:
+                self._check_deadline()
+                if end is not None and _clock() > end:
+                    return
+                time.sleep(sim.physics_dt / (sim.time_scale * sim.warp_rate()) / 4)
+                sim.advance()
+        finally:
+            for _ in range(held):
+                self.stream_update_condition.acquire()
+
+    def close(self):
+        self._closed = True
+
+
+##############################################################################
+##  connect() and install()  -  the krpc module surface.
+##############################################################################
+
+_defaults = {'scenario': 'orbit', 'latency': 0.0, 'time_scale': 1.0,
+             'sim': None, 'deadline': None}
+_real_krpc = None
+
+def connect(name=None, address='127.0.0.1', rpc_port=50000, stream_port=50001,
+            scenario=None, latency=None, time_scale=None, sim=None):
+    '''
+    Same signature as krpc.connect, plus the simulator settings.  Without
+    a sim argument, connections share the simulation set up by install(),
+    or get a fresh one of the given scenario.
+    '''
+    if sim is None:
+        sim = _defaults['sim']
+    if sim is None:
+        sim = create_simulation(scenario or _defaults['scenario'],
+                                time_scale or _defaults['time_scale'])
+    conn = SimConnection(sim, name=name,
+                         latency=_defaults['latency'] if latency is None else latency)
+    if _defaults['deadline'] is not None:
+        conn._deadline = _defaults['deadline']
+    return conn
+
+def install(scenario='orbit', latency=0.0, time_scale=1.0, sim=None, time_limit=None):
+    '''
+    Register this module as 'krpc', so scripts that call krpc.connect()
+    themselves are connected to one shared simulation.  Returns it.
+    '''
+    global _real_krpc
+    if sim is None:
+        sim = create_simulation(scenario, time_scale)
+    _defaults.update(scenario=scenario, latency=latency, time_scale=time_scale, sim=sim,
+                     deadline=None if time_limit is None else _clock() + time_limit)
+    if sys.modules.get('krpc') is not sys.modules[__name__]:
+        _real_krpc = sys.modules.get('krpc')
+    sys.modules['krpc'] = sys.modules[__name__]
+    return sim
+
+def uninstall():
+    '''
+    undo install(), restoring the real krpc module if there was one
+    '''
+    _defaults.update(sim=None, deadline=None)
+    if _real_krpc is not None:
+        sys.modules['krpc'] = _real_krpc
+    else:
+        sys.modules.pop('krpc', None)
+
+
+##############################################################################
+##  Benchmark Harness
+##############################################################################
+
+BenchmarkResult = collections.namedtuple(
+    'BenchmarkResult', 'name scenario completed wall_time rpc_count stream_count sim_time')
+
+class _Quiet(object):
+    def write(self, text):
+        pass
+
+    def flush(self):
+        pass
+
+def benchmark(name, demo, scenario, latency=0.0, time_limit=30.0, time_scale=1.0, quiet=True):
+    '''
+    Runs demo(conn) against a fresh simulation of the scenario and returns
+    a BenchmarkResult.  Demos still running when the time limit is up are
+    stopped and reported as not completed.
+    '''
+    sim = install(scenario, latency=latency, time_scale=time_scale, time_limit=time_limit)
+    conn = connect(name=name)
+    start_ut = sim.ut
+    start = _clock()
+    completed = True
+    stdout = sys.stdout
+    if quiet:
+        sys.stdout = _Quiet()
+    try:
+        demo(conn)
+    except SimulationStopped:
+        completed = False
+    finally:
+        sys.stdout = stdout
+        conn.close()
+        uninstall()
+    return BenchmarkResult(name, scenario, completed, _clock() - start,
+                           sim.rpc_count, conn.stream_count,
+                           sim.ut - start_ut)
+
+
+def _demo_pid(conn):
+    import pid
+    pid.main()
+
+def _demo_launch(conn):
+    import Simple_Launch_Script
+    Simple_Launch_Script.ascent(conn, Simple_Launch_Script.MissionParameters())
+
+def _demo_node(conn):
+    import node_executor
+    sc = conn.space_center
+    sc.active_vessel.control.add_node(sc.ut + 120, prograde=100)
+    node_executor.execute_next_node(conn)
+
+def _demo_landing(conn):
+    import landing
+    vessel = conn.space_center.active_vessel
+    landing.deorbit(vessel, .3, conn)
+    landing.suicide_burn(conn, vessel)
+    landing.final_descent(vessel)
+
+def _demo_rover(conn):
+    import rover
+    sc = conn.space_center
+    wp = sc.waypoint_manager.add_waypoint(0.05, -75.0, sc.active_vessel.orbit.body, "Waypoint1")
+    rover.rover_go(conn, wp)
+    wp.remove()
+
+def _demo_rendezvous(conn):
+    import rendezvous
+    rendezvous.match_planes(conn)
+    rendezvous.hohmann(conn)
+    rendezvous.circularize_at_intercept(conn)
+    rendezvous.get_closer(conn)
+
+def _demo_lambert(conn):
+    import lambert
+    import node_executor
+    import rendezvous
+    lambert.plan_rendezvous(conn)
+    node_executor.execute_all_nodes(conn)
+    rendezvous.get_closer(conn)
+
+def _demo_docking(conn):
+    import docking_autopilot
+    docking_autopilot.dock(conn)
+
+DEMOS = collections.OrderedDict([
+    ('pid', ('launch', _demo_pid)),
+    ('launch', ('launch', _demo_launch)),
+    ('node', ('orbit', _demo_node)),
+    ('landing', ('landing', _demo_landing)),
+    ('rover', ('rover', _demo_rover)),
+    ('rendezvous', ('rendezvous', _demo_rendezvous)),
+    ('lambert', ('rendezvous', _demo_lambert)),
+    ('docking', ('docking', _demo_docking)),
+])
+
+
+##############################################################################
+## Main  -- benchmark the demos in this folder.
+##############################################################################
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the demos against the kRPC simulator')
+    parser.add_argument('demos', nargs='*', default=list(DEMOS), help='demos to run')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds per RPC')
+    parser.add_argument('--time-limit', type=float, default=30.0, help='wall seconds per demo')
+    parser.add_argument('--time-scale', type=float, default=1.0, help='game seconds per wall second')
+    args = parser.parse_args()
+
+    print('{:<12}{:<12}{:>6}{:>10}{:>10}{:>10}{:>10}'.format(
+        'demo', 'scenario', 'done', 'wall s', 'RPCs', 'RPC/s', 'game s'))
+    for name in args.demos:
+        scenario, demo = DEMOS[name]
+        r = benchmark(name, demo, scenario, args.latency, args.time_limit, args.time_scale)
+        print('{:<12}{:<12}{:>6}{:>10.2f}{:>10}{:>10.0f}{:>10.1f}'.format(
+            r.name, r.scenario, 'yes' if r.completed else 'no', r.wall_time,
+            r.rpc_count, r.rpc_count / max(r.wall_time, 1e-9), r.sim_time))
+
+
+if __name__ == '__main__':
+    main()
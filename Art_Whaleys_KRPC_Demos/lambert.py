@@ -0,0 +1,239 @@
+######################################################################
+### Lambert Transfer and Porkchop Plot Library and Example
+######################################################################
+###   Like all of the scripts in my folder here, this file contains
+###   functions you might want to include into your own scripts for
+###   actual use and a demo in the 'main' function that you can just
+###   run to see how it works.
+###
+###   The Hohmann transfer in rendezvous.py only works between circular
+###   orbits in the same plane, so a rendezvous is a chain of burns -
+###   match planes, transfer, circularize - each planned as if the
+###   last one was perfect.  Lambert's problem is the general question
+###   behind all of them: what orbit gets me from here to there in
+###   exactly this long?  Solve it for where the target will be, and
+###   the two burns it takes are a complete rendezvous, eccentric or
+###   inclined targets and all.
+###
+###   Which departure time and time of flight are cheapest isn't
+###   obvious, so
+###
+###       best, delta_v = porkchop(chaser, target, departures, flight_times)
+###
+###   tries every pair at once on numpy arrays - delta_v is the
+###   "porkchop plot" of total delta-v over the grid, and best is its
+###   lowest point as a Transfer.  Big grids can be split across a
+###   process pool with processes=4.  Both orbits are kepler.KeplerOrbits
+###   so the grid costs no calls to the game at all.
+###
+###   plan_rendezvous(conn) does the whole thing for the active vessel
+###   and its target, and leaves two maneuver nodes to fly.
+######################################################################
+
+import math
+import multiprocessing
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from kepler import KeplerOrbit
+
+Transfer = namedtuple('Transfer', 'departure flight_time arrival delta_v departure_burn arrival_burn')
+
+
+def _stumpff(psi):
+    '''
+    the Stumpff functions c2(psi) and c3(psi), for arrays
+    '''
+    psi = np.asarray(psi, dtype=float)
+    c2 = np.full(psi.shape, 1 / 2.)
+    c3 = np.full(psi.shape, 1 / 6.)
+    pos = psi > 1e-6
+    neg = psi < -1e-6
+    s = np.sqrt(psi[pos])
+    c2[pos] = (1 - np.cos(s)) / psi[pos]
+    c3[pos] = (s - np.sin(s)) / s ** 3
+    s = np.sqrt(-psi[neg])
+    c2[neg] = (1 - np.cosh(s)) / psi[neg]
+    c3[neg] = (np.sinh(s) - s) / s ** 3
+    return c2, c3
+
+
+def solve_lambert(r1, r2, flight_time, mu, normal, iterations=80, tolerance=1e-6):
+    '''
+    The velocities (v1, v2) at r1 and r2 of the orbit that goes from r1
+    to r2 in flight_time seconds, less than one revolution, in the
+    direction of motion of an orbit with angular momentum along normal.
+    r1 and r2 are 3-vectors or arrays of them with a last axis of 3,
+    and flight_time a number or matching array - everything is solved
+    at once.  Transfers that can't be solved (180 degree ones, whose
+    plane isn't defined) come back as nan.
+
+    Universal variables with bisection, as in Vallado's Fundamentals of
+    Astrodynamics - slower than Newton's method but it can't wander off.
+    '''
+    r1 = np.asarray(r1, dtype=float)
+    r2 = np.asarray(r2, dtype=float)
+    flight_time = np.asarray(flight_time, dtype=float)
+    r1n = np.linalg.norm(r1, axis=-1)
+    r2n = np.linalg.norm(r2, axis=-1)
+    cos_dnu = np.clip(np.sum(r1 * r2, axis=-1) / (r1n * r2n), -1, 1)
+    # short way round if that's the way the orbit goes, long way otherwise
+    direction = np.where(np.cross(r1, r2).dot(normal) >= 0, 1.0, -1.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        A = direction * np.sqrt(r1n * r2n * (1 + cos_dnu))
+        A = np.where(np.abs(A) < 1e-9 * (r1n + r2n), np.nan, A)
+
+        shape = np.broadcast(A, flight_time).shape
+        low = np.full(shape, -4 * math.pi)
+        high = np.full(shape, 4 * math.pi ** 2)
+        sqrt_mu = math.sqrt(mu)
+        for _ in range(iterations):
+            psi = (low + high) / 2
+            c2, c3 = _stumpff(psi)
+            y = r1n + r2n + A * (psi * c3 - 1) / np.sqrt(c2)
+            chi = np.sqrt(np.maximum(y, 0) / c2)
+            t = (chi ** 3 * c3 + A * np.sqrt(np.maximum(y, 0))) / sqrt_mu
+            # y < 0 only happens below the root - treat it as too short
+            short = (y < 0) | (t <= flight_time)
+            low = np.where(short, psi, low)
+            high = np.where(short, high, psi)
+
+        A = np.where((y < 0) | (np.abs(t - flight_time) > tolerance * flight_time), np.nan, A)
+        f = (1 - y / r1n)[..., np.newaxis]
+        g = (A * np.sqrt(y / mu))[..., np.newaxis]
+        g_dot = (1 - y / r2n)[..., np.newaxis]
+        v1 = (r2 - f * r1) / g
+        v2 = (g_dot * r2 - r1) / g
+    return v1, v2
+
+
+def _transfers(chaser, target, departures, flight_times):
+    '''
+    every departure x flight time: the burn vectors at each end, arrays
+    of shape (departures, flight times, 3)
+    '''
+    departures = np.asarray(departures, dtype=float)[:, np.newaxis]
+    flight_times = np.asarray(flight_times, dtype=float)[np.newaxis, :]
+    r1, v_chaser = chaser.state_at(departures + 0 * flight_times)
+    r2, v_target = target.state_at(departures + flight_times)
+    v1, v2 = solve_lambert(r1, r2, flight_times, chaser.mu, chaser.W)
+    return v1 - v_chaser, v_target - v2
+
+
+def _porkchop_rows(args):
+    chaser, target, departures, flight_times = args
+    burn1, burn2 = _transfers(chaser, target, departures, flight_times)
+    return np.linalg.norm(burn1, axis=-1) + np.linalg.norm(burn2, axis=-1)
+
+
+def porkchop(chaser, target, departures, flight_times, processes=None):
+    '''
+    Total delta-v to rendezvous - leave chaser's orbit at each of
+    departures, arrive at target's position flight_time later and match
+    its velocity - over the grid of departures x flight_times.  chaser
+    and target are kepler.KeplerOrbits around the same body.
+
+    Returns (best, delta_v): the cheapest Transfer (None if nothing in
+    the grid could be solved) and the delta_v array, one row per
+    departure and nan where there's no solution.  With processes > 1
+    the rows are shared out over that many processes.
+    '''
+    departures = np.asarray(departures, dtype=float)
+    flight_times = np.asarray(flight_times, dtype=float)
+    if processes and processes > 1 and len(departures) > 1:
+        chunks = np.array_split(departures, min(processes, len(departures)))
+        pool = multiprocessing.Pool(len(chunks))
+        try:
+            delta_v = np.concatenate(pool.map(_porkchop_rows, [(chaser, target, chunk, flight_times)
+                                                               for chunk in chunks]))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        delta_v = _porkchop_rows((chaser, target, departures, flight_times))
+
+    if np.all(np.isnan(delta_v)):
+        return None, delta_v
+    i, j = np.unravel_index(np.nanargmin(delta_v), delta_v.shape)
+    burn1, burn2 = _transfers(chaser, target, departures[i:i + 1], flight_times[j:j + 1])
+    best = Transfer(departures[i], flight_times[j], departures[i] + flight_times[j],
+                    delta_v[i, j], burn1[0, 0], burn2[0, 0])
+    return best, delta_v
+
+
+def node_components(position, velocity, burn):
+    '''
+    a burn vector as (prograde, normal, radial) for add_node, on the
+    orbit passing through position with velocity
+    '''
+    prograde = velocity / np.linalg.norm(velocity)
+    normal = np.cross(position, velocity)
+    normal /= np.linalg.norm(normal)
+    radial = np.cross(prograde, normal)
+    return float(burn.dot(prograde)), float(burn.dot(normal)), float(burn.dot(radial))
+
+
+def plan_rendezvous(conn, vessel=None, target=None, lead=60.0, samples=120, processes=None):
+    '''
+    Searches departures over the next synodic period (at most four
+    orbits) and flight times from a tenth of an orbit to a whole one for
+    the cheapest rendezvous, zooms in on it, and adds its two maneuver
+    nodes to vessel.  The first burn is at least lead seconds away.
+    Returns the Transfer and the two nodes.
+    '''
+    sc = conn.space_center
+    vessel = vessel or sc.active_vessel
+    target = target or sc.target_vessel
+    mu = vessel.orbit.body.gravitational_parameter
+    chaser = KeplerOrbit.from_orbit(vessel.orbit, mu)
+    goal = KeplerOrbit.from_orbit(target.orbit, mu)
+    now = sc.ut
+
+    period = max(chaser.period, goal.period)
+    rate = abs(goal.n - chaser.n)
+    window = min(2 * math.pi / rate if rate else float('inf'), 4 * period)
+    departures = np.linspace(now + lead, now + lead + window, samples)
+    flight_times = np.linspace(.1 * period, period, samples)
+    best, _ = porkchop(chaser, goal, departures, flight_times, processes)
+    if best is None:
+        raise ValueError('no transfer found')
+
+    # and again on a finer grid around the best one
+    d_step = departures[1] - departures[0]
+    f_step = flight_times[1] - flight_times[0]
+    departures = np.linspace(max(now + lead, best.departure - d_step), best.departure + d_step, 41)
+    flight_times = np.linspace(max(f_step, best.flight_time - f_step), best.flight_time + f_step, 41)
+    best = min(best, porkchop(chaser, goal, departures, flight_times)[0] or best,
+               key=lambda transfer: transfer.delta_v)
+
+    position, velocity = chaser.state_at(best.departure)
+    first = vessel.control.add_node(best.departure, *node_components(
+        position, velocity, best.departure_burn))
+    position, velocity = goal.state_at(best.arrival)
+    second = vessel.control.add_node(best.arrival, *node_components(
+        position, velocity - best.arrival_burn, best.arrival_burn))
+    return best, (first, second)
+
+
+##############################################################################
+## Main  -- only run when we execute this file directly.  Plans a two burn
+##          rendezvous with the target vessel and flies it.
+##############################################################################
+def main():
+    import krpc
+    from node_executor import execute_all_nodes
+
+    conn = krpc.connect(name='Lambert Rendezvous')
+    start = time.time()
+    best, nodes = plan_rendezvous(conn)
+    print('Best transfer: leave in {:.0f}s, {:.0f}s of flight, {:.1f}m/s + {:.1f}m/s '
+          '(planned in {:.2f}s)'.format(best.departure - conn.space_center.ut, best.flight_time,
+                                         np.linalg.norm(best.departure_burn),
+                                         np.linalg.norm(best.arrival_burn), time.time() - start))
+    execute_all_nodes(conn)
+
+
+if __name__ == '__main__':
+    main()
@@ -15,9 +15,18 @@
 import krpc
 import math
 import time
+from collections import namedtuple
 import numpy as np
 
+import burn_integrator
+from conditions import attr, wait_until
+import geodesy
+import heightmap
+import landing_site
 from pid import PID
+from scheduler import FixedRateLoop
+from terrain import terrain_cache
+from vessel_context import context_for
 
 ##############################################################################
 ###   Main function - demonstrates the use of this library. Simply lands
@@ -30,14 +39,22 @@ def main():
         this landing library.
 
         Connects to KRPC server, performs a deorbit burn, then a
-        suicide burn, then a final descent.
+        suicide burn, then a final descent.  Terrain heights are kept
+        on disk, so checking for high ground on the way down costs no
+        round trips over ground surveyed by an earlier run (or by
+        heightmap.py).
         '''
         conn = krpc.connect()
         sc = conn.space_center
         v = sc.active_vessel
+        heightmap.attach(v.orbit.body)
 
 
-        deorbit(v, .3)
+        deorbit(v, .3, conn)
+        site = choose_landing_site(conn, v)
+        if site:
+                print ("Best landing site near touchdown: {:.4f}, {:.4f} - {:.1f} degree slope, {:.0f}m off".format(
+                        site.lat, site.lon, site.slope, site.distance))
         suicide_burn(conn, v)
         final_descent(v)
 
@@ -47,10 +64,12 @@ def main():
 ###     These are the ones you'd actually maybe want to call from your script.
 ###############################################################################
 
-def deorbit(vessel, eccentricity):
+def deorbit(vessel, eccentricity, conn = None):
         '''executes a deorbit burn until the given eccentricity
         is achieved.   If periapsis remains above the equatorial
-        radius, it continues burning.
+        radius, it continues burning.  Given the connection, the
+        server watches for that instead of the script asking it
+        over and over.
         '''
         print ("Deorbiting Vessel...")
         vessel.control.speed_mode = vessel.control.speed_mode.surface
@@ -59,72 +78,117 @@ def deorbit(vessel, eccentricity):
         time.sleep(.1)
         ap.sas_mode = ap.sas_mode.retrograde
 
-        while (vessel.orbit.eccentricity < eccentricity or
-                   vessel.orbit.periapsis_altitude > 0):
-                vessel.control.throttle = 1.0
+        orbit = vessel.orbit
+        vessel.control.throttle = 1.0
+        if conn is not None:
+                wait_until(conn, (attr(orbit, 'eccentricity') >= eccentricity) &
+                                 (attr(orbit, 'periapsis_altitude') <= 0))
+        while (orbit.eccentricity < eccentricity or
+                   orbit.periapsis_altitude > 0):
+                time.sleep(.05)
         vessel.control.throttle = 0.0
 		
-def suicide_burn(conn, vessel, autowarp = True):
+def suicide_burn(conn, vessel, autowarp = True, calculator = None):
         '''
-        Performs a 'Suicide Burn' using the calculator class.
+        Performs a 'Suicide Burn' using the calculator class - 
+        suicide_burn_calculator unless you pass another, such as
+        integrated_burn_calculator.
+        conn can be a connection or a vessel_context.VesselContext.
         '''
-        print "Calculating Suicide Burn..."
-        telem = vessel.flight(vessel.orbit.body.reference_frame)
+        print ("Calculating Suicide Burn...")
+        ctx = context_for(conn, vessel)
+        body = ctx.body
+        telem = ctx.flight(ctx.reference_frame)
         vessel.control.speed_mode = vessel.control.speed_mode.surface
-        rf = vessel.orbit.body.reference_frame
         ap = vessel.auto_pilot
         ap.sas = True
         time.sleep(.1)
         ap.sas_mode = ap.sas_mode.retrograde
 
         ##calculate initial burn
-        computer = suicide_burn_calculator(conn, vessel, 5000)
+        computer = (calculator or suicide_burn_calculator)(ctx, vessel, 5000, streaming=True)
         computer.update()  # run once with altitude of 5000m to get an estimated groundtrack distance
-        touchdown = coords_down_bearing(telem.latitude, telem.longitude, (180 + telem.heading),computer.ground_track,vessel.orbit.body)
+        touchdown = coords_down_bearing(telem.latitude, telem.longitude, (180 + telem.heading),computer.ground_track,body)
         #update actual safe altitude over the groundtrack
-        computer.alt = check_terrain(telem.latitude, telem.longitude, touchdown[0], touchdown[1], vessel.orbit.body)
+        profile = terrain_cache(body).highest(telem.latitude, telem.longitude, touchdown[0], touchdown[1])
+        computer.alt = profile.height
+        print ("Highest terrain on the way down: {:.0f}m ({} heights checked, {} fetched)".format(
+                profile.height, profile.lookups, profile.fetched))
         
         #Initial burn - aiming for the 'safe alt' (highest point over course)
         # and a vertical velocity of 10 m/s
-        burn_until_velocity(conn, vessel, telem, 10, computer, True)
+        burn_until_velocity(ctx, vessel, telem, 10, computer, True)
         
         ## update computer ti aim for 10m above current altitude.
-        computer.alt = vessel.orbit.body.surface_height(telem.latitude, telem.longitude) + 10
+        computer.alt = terrain_cache(body).height(telem.latitude, telem.longitude) + 10
 
         #Second half of burn - aiming for ground alt + 10m and a vertical
         #velocity of 5 m/s
-        burn_until_velocity(conn, vessel, telem, 5, computer, True)
+        burn_until_velocity(ctx, vessel, telem, 5, computer, True)
+        computer.remove()
         
-def burn_until_velocity(conn, vessel, telem, thresh, computer, autowarp):
+def choose_landing_site(conn, vessel, extent = 1000.0, **kwargs):
+        '''
+        Predicts where a suicide burn from here would touch down and
+        returns the best landing_site.Site within extent meters of it,
+        or None if we're not coming down yet or nowhere is flat enough.
+        Extra arguments go to landing_site.find_sites.  Meant for
+        between the deorbit and the suicide burn - over new ground it
+        costs up to find_sites' max_fetches round trips (400), so pass
+        a smaller max_fetches if the burn is close.
+        conn can be a connection or a vessel_context.VesselContext.
+        '''
+        ctx = context_for(conn, vessel)
+        telem = ctx.flight(ctx.reference_frame)
+        computer = suicide_burn_calculator(ctx, vessel, 5000)
+        computer.update()
+        if not np.isfinite(computer.ground_track):
+                return None
+        touchdown = coords_down_bearing(telem.latitude, telem.longitude, (180 + telem.heading),computer.ground_track,ctx.body)
+        sites = landing_site.find_sites(ctx.body, touchdown[0], touchdown[1], extent,
+                                        radius=computer.equatorial_radius, **kwargs)
+        return sites[0] if sites else None
+
+def burn_until_velocity(conn, vessel, telem, thresh, computer, autowarp, hz = 20):
         '''
         Helper Function for suicide_burn function - actually executes a burn
         at the calculated time and burns until it reaches the threshold
-        vertical velocity.
+        vertical velocity.  During the burn the throttle is updated hz
+        times a second, from the vertical speed the computer read on its
+        last update - telem is no longer read.
         
         '''
+        sc = context_for(conn).space_center
         countdown = computer.update()
         print ("Burn in {} seconds".format(countdown))
         
         if autowarp and (countdown > thresh):
-                conn.space_center.warp_to(conn.space_center.ut + countdown - 10)  # warp to 10 seconds before burn
+                sc.warp_to(sc.ut + countdown - 10)  # warp to 10 seconds before burn
                 
         while countdown > 0.0:  #  Wait until suicide burn
                 time.sleep(.1)
                 countdown = computer.update()
-                
-        while telem.vertical_speed < (-1 * thresh):  #Loop until we're ready for final descent
+
+        control = vessel.control
+        throttle = [None]
+        def tick():
                 countdown = computer.update()
-                vessel.control.throttle= .95  #95% throttle 
-                if countdown < 0.0:  #use the emergencty 5% of throttle when needed
-                        vessel.control.throttle = 1.0 
+                if computer.state.vertical_speed >= (-1 * thresh):  #ready for final descent
+                        return True
+                wanted = 1.0 if countdown < 0.0 else computer.throttle  #use the emergency reserve when needed
+                if wanted != throttle[0]:
+                        control.throttle = wanted
+                        throttle[0] = wanted
+
+        FixedRateLoop(hz).run(tick)
         vessel.control.throttle = 0.0        
 
-def final_descent(v):
+def final_descent(v, hz = 20):
         ''' manages final descent.  At the moment keeps vertical velocity limited to 1/10 of the
         current altitude above terrain - so at 200m would try to descend at 20m/s and at 10 m/s locks
-        descent speed to 1m/s.
+        descent speed to 1m/s.  The throttle is updated hz times a second.
         '''
-        print "final descent"
+        print ("final descent")
         telem = v.flight(v.orbit.body.reference_frame)
         v.control.speed_mode = v.control.speed_mode.surface
         ap = v.auto_pilot
@@ -132,7 +196,10 @@ def final_descent(v):
         time.sleep(.1)
         ap.sas_mode = ap.sas_mode.retrograde
         p = PID(.25, .25, .025)
-        while v.situation is not v.situation.landed:
+
+        def tick():
+                if v.situation is v.situation.landed:
+                        return True
                 #ap.sas_mode = ap.sas_mode.retrograde   # SAS leaves retrograde mode if velocity gets to zero.
                 safe_descent = telem.surface_altitude / -10
                 #print safe_descent
@@ -140,6 +207,8 @@ def final_descent(v):
                                 safe_descent = -15.0
                 p.setpoint(safe_descent)
                 v.control.throttle = p.update(telem.vertical_speed)
+
+        FixedRateLoop(hz).run(tick)
         v.control.throttle = 0
 
 ###############################################################################
@@ -147,14 +216,32 @@ def final_descent(v):
 ###############################################################################
 
 
+burn_state = namedtuple('burn_state', 'ut periapsis_altitude eccentricity semi_major_axis '
+                        'mean_anomaly radius velocity speed vertical_speed max_thrust mass')
+
+
 class suicide_burn_calculator(object):
         '''
         Class that calculates time until suicide burn.
+        conn can be a connection or a vessel_context.VesselContext.
+
+        With streaming=True every changing input is read from a stream
+        and all of them are taken from the same physics tick, so update()
+        costs no round trips at all and can run as fast as you like.
+        Call remove() when you're done with a streaming calculator.
+        Either way the body's constants are only fetched once, and the
+        last inputs used are kept in state.
+
+        throttle is what the burn is planned at - burn_until_velocity
+        holds it there and only goes to full throttle when behind.
         '''
-        def __init__(self, conn, v, alt):
-                self.conn = conn
+        throttle = .95   # calculating with 5% safety margin!
+
+        def __init__(self, conn, v, alt, streaming=False):
+                self.ctx = context_for(conn, v)
+                self.conn = self.ctx.conn
                 self.v = v
-                self.sc = conn.space_center
+                self.sc = self.ctx.space_center
                 self.burn_time = np.inf
                 self.burn_duration = np.inf
                 self.ground_track = np.inf
@@ -163,11 +250,59 @@ class suicide_burn_calculator(object):
                 self.angle_from_horizontal = np.inf
                 self.impact_time = np.inf
                 self.alt = alt
+                self.state = None
 
 
                 self.rf = self.sc.ReferenceFrame.create_hybrid(
-                        position=self.v.orbit.body.reference_frame,
-                        rotation=self.v.surface_reference_frame)
+                        position=self.ctx.reference_frame,
+                        rotation=self.ctx.surface_reference_frame)
+
+                body = self.ctx.body
+                self.g = body.surface_gravity
+                self.mu = body.gravitational_parameter
+                self.equatorial_radius = body.equatorial_radius
+
+                self.streams = None
+                if streaming:
+                        self.streams = [self.conn.add_stream(*source) for source in self._sources()]
+
+        def _sources(self):
+                '''
+                where each burn_state field comes from, in order
+                '''
+                orbit = self.ctx.orbit
+                flight = self.ctx.flight(self.rf)
+                return [(getattr, self.sc, 'ut'),
+                        (getattr, orbit, 'periapsis_altitude'),
+                        (getattr, orbit, 'eccentricity'),
+                        (getattr, orbit, 'semi_major_axis'),
+                        (getattr, orbit, 'mean_anomaly'),
+                        (getattr, orbit, 'radius'),
+                        (self.v.velocity, self.rf),
+                        (getattr, flight, 'speed'),
+                        (getattr, flight, 'vertical_speed'),
+                        (getattr, self.v, 'max_thrust'),
+                        (getattr, self.v, 'mass')]
+
+        @property
+        def streaming(self):
+                return self.streams is not None
+
+        def snapshot(self):
+                '''
+                Returns a burn_state of the current inputs - from the
+                streams if streaming, otherwise by asking for each one.
+                '''
+                if self.streaming:
+                        with self.conn.stream_update_condition:
+                                return burn_state(*[stream() for stream in self.streams])
+                return burn_state(*[source[0](*source[1:]) for source in self._sources()])
+
+        def remove(self):
+                if self.streaming:
+                        for stream in self.streams:
+                                stream.remove()
+                        self.streams = None
 
         def update(self):
                 '''
@@ -176,40 +311,143 @@ class suicide_burn_calculator(object):
                 I do not even PRETEND to understand all of the math in this function.  It's essentially a porting
                 of the routine from the Mechjeb orbit extensions.
                 '''
-
-                if self.v.orbit.periapsis_altitude > 0:    ## We're not on a landing trajectory yet.
-                        self.burn_time = np.inf
-                        self.burn_duration = np.inf
-                        self.ground_track = np.inf
-                        self.effective_decel = np.inf
-                        self.angle_from_horizontal = np.inf
-                        self.impact_time = np.inf
-                        return self.burn_time
+                self.state = s = self.snapshot()
+                if s.periapsis_altitude > 0:    ## We're not on a landing trajectory yet.
+                        return self._not_landing()
                 
 
-                rf = self.v.orbit.body.reference_frame
-                
                 #calculate sin of angle from horizontal - 
-                v1 = self.v.velocity(self.rf)
+                v1 = s.velocity
                 v2 = (0,0,1)
                 self.angle_from_horizontal =  angle_between(v1, v2)
                 sine = math.sin(self.angle_from_horizontal)
 
                 #estimate deceleration time
-                g = self.v.orbit.body.surface_gravity
-                T = (self.v.max_thrust / self.v.mass) *.95  # calculating with 5% safety margin!
+                g = self.g
+                T = (s.max_thrust / s.mass) * self.throttle
                 self.effective_decel = .5 * (-2 * g * sine + math.sqrt((2 * g * sine) * (2 * g * sine) + 4 * (T*T - g*g)))
-                self.decel_time = self.v.flight(self.rf).speed / self.effective_decel
+                self.decel_time = s.speed / self.effective_decel
 
                 #estimate time until burn
-                radius = self.v.orbit.body.equatorial_radius + self.alt
-                TA = self.v.orbit.true_anomaly_at_radius(radius)
-                TA = -1 * TA   #look on the negative (descending) side of the orbit
-                self.impact_time = self.v.orbit.ut_at_true_anomaly(TA)
+                self.radius = self.equatorial_radius + self.alt
+                self.impact_time = self.ut_at_radius(s, self.radius)
                 self.burn_time = self.impact_time - self.decel_time/2
-                self.ground_track = ((self.burn_time- self.sc.ut) * self.v.flight(self.rf).speed) + (
-                        .5 * self.v.flight(self.rf).speed * self.decel_time)
-                return self.burn_time - self.sc.ut
+                speed = s.speed
+                self.ground_track = ((self.burn_time- s.ut) * speed) + (
+                        .5 * speed * self.decel_time)
+                return self.burn_time - s.ut
+
+        def _not_landing(self):
+                self.burn_time = np.inf
+                self.burn_duration = np.inf
+                self.ground_track = np.inf
+                self.effective_decel = np.inf
+                self.angle_from_horizontal = np.inf
+                self.impact_time = np.inf
+                return self.burn_time
+
+        def ut_at_radius(self, s, radius):
+                '''
+                UT at which the orbit in burn_state s next passes down
+                through radius - what orbit.ut_at_true_anomaly(
+                -orbit.true_anomaly_at_radius(radius)) would return,
+                worked out locally from the orbital elements.
+                '''
+                e = s.eccentricity
+                a = s.semi_major_axis
+                if not e:
+                        TA = 0.0
+                else:
+                        cos_ta = (a * (1 - e * e) / radius - 1) / e
+                        TA = -math.acos(max(-1.0, min(1.0, cos_ta)))  #descending side of the orbit
+                if e < 1:
+                        E = 2 * math.atan(math.sqrt((1 - e) / (1 + e)) * math.tan(TA / 2))
+                        M = E - e * math.sin(E)
+                        n = math.sqrt(self.mu / a ** 3)
+                        return s.ut + ((M - s.mean_anomaly) % (2 * math.pi)) / n
+                H = 2 * math.atanh(math.sqrt((e - 1) / (e + 1)) * math.tan(TA / 2))
+                M = e * math.sinh(H) - H
+                n = math.sqrt(self.mu / (-a) ** 3)
+                return s.ut + (M - s.mean_anomaly) / n
+
+    
+
+
+
+class integrated_burn_calculator(suicide_burn_calculator):
+        '''
+        Drop-in replacement for suicide_burn_calculator that flies the
+        burn numerically with burn_integrator - the rocket getting
+        lighter and gravity getting stronger are both accounted for - so
+        it can plan on a higher throttle.
+
+        A search takes a tenth of a second or more, too long to run
+        every tick of a 20Hz loop, so it only searches again every
+        replan seconds of game time, starting from where the last one
+        said to look.  In between the countdown just counts down.
+
+        Give it a burn_integrator.BurnTable for the body and the engines'
+        Isp and it looks the burn up in the table instead, every update.
+        That costs next to nothing, but it assumes the speed won't change
+        before the burn starts, so it's only accurate close to the burn.
+        '''
+        def __init__(self, conn, v, alt, streaming=False, throttle=.98, table=None, replan=.5):
+                suicide_burn_calculator.__init__(self, conn, v, alt, streaming)
+                self.throttle = throttle
+                self.table = table
+                self.replan = replan
+                self.plan = None     # (ut, alt, countdown, duration) of the last search
+                self.isp = v.specific_impulse
+
+        def update(self):
+                '''
+                Returns how many seconds until the burn has to start, at
+                the planned throttle, to stop at alt.
+                '''
+                self.state = s = self.snapshot()
+                if s.periapsis_altitude > 0:    ## We're not on a landing trajectory yet.
+                        return self._not_landing()
+
+                self.radius = self.equatorial_radius + self.alt
+                thrust = s.max_thrust * self.throttle
+                vertical = s.vertical_speed
+                horizontal = math.sqrt(max(s.speed * s.speed - vertical * vertical, 0.0))
+                self.angle_from_horizontal = math.atan2(-vertical, horizontal)
+                self.impact_time = self.ut_at_radius(s, self.radius)
+
+                if self.table is not None:
+                        drop, duration = self.table.lookup(
+                                s.speed, math.degrees(self.angle_from_horizontal),
+                                thrust / (s.mass * self.g), s.radius - self.equatorial_radius)
+                        countdown = (s.radius - self.radius - drop) / max(-vertical, 1e-3)
+                else:
+                        countdown, duration = self._search(s, vertical, horizontal, thrust)
+
+                self.decel_time = self.burn_duration = duration
+                self.effective_decel = s.speed / duration if duration else np.inf
+                self.burn_time = s.ut + countdown
+                self.ground_track = (countdown * s.speed) + (.5 * s.speed * duration)
+                return countdown
+
+        def _search(self, s, vertical, horizontal, thrust):
+                '''
+                (countdown, duration) from burn_integrator.burn_start, or
+                from the last search if it was recent enough.  Until the
+                burn that's counted down; once it's due the countdown is
+                held, since it stays put while the burn goes to plan.
+                '''
+                guess = None
+                if self.plan is not None and self.plan[1] == self.alt:
+                        ut, _, countdown, duration = self.plan
+                        elapsed = s.ut - ut
+                        if 0 <= elapsed < self.replan:
+                                return max(countdown - elapsed, min(countdown, 0.0)), duration
+                        guess = countdown - elapsed
+                countdown, duration = burn_integrator.burn_start(
+                        (s.radius, vertical, horizontal, s.mass), self.mu, thrust,
+                        self.isp, self.radius, self.impact_time - s.ut, guess=guess)
+                self.plan = (s.ut, self.alt, countdown, duration)
+                return countdown, duration
 
     
 
@@ -225,46 +463,25 @@ def coords_down_bearing(lat, lon, bearing, distance, body):
         Takes a latitude, longitude and bearing in degrees, and a
         distance in meters over a given body.  Returns a tuple
         (latitude, longitude) of the point you've calculated.
+        See geodesy.destination to work out many points at once.
         '''
-        bearing = math.radians(bearing)
-        R = body.equatorial_radius
-        lat = math.radians(lat)
-        lon = math.radians(lon)
-        
-        lat2 = math.asin( math.sin(lat)*math.cos(distance/R) +
-                     math.cos(lat)*math.sin(distance/R)*math.cos(bearing))
-
-        lon2 = lon + math.atan2(math.sin(bearing)*math.sin(distance/R
-                        )*math.cos(lat),math.cos(distance/R)-math.sin(lat
-                        )*math.sin(lat2))
-
-        lat2 = math.degrees(lat2)
-        lon2 = math.degrees(lon2)
-        return (lat2, lon2)
+        return geodesy.destination(lat, lon, bearing, distance, body.equatorial_radius)
 
 
-def check_terrain(lat1, lon1, lat2, lon2, body):
+def check_terrain(lat1, lon1, lat2, lon2, body, tolerance = 10.0):
         '''
-        Returns an estimate of the highest terrain altitude betwen
-                two latitude / longitude points.
+        Returns the highest terrain altitude found between two
+                latitude / longitude points.  Looks closer only around
+                peaks and steep slopes, until no stretch between samples
+                could hide ground more than tolerance meters higher - see
+                TerrainCache.highest, which also reports where the peak
+                is, an upper bound and how many round trips it took.
+                Heights come from the body's shared terrain cache, so
+                terrain that has been looked at before - this run, or
+                any run if a heightmap store is attached - costs no
+                round trips.
         '''
-        lat = lat1
-        lon = lon1
-        highest_lat = lat
-        highest_lon = lon
-        highest_alt = body.surface_height(lat, lon)
-        latstep = (lat2 - lat1) / 20
-        lonstep = (lon2 - lon1) / 20
-
-        for x in range (20):
-                test_alt = body.surface_height(lat, lon)
-                if  test_alt> highest_alt:
-                        highest_lat = lat
-                        highest_lon = lon
-                        highest_alt = test_alt
-                lat = lat+latstep
-                lon = lon+lonstep
-        return highest_alt
+        return terrain_cache(body).highest(lat1, lon1, lat2, lon2, tolerance).height
 
 
 
@@ -284,7 +501,8 @@ def angle_between(v1, v2):
 	return np.arccos(np.clip(np.dot(v1_u, v2_u), -1.0, 1.0))
 
 
-main()
+if __name__ == "__main__" :
+        main()
 
 
 	
@@ -0,0 +1,224 @@
+######################################################################
+### Landing Site Finder Library and Example
+######################################################################
+###   Like all of the scripts in my folder here, this file contains
+###   functions you might want to include into your own scripts for
+###   actual use and a demo in the 'main' function that you can just
+###   run to see how it works.
+###
+###   Landing wherever the ground track happens to end often means
+###   landing on a slope.  This file looks at a square of ground around
+###   a point - usually the predicted touchdown - and ranks the places
+###   in it to put a lander down:
+###
+###       sites = find_sites(body, lat, lon, extent=1000, spacing=25)
+###       best = sites[0]            # best.lat, best.lon, best.slope ...
+###
+###   Heights come from the shared terrain cache (terrain.py) in one
+###   batch, sampled exactly at every grid point - a round trip per
+###   point not cached yet, (extent / spacing + 1)^2 of them for new
+###   ground.  When that's more than max_fetches (400) it looks at a
+###   coarser grid first and then only around its best few points, so
+###   a search over new ground costs at most that many, and one over
+###   ground it has seen costs none.  Each point is scored on
+###     slope     - steepness of the ground in degrees, and
+###     roughness - how far the ground strays from a flat plane across
+###                 a window of points the size of the lander's feet,
+###   plus how far it is from where we were going to land anyway.
+###   Points steeper than max_slope aren't considered at all.  Pass
+###   processes=N to cut very big grids into bands and score them across
+###   a pool of processes - only worth it for grids of hundreds of
+###   thousands of points whose heights are already cached.
+######################################################################
+
+import math
+import multiprocessing
+import time
+from collections import namedtuple
+
+import numpy as np
+
+import geodesy
+from terrain import terrain_cache
+
+Site = namedtuple('Site', 'lat lon height slope roughness distance score')
+
+
+def box_mean(a, k):
+    '''
+    mean of every k by k window of a (k odd), the same shape as a - the
+    edges are padded by repeating the outermost values
+    '''
+    h = k // 2
+    c = np.pad(a, h, mode='edge').cumsum(0).cumsum(1)
+    c = np.pad(c, ((1, 0), (1, 0)), mode='constant')
+    rows, cols = a.shape
+    return (c[k:k + rows, k:k + cols] - c[:rows, k:k + cols]
+            - c[k:k + rows, :cols] + c[:rows, :cols]) / float(k * k)
+
+
+def slope_and_roughness(heights, spacing, window=5):
+    '''
+    slope in degrees and roughness in meters at every point of a grid of
+    heights spacing meters apart.  Roughness is the RMS height left over
+    once a local plane is taken away, over window by window points.
+    '''
+    heights = np.asarray(heights, dtype=float)
+    dy, dx = np.gradient(heights, spacing)
+    slope = np.degrees(np.arctan(np.hypot(dx, dy)))
+    detail = heights - box_mean(heights, 3)    # zero wherever the ground is planar
+    roughness = np.sqrt(np.maximum(box_mean(detail * detail, window), 0.0))
+    return slope, roughness
+
+
+def _score_band(args):
+    heights, spacing, window, top, bottom = args
+    slope, roughness = slope_and_roughness(heights, spacing, window)
+    return slope[top:bottom], roughness[top:bottom]
+
+
+def score_grid(heights, spacing, window=5, processes=None, band_rows=64):
+    '''
+    slope_and_roughness for a grid - cut into bands of band_rows rows
+    across a pool of processes processes if that's more than one.
+    Each band carries enough rows either side that the result is the
+    same as scoring the grid in one go.
+    '''
+    heights = np.asarray(heights, dtype=float)
+    if not processes or processes < 2:
+        return slope_and_roughness(heights, spacing, window)
+
+    halo = window // 2 + 2
+    rows = heights.shape[0]
+    jobs = []
+    for start in range(0, rows, band_rows):
+        end = min(start + band_rows, rows)
+        lo, hi = max(start - halo, 0), min(end + halo, rows)
+        jobs.append((heights[lo:hi], spacing, window, start - lo, end - lo))
+    pool = multiprocessing.Pool(processes)
+    try:
+        bands = pool.map(_score_band, jobs)
+    finally:
+        pool.close()
+        pool.join()
+    return (np.concatenate([slope for slope, _ in bands]),
+            np.concatenate([roughness for _, roughness in bands]))
+
+
+def _scores(heights, north, east, spacing, extent, window, max_slope, weights, processes=None):
+    '''
+    slope, roughness, distance and score for a grid of heights, inf
+    score where it's too steep
+    '''
+    slope, roughness = score_grid(heights, spacing, window, processes)
+    distance = np.hypot(north, east)
+    score = (weights[0] * slope / max_slope + weights[1] * roughness
+             + weights[2] * distance / extent)
+    score[slope > max_slope] = np.inf
+    return slope, roughness, distance, score
+
+
+def find_sites(body, lat, lon, extent=1000.0, spacing=25.0, window=5, max_slope=10.0,
+               weights=(1.0, 1.0, .5), top=5, processes=None, radius=None,
+               max_fetches=400, refine=4):
+    '''
+    Up to top Sites in the square extent meters across centred on lat,
+    lon, best first.  score is slope / max_slope + roughness in meters
+    + distance / extent, each multiplied by its weight - lower is
+    better.  Heights are sampled exactly every spacing meters, one round
+    trip per point not already cached.  processes goes to score_grid.
+    Pass radius to save asking the body for it.
+
+    If that would be more than max_fetches round trips it searches
+    coarse to fine instead: a grid every few spacings using up to half
+    of them, then the full spacing around the refine best points of
+    that, as many as the rest allow (or just the coarse grid if there's
+    no room for any).  max_fetches=None always samples every point.
+    '''
+    radius = radius or body.equatorial_radius
+    cache = terrain_cache(body)
+    n = int(extent / spacing) // 2
+    args = (extent, window, max_slope, weights)
+
+    def sample(rows, cols):
+        north, east = np.meshgrid(rows * spacing, cols * spacing, indexing='ij')
+        lats = lat + np.degrees(north / radius)
+        lons = geodesy.normalize_longitude(lon + np.degrees(east / (radius * math.cos(math.radians(lat)))))
+        return north, east, lats, lons
+
+    every = np.arange(-n, n + 1)
+    north, east, lats, lons = sample(every, every)
+    if max_fetches is None or (~cache.cached(lats, lons)).sum() <= max_fetches:
+        heights = cache.height(lats, lons)
+        found = [(lats, lons, heights) + _scores(heights, north, east, spacing, *args, processes=processes)]
+    else:
+        step = 2
+        while (2 * (n // step) + 1) ** 2 > max_fetches // 2:
+            step += 1
+        coarse = np.arange(-(n // step), n // step + 1) * step
+        c_north, c_east, c_lats, c_lons = sample(coarse, coarse)
+        c_heights = cache.height(c_lats, c_lons)
+        c_scores = _scores(c_heights, c_north, c_east, spacing * step, *args)
+        c_score = c_scores[3]
+
+        # each coarse point stands for the step x step fine points nearest
+        # it, and needs window // 2 more either side to score those
+        half = step // 2
+        pad = half + window // 2
+        budget = max_fetches - c_score.size
+        found = []
+        for k in np.argsort(c_score, axis=None)[:refine]:
+            if not np.isfinite(c_score.flat[k]):
+                break
+            r, c = np.unravel_index(k, c_score.shape)
+            rows = every[max(coarse[r] - pad + n, 0):coarse[r] + pad + n + 1]
+            cols = every[max(coarse[c] - pad + n, 0):coarse[c] + pad + n + 1]
+            north, east, lats, lons = sample(rows, cols)
+            cost = (~cache.cached(lats, lons)).sum()
+            if cost > budget:
+                break
+            budget -= cost
+            heights = cache.height(lats, lons)
+            slope, roughness, distance, score = _scores(heights, north, east, spacing, *args)
+            inner = ((np.abs(rows - coarse[r]) <= half)[:, np.newaxis]
+                     & (np.abs(cols - coarse[c]) <= half)[np.newaxis, :])
+            found.append((lats, lons, heights, slope, roughness, distance, np.where(inner, score, np.inf)))
+        if not found:       # no room to look closer - the coarse grid will have to do
+            found = [(c_lats, c_lons, c_heights) + c_scores]
+
+    sites = {}
+    for lats, lons, heights, slope, roughness, distance, score in found:
+        for k in np.argsort(score, axis=None)[:top]:
+            if not np.isfinite(score.flat[k]):
+                break
+            site = Site(float(lats.flat[k]), float(lons.flat[k]), float(heights.flat[k]),
+                        float(slope.flat[k]), float(roughness.flat[k]),
+                        float(distance.flat[k]), float(score.flat[k]))
+            key = (round(site.lat, 9), round(site.lon, 9))
+            if key not in sites or site.score < sites[key].score:
+                sites[key] = site
+    return sorted(sites.values(), key=lambda site: site.score)[:top]
+
+
+##############################################################################
+## Main  -- only run when we execute this file directly.  Finds the best
+##          places to land around the active vessel's position.
+##############################################################################
+def main():
+    import krpc
+
+    conn = krpc.connect(name='Landing Sites')
+    vessel = conn.space_center.active_vessel
+    body = vessel.orbit.body
+    flight = vessel.flight(body.reference_frame)
+
+    start = time.time()
+    sites = find_sites(body, flight.latitude, flight.longitude)
+    print('found {} sites in {:.1f}s'.format(len(sites), time.time() - start))
+    for site in sites:
+        print('{:9.4f} {:9.4f}  slope {:4.1f} deg  rough {:4.1f}m  {:5.0f}m away'.format(
+            site.lat, site.lon, site.slope, site.roughness, site.distance))
+
+
+if __name__ == '__main__':
+    main()
@@ -14,6 +14,12 @@
 import krpc
 import math
 import time
+from collections import namedtuple
+
+from conditions import attr, wait_until
+from scheduler import FixedRateLoop
+from ui_events import ButtonDispatcher
+from vessel_performance import VesselPerformance
 
 def main():
     conn = krpc.connect()
@@ -22,7 +28,7 @@ def main():
   #  execute_next_node(conn)  #Executes the next node!
   #  execute_all_nodes(conn)       #executes ALL nodes instead of just the next one!
  
-def execute_next_node(conn):
+def execute_next_node(conn, performance=None, hz=20):
     '''
     This is the actually interesting function in this script!
 
@@ -41,6 +47,11 @@ def execute_next_node(conn):
     the other uses the KRPC built-in auto-pilot.   The one built into
     KRPC can require some tuning depending on your vessel...  but works on
     any vessel regardless of pilot skill/probe core choice!   
+
+    The burn time comes from a vessel_performance.VesselPerformance, so
+    burns that need more than one stage are timed right.  Pass one in as
+    performance to reuse it between nodes.  The burn itself is flown by
+    burn_node, hz times a second.
     '''
     space_center = conn.space_center
     vessel = space_center.active_vessel
@@ -68,44 +79,178 @@ def execute_next_node(conn):
     #ap.wait()
         
 # Calculate the length and start of burn
-    m = vessel.mass
-    isp = vessel.specific_impulse
-    dv = node.delta_v
-    F = vessel.available_thrust
-    G = 9.81
-    burn_time = (m - (m / math.exp(dv / (isp * G)))) / (F / (isp * G))
+    own_performance = performance is None
+    if own_performance:
+        performance = VesselPerformance(conn, vessel, streaming=True)
+    burn_time = performance.burn_time(node.delta_v)
 
 # Warp until burn
     space_center.warp_to(node.ut - (burn_time / 2.0) - 5.0)
-    while node.time_to > (burn_time / 2.0):
-        pass
+    wait_until(conn, attr(node, 'time_to') <= (burn_time / 2.0))
     ap.wait()
     
 # Actually Burn
-    vessel.control.throttle = thrust_controller(vessel, node.remaining_delta_v)  
-    while node.remaining_delta_v > .1:
-        ap.target_direction=node.remaining_burn_vector(rf)#comment out this line
-        #if using the vessel sas method to orient vessel
-        vessel.control.throttle = thrust_controller(vessel, node.remaining_delta_v)  
+    burn_node(conn, vessel, node, rf, performance, hz)
 
 # Finish Up
     ap.disengage()
     vessel.control.throttle = 0.0
     node.remove()
+    if own_performance:
+        performance.remove()
 
-def execute_all_nodes(conn):
+def burn_node(conn, vessel, node, rf, performance, hz=20, tolerance=.01,
+              tail_acceleration=1.0, tail=1.0, steer=True):
+    '''
+    Burns off the node's remaining delta-v, with the throttle set hz times
+    a second in step with the game clock.  Remaining delta-v, the burn
+    vector and the clock are streams - and with a streaming performance
+    model so is the vessel's mass - so a tick costs no round trips for
+    readings.  Only the throttle and autopilot are written, and only
+    when they change.
+
+    Rather than feathering the throttle down in steps, each tick predicts
+    where the burn will be by the next one.  The throttle is eased so the
+    full-thrust part ends with tail seconds' worth of delta-v left at
+    tail_acceleration (m/s^2), and that last bit is burnt at
+    tail_acceleration.  As the tail starts it sets up one server-side
+    event - remaining delta-v down to tolerance, or the clock reaching
+    the predicted cutoff - and waits on it instead of polling, so
+    building the event isn't squeezed into the last moments of the
+    burn.  kRPC events can't change anything in the game themselves:
+    when it fires the throttle is set to 0 straight away, before the
+    event is removed, and the engine stops about one round trip (the
+    event's notice coming back, the throttle going out) after the
+    cutoff - tail_acceleration times that much delta-v over.  Leaves
+    the throttle at 0.  Pass steer=False if something else (SAS in
+    maneuver mode) is pointing the vessel.
+    '''
+    sc = conn.space_center
+    control = vessel.control
+    ap = vessel.auto_pilot
+    ut = conn.add_stream(getattr, sc, 'ut')
+    remaining = conn.add_stream(getattr, node, 'remaining_delta_v')
+    burn_vector = conn.add_stream(node.remaining_burn_vector, rf)
+    loop = FixedRateLoop(hz, ut=ut)
+    tail_dv = tail_acceleration * tail
+    state = {'throttle': None, 'direction': None, 'last_dv': None, 'last_ut': None}
+
+    def set_throttle(throttle):
+        if throttle != state['throttle']:
+            control.throttle = throttle
+            state['throttle'] = throttle
+
+    def tick():
+        now, dv = ut(), remaining()
+        last_dv, state['last_dv'] = state['last_dv'], dv
+        last_ut, state['last_ut'] = state['last_ut'], now
+        if dv <= tolerance or (last_dv is not None and dv > last_dv + tolerance):
+            return True      # done, or past the node and turning around
+        acceleration = performance.acceleration()
+        if not acceleration:
+            set_throttle(1.0)      # nothing lit right now - leave it to staging
+            return
+        if last_ut is None:
+            return      # need two ticks to know how much game time one takes
+        interval = now - last_ut
+        if dv > tail_dv:
+            if steer:
+                direction = burn_vector()
+                if state['direction'] is None or _angle(direction, state['direction']) > .5:
+                    ap.target_direction = direction
+                    state['direction'] = direction
+            # full thrust, easing off to take at most half of what's left
+            # before the tail each tick, in case the next tick is late
+            set_throttle(min(1.0, max((dv - tail_dv) / (2 * acceleration * interval),
+                                      tail_acceleration / acceleration)))
+            return
+        throttle = min(1.0, tail_acceleration / acceleration)
+        set_throttle(throttle)
+        # the whole tail is one wait on the server, set up now while
+        # there's still tail seconds of burn to go: until the predicted
+        # cutoff, or dv is used up if that comes first
+        time_left = dv / (acceleration * throttle)
+        wait_until(conn, (attr(node, 'remaining_delta_v') <= tolerance) |
+                         (attr(sc, 'ut') >= now + time_left),
+                   on_true=lambda: set_throttle(0.0))
+        return True
+
+    try:
+        loop.run(tick)
+    finally:
+        set_throttle(0.0)
+        for stream in (ut, remaining, burn_vector):
+            stream.remove()
+
+def _angle(a, b):
+    '''
+    angle in degrees between two vectors
+    '''
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a) * sum(y * y for y in b))
+    if not norm:
+        return 0.0
+    return math.degrees(math.acos(max(-1.0, min(1.0, dot / norm))))
+
+NodePlan = namedtuple('NodePlan', 'node ut delta_v direction burn_time start')
+
+def plan_nodes(vessel, rf, performance):
+    '''
+    Everything needed to fly each of the vessel's nodes, fetched in one
+    pass before the first burn: a NodePlan per node, in order, with the
+    burn vector in rf (which should be non-rotating, so it stays good
+    until the burn).  Each burn time is worked out for the vessel as it
+    will be after the burns before it - lighter, and maybe on a later
+    stage.
+    '''
+    plans = []
+    burned = 0.0
+    for node in vessel.control.nodes:
+        ut = node.ut
+        dv = node.delta_v
+        burn_time = performance.burn_time(burned + dv) - performance.burn_time(burned)
+        burned += dv
+        plans.append(NodePlan(node, ut, dv, node.burn_vector(rf), burn_time,
+                              ut - burn_time / 2.0))
+    return plans
+
+def execute_all_nodes(conn, hz=20, lead=2.0):
 
     '''
     as the name implies - this function executes ALL maneuver nodes currently
     planned for the vessel in series.
+
+    All of the nodes are planned up front with plan_nodes, so between
+    burns there's nothing to ask the game but where to point: as soon as
+    one burn ends the vessel turns to the next node, and only then warps
+    - to lead seconds before the burn starts, rather than leaving time
+    to turn after the warp.
     '''
     space_center = conn.space_center
     vessel = space_center.active_vessel
-    while vessel.control.nodes:
-        execute_next_node(conn)
+    ap = vessel.auto_pilot
+    rf = vessel.orbit.body.non_rotating_reference_frame
+    performance = VesselPerformance(conn, vessel, streaming=True)
+    ap.reference_frame = rf
+    ap.engage()
+    try:
+        for plan in plan_nodes(vessel, rf, performance):
+            ap.target_direction = plan.direction
+            ap.wait()
+            if plan.start - lead > space_center.ut:
+                space_center.warp_to(plan.start - lead)
+            wait_until(conn, attr(space_center, 'ut') >= plan.start)
+            burn_node(conn, vessel, plan.node, rf, performance, hz)
+            plan.node.remove()
+    finally:
+        ap.disengage()
+        performance.remove()
 
 def thrust_controller(vessel, deltaV):
     '''
+    The stepwise throttle that execute_next_node used before burn_node -
+    kept for scripts of your own that use it.
+
     This function is somewhat arbitrary in it's working - there's not a 'rule'
     that I've found on how to feather out throttle towards the end of a burn
     but given that the chances of overshooting go up with TWR (since we fly
@@ -127,6 +272,8 @@ def execute_btn(conn):
     Demo of how to use the UI Service to turn this node execution function into
     a handy little utility for doing something useful.  Just puts a button on
     the screen.  When you click it - it executes the next maneuver node.
+    The button is watched by a ui_events.ButtonDispatcher, which sleeps
+    until it's clicked.
     '''
     space_center = conn.space_center
     vessel = space_center.active_vessel
@@ -137,11 +284,9 @@ def execute_btn(conn):
     rect.position = (110-(canvas.rect_transform.size[0]/2), 0)  #left middle
     button = panel.add_button("Execute Node")  #add the button
     button.rect_transform.position = (0, 20)   #locate the button
-    button_clicked = conn.add_stream(getattr, button, 'clicked')  #watch button
-    while True:   #if button clicked, execute the next node 
-        if button_clicked():
-            execute_next_node(conn)
-            button.clicked = False
+    buttons = ButtonDispatcher(conn)  #watch button
+    buttons.add(button, execute_next_node, conn)  #if button clicked, execute the next node
+    buttons.run()
  
 # ----------------------------------------------------------------------------
 # Activate main loop, if we are executing THIS file explicitly.
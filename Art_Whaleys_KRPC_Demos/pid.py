@@ -15,7 +15,118 @@
 ##############################################################################
 
 import time
-import krpc
+import numpy as np
+
+from scheduler import FixedRateLoop
+
+# Clocks a PID can run on - any function returning seconds will do.
+wall_clock = time.time
+monotonic_clock = getattr(time, 'monotonic', time.time)
+
+def ut_clock(conn):
+    '''
+    returns a clock that reads the game's universal time from a stream,
+    so controllers see game seconds - warp, pauses and all.
+    '''
+    return conn.add_stream(getattr, conn.space_center, 'ut')
+
+class PIDBank(object):
+    '''
+    A bank of PID controllers, all updated together.
+
+    Works exactly like N of the PID controllers below, but keeps their
+    gains and state in numpy arrays and updates them all with one
+    vectorized call that reads the clock once.   Any of the arguments
+    can be a single number for every controller or a list with one
+    value per controller:
+
+    your_bank=PIDBank(3, P=.75, I=(.25, .2, .25), D=(1, .5, 1))
+    your_bank.setpoint((x1, x2, x3))
+    outputs = your_bank.update((y1, y2, y3))
+
+    setpoint and update also take a channel (an index or slice) to
+    work on just some of the controllers, and your_bank.channel(i)
+    returns a PID that reads and writes controller i of the bank.
+
+    clock is the time source for the D term - wall_clock by default, or
+    monotonic_clock, ut_clock(conn) or any function returning seconds.
+    Pass clock=None and a dt to every update to step the controllers
+    through a simulation as fast as it will run.
+    '''
+
+    def __init__(self, n, P=1.0, I=0.1, D=0.01, ClampI=1.0, clock=wall_clock):
+        self.n = n
+        self.clock = clock
+        self.Kp = self._per_channel(P)
+        self.Ki = self._per_channel(I)
+        self.Kd = self._per_channel(D)
+        self.P = np.zeros(n)
+        self.I = np.zeros(n)
+        self.D = np.zeros(n)
+        self.SetPoint = np.zeros(n)
+        self.ClampI = self._per_channel(ClampI)
+        self.LastTime = np.full(n, clock() if clock else 0.0)
+        self.LastMeasure = np.zeros(n)
+
+    def _per_channel(self, value):
+        return np.array(np.broadcast_to(np.asarray(value, dtype=float), (self.n,)))
+
+    def update(self, measures, channel=slice(None), dt=None):
+        '''
+        returns the controller outputs for the new measurements.  dt, in
+        seconds since the last update, overrides the clock.  If no time
+        has passed since a controller's last update it returns that
+        update's output again and changes nothing.
+        '''
+        if dt is not None:
+            now = self.LastTime[channel] + dt
+        elif self.clock is not None:
+            now = self.clock()
+        else:
+            raise ValueError('dt is required when the PID has no clock')
+        measures = np.asarray(measures, dtype=float)
+        change_in_time = now - self.LastTime[channel]
+        # no time has passed - two updates between the same physics ticks
+        # on a ut_clock, say - so leave those controllers as they were
+        fresh = change_in_time > 0
+
+        error = self.SetPoint[channel] - measures
+        self.P[channel] = np.where(fresh, error, self.P[channel])
+        self.I[channel] = np.where(fresh, np.clip(self.I[channel] + error,   # clamp to prevent windup lag
+                                                  -self.ClampI[channel], self.ClampI[channel]),
+                                   self.I[channel])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.D[channel] = np.where(fresh, (measures - self.LastMeasure[channel]) / change_in_time,
+                                       self.D[channel])
+
+        moved = change_in_time != 0     # a clock that jumps back starts again from there
+        self.LastMeasure[channel] = np.where(moved, measures, self.LastMeasure[channel])  # store data for next update
+        self.LastTime[channel] = np.where(moved, now, self.LastTime[channel])
+
+        return ((self.Kp[channel] * self.P[channel]) + (self.Ki[channel] * self.I[channel])
+                - (self.Kd[channel] * self.D[channel]))
+
+    def setpoint(self, values, channel=slice(None)):
+        self.SetPoint[channel] = values
+        self.I[channel] = 0.0
+
+    def channel(self, i):
+        '''
+        returns a PID that is a view of controller i of this bank
+        '''
+        pid = PID.__new__(PID)
+        pid.bank = self
+        pid.index = i
+        return pid
+
+
+def _channel_attribute(name):
+    def get(self):
+        return float(getattr(self.bank, name)[self.index])
+    def set(self, value):
+        getattr(self.bank, name)[self.index] = value
+    return property(get, set)
+
 
 class PID(object):
     '''
@@ -41,36 +152,31 @@ class PID(object):
     controller should respond to.
     output_data = your_pid.update(input_data)
 
+    Pass clock= to time the controller by something other than the wall
+    clock - see PIDBank - or give update a dt to step it yourself:
+    output_data = your_pid.update(input_data, dt=.02)
+
+    A PID is a one controller PIDBank underneath - see above if you have
+    lots of them to update.
     '''  
     
-    def __init__(self, P=1.0, I=0.1, D=0.01):   
-        self.Kp = P    #P controls reaction to the instantaneous error
-        self.Ki = I    #I controls reaction to the history of error
-        self.Kd = D    #D prevents overshoot by considering rate of change
-        self.P = 0.0
-        self.I = 0.0
-        self.D = 0.0
-        self.SetPoint = 0.0  #Target value for controller
-        self.ClampI = 1.0  #clamps i_term to prevent 'windup.'
-        self.LastTime = time.time()
-        self.LastMeasure = 0.0
+    def __init__(self, P=1.0, I=0.1, D=0.01, clock=wall_clock):   
+        self.bank = PIDBank(1, P, I, D, clock=clock)
+        self.index = 0
+
+    Kp = _channel_attribute('Kp')    #P controls reaction to the instantaneous error
+    Ki = _channel_attribute('Ki')    #I controls reaction to the history of error
+    Kd = _channel_attribute('Kd')    #D prevents overshoot by considering rate of change
+    P = _channel_attribute('P')
+    I = _channel_attribute('I')
+    D = _channel_attribute('D')
+    SetPoint = _channel_attribute('SetPoint')  #Target value for controller
+    ClampI = _channel_attribute('ClampI')  #clamps i_term to prevent 'windup.'
+    LastTime = _channel_attribute('LastTime')
+    LastMeasure = _channel_attribute('LastMeasure')
                 
-    def update(self,measure):
-        now = time.time()
-        change_in_time = now - self.LastTime
-        if not change_in_time:
-            change_in_time = 1.0   #avoid potential divide by zero if PID just created.
-       
-        error = self.SetPoint - measure
-        self.P = error
-        self.I += error
-        self.I = self.clamp_i(self.I)   # clamp to prevent windup lag
-        self.D = (measure - self.LastMeasure) / (change_in_time)
-
-        self.LastMeasure = measure  # store data for next update
-        self.lastTime = now
-
-        return (self.Kp * self.P) + (self.Ki * self.I) - (self.Kd * self.D)
+    def update(self,measure, dt=None):
+        return float(self.bank.update(measure, self.index, dt))
 
     def clamp_i(self, i):   
         if i > self.ClampI:
@@ -81,8 +187,7 @@ class PID(object):
             return i
         
     def setpoint(self, value):
-        self.SetPoint = value
-        self.I = 0.0
+        self.bank.setpoint(value, self.index)
 
 ##############################################################################
 ## Demo Code Below This Line!
@@ -96,13 +201,15 @@ Target_Velocity = 5   # The value we're trying to limit ourselves to
 ##############################################################################
 def main():
     #Setup KRPC
+    import krpc
+
     conn = krpc.connect()
     sc = conn.space_center
     v = sc.active_vessel
     telem = v.flight(v.orbit.body.reference_frame)
 
-#  Create PID controller.
-    p = PID(P=.25, I=0.025, D=0.0025)
+#  Create PID controller, timed by the game's clock.
+    p = PID(P=.25, I=0.025, D=0.0025, clock=ut_clock(conn))
     p.ClampI = 20
     p.setpoint(Target_Velocity) 
 
@@ -112,15 +219,16 @@ def main():
     while not v.thrust:  # stage if we just launched a new rocket
         v.control.activate_next_stage()
 
-#  Loop Forever, or until you get the point of this example and stop it.
-    while True:
+#  Loop Forever at 10 Hz, or until you get the point of this example and stop it.
+    def tick():
         the_pids_output=p.update(telem.vertical_speed)
         v.control.throttle=the_pids_output
         print('Vertical V:{:03.2f}   PID returns:{:03.2f}   Throttle:{:03.2f}'
               .format(telem.vertical_speed,
                       the_pids_output,
                       v.control.throttle))
-        time.sleep(.1)
+
+    FixedRateLoop(10).run(tick)
 
 
         
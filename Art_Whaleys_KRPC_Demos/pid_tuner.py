@@ -0,0 +1,319 @@
+######################################################################
+### Offline PID Autotuner Library and Example
+######################################################################
+###   Like all of the scripts in my folder here, this file contains
+###   functions you might want to include into your own scripts for
+###   actual use and a demo in the 'main' function that you can just
+###   run to see how it works.
+###
+###   Tuning a PID in the live game means launching, watching, editing
+###   three numbers and launching again.  This file does the watching
+###   offline instead: it models the thing being controlled (the
+###   'plant') - a rocket holding a vertical speed, RCS translation for
+###   docking, a rover's throttle - and flies thousands of candidate
+###   gain sets against it at once, all in numpy, in a second or two.
+###
+###   Each candidate is scored on overshoot, settling time and control
+###   effort, and the best one comes back ready to paste into PID(...):
+###
+###       result = random_search(VerticalSpeedPlant(), n=2000)
+###       print(result.report())
+###       print(result.pid_args())        # PID(P=..., I=..., D=...)
+###
+###   The controllers in the search are a PIDBank stepped with explicit
+###   dt, so they behave exactly like the PID in a loop running at the
+###   plant's hz.  That matters - the I term adds up the error once per
+###   update, so gains tuned for 10 Hz are wrong at 20 Hz.
+######################################################################
+
+import collections
+
+import numpy as np
+
+from pid import PIDBank
+
+PHYSICS_DT = 0.02   # KSP's physics tick
+
+
+##############################################################################
+##  Plant models.  Each one advances a whole array of measurements, one
+##  per candidate, at once.
+##############################################################################
+
+class Plant(object):
+    '''
+    Something a PID controls.  Subclasses set the attributes below and
+    implement accelerate(measure, control) - the rate of change of the
+    measurement for the given (already limited) control input.
+
+    name:               shown in reports
+    initial, setpoint:  the measurement at the start, and the target
+    hz:                 how often the control loop updates the PID
+    control_limits:     (low, high) the game clamps the output to
+    clamp_i:            the PID's ClampI in the real loop
+    setpoint_every_tick True if the loop calls setpoint() every update,
+                        which also zeroes the I term every update
+    '''
+    name = 'plant'
+    initial = 0.0
+    setpoint = 1.0
+    hz = 10.0
+    control_limits = (-1.0, 1.0)
+    clamp_i = 1.0
+    setpoint_every_tick = False
+
+    def accelerate(self, measure, control):
+        raise NotImplementedError
+
+    def step(self, measure, control, dt):
+        '''
+        advances every candidate by dt seconds of physics ticks
+        '''
+        control = np.clip(control, *self.control_limits)
+        steps = max(1, int(round(dt / PHYSICS_DT)))
+        h = dt / steps
+        for _ in range(steps):
+            measure = measure + self.accelerate(measure, control) * h
+        return measure
+
+
+class VerticalSpeedPlant(Plant):
+    '''
+    A rocket holding a vertical speed with its throttle - pid.main.
+    '''
+    name = 'vertical speed hold (pid.main)'
+    initial = 0.0
+    setpoint = 5.0
+    hz = 10.0
+    control_limits = (0.0, 1.0)
+    clamp_i = 20.0
+
+    def __init__(self, twr=2.0, g=9.81, drag=0.002):
+        self.twr = twr
+        self.g = g
+        self.drag = drag
+
+    def accelerate(self, measure, control):
+        return control * self.twr * self.g - self.g - self.drag * measure * np.abs(measure)
+
+
+class DescentPlant(VerticalSpeedPlant):
+    '''
+    Slowing to a safe descent rate over the ground - landing.final_descent,
+    which sets the setpoint (and so clears the I term) every update.
+    '''
+    name = 'final descent (landing.final_descent)'
+    initial = -15.0
+    setpoint = -2.0
+    hz = 20.0
+    clamp_i = 1.0
+    setpoint_every_tick = True
+
+    def __init__(self, twr=3.0, g=1.63, drag=0.0):
+        VerticalSpeedPlant.__init__(self, twr, g, drag)
+
+
+class TranslationPlant(Plant):
+    '''
+    RCS translation along one axis - each axis of docking_autopilot.dock,
+    which sets the setpoints (and so clears the I terms) every update.
+    dock negates the PID output because the docking port faces back at
+    us; here a positive control simply pushes the measurement up.
+    '''
+    name = 'RCS translation (docking_autopilot.dock)'
+    initial = 0.0
+    setpoint = 1.0
+    hz = 10.0
+    setpoint_every_tick = True
+
+    def __init__(self, accel=0.5):
+        self.accel = accel
+
+    def accelerate(self, measure, control):
+        return control * self.accel
+
+
+class RoverThrottlePlant(Plant):
+    '''
+    A rover holding its speed with the wheel throttle - rover.rover_go.
+    '''
+    name = 'rover throttle (rover.rover_go)'
+    initial = 0.0
+    setpoint = 10.0
+    hz = 20.0
+
+    def __init__(self, accel=2.0, drag=0.05, rolling=0.1):
+        self.accel = accel
+        self.drag = drag
+        self.rolling = rolling
+
+    def accelerate(self, measure, control):
+        return control * self.accel - self.drag * measure - self.rolling * np.sign(measure)
+
+
+##############################################################################
+##  Scoring
+##############################################################################
+
+Scores = collections.namedtuple('Scores', 'overshoot settling_time effort error cost')
+
+
+def evaluate(plant, P, I, D, duration=30.0, band=.05, weights=(1.0, 1.0, .1, 1.0)):
+    '''
+    Flies every (P[i], I[i], D[i]) gain set against the plant for
+    duration seconds and returns Scores of arrays, one entry per set:
+
+    overshoot:     how far past the setpoint it went, as a fraction of
+                   the step size
+    settling_time: seconds until it stayed within band (a fraction of
+                   the step) of the setpoint - duration if it never did
+    effort:        mean change of the control input per second, so
+                   chattering throttles score badly
+    error:         mean distance from the setpoint, as a fraction of
+                   the step size
+    cost:          weights (overshoot, settling, effort, error) applied
+                   to overshoot, settling_time / duration, effort and
+                   error; lower is better.  Never settling costs an
+                   extra 10.
+    '''
+    P, I, D = np.broadcast_arrays(*(np.asarray(g, dtype=float) for g in (P, I, D)))
+    n = P.size
+    dt = 1.0 / plant.hz
+    ticks = int(round(duration * plant.hz))
+
+    bank = PIDBank(n, P=P.ravel(), I=I.ravel(), D=D.ravel(), ClampI=plant.clamp_i, clock=None)
+    bank.LastMeasure[:] = plant.initial
+    bank.setpoint(plant.setpoint)
+    measure = np.full(n, float(plant.initial))
+    control = np.zeros(n)
+    history = np.empty((ticks, n))
+    movement = np.zeros(n)
+
+    for tick in range(ticks):
+        if plant.setpoint_every_tick:
+            bank.setpoint(plant.setpoint)
+        new_control = np.clip(bank.update(measure, dt=dt), *plant.control_limits)
+        if tick:
+            movement += np.abs(new_control - control)
+        control = new_control
+        measure = plant.step(measure, control, dt)
+        history[tick] = measure
+
+    step = plant.setpoint - plant.initial
+    direction = 1.0 if step >= 0 else -1.0
+    scale = abs(step) or 1.0
+    overshoot = np.clip(direction * (history - plant.setpoint), 0, None).max(axis=0) / scale
+
+    outside = np.abs(history - plant.setpoint) > band * scale
+    outside |= ~np.isfinite(history)
+    settled = ~outside[-1]
+    last_outside = ticks - np.argmax(outside[::-1], axis=0)
+    last_outside[~outside.any(axis=0)] = 0
+    settling_time = np.where(settled, last_outside * dt, duration)
+
+    effort = movement / duration
+    error = np.abs(history - plant.setpoint).mean(axis=0) / scale
+    w_overshoot, w_settling, w_effort, w_error = weights
+    cost = (w_overshoot * overshoot + w_settling * settling_time / duration
+            + w_effort * effort + w_error * error + np.where(settled, 0.0, 10.0))
+    cost = np.where(np.isfinite(cost), cost, np.inf)
+    shape = P.shape
+    return Scores(*(a.reshape(shape) for a in
+                    (overshoot, settling_time, effort, error, cost)))
+
+
+##############################################################################
+##  Searches
+##############################################################################
+
+class TuningResult(object):
+    '''
+    Every gain set a search tried, with its scores.  best is the index of
+    the lowest cost, and P, I, D are the gains there.
+
+    bounds are the (low, high) ranges searched for P, I and D - the
+    lowest and highest values tried if they aren't given.  at_bounds
+    names the best gains that came out at the edge of their range, where
+    a wider search would probably do better.
+    '''
+    def __init__(self, plant, gains, scores, bounds=None, margin=.02):
+        self.plant = plant
+        self.gains = gains        # (n, 3) array of P, I, D
+        self.scores = scores
+        self.ranking = np.argsort(scores.cost, kind='mergesort')
+        self.best = int(self.ranking[0])
+        self.P, self.I, self.D = (float(g) for g in gains[self.best])
+        if bounds is None:
+            bounds = list(zip(gains.min(axis=0), gains.max(axis=0)))
+        self.bounds = bounds
+        self.at_bounds = [name for name, value, (lo, hi) in zip('PID', gains[self.best], bounds)
+                          if _near_bound(value, lo, hi, margin)]
+
+    def pid_args(self):
+        return 'PID(P={:.4g}, I={:.4g}, D={:.4g})'.format(self.P, self.I, self.D)
+
+    def report(self, top=5):
+        lines = ['{} - {} gain sets at {:g} Hz'.format(
+            self.plant.name, len(self.gains), self.plant.hz)]
+        lines.append('{:>10}{:>10}{:>10}{:>11}{:>10}{:>9}{:>8}{:>8}'.format(
+            'P', 'I', 'D', 'overshoot', 'settling', 'effort', 'error', 'cost'))
+        for i in self.ranking[:top]:
+            P, I, D = self.gains[i]
+            lines.append('{:>10.4g}{:>10.4g}{:>10.4g}{:>10.1%}{:>9.2f}s{:>9.3f}{:>8.3f}{:>8.3f}'.format(
+                P, I, D, self.scores.overshoot[i], self.scores.settling_time[i],
+                self.scores.effort[i], self.scores.error[i], self.scores.cost[i]))
+        lines.append('best: ' + self.pid_args())
+        for name in self.at_bounds:
+            lo, hi = self.bounds['PID'.index(name)]
+            lines.append('warning: best {} is at the edge of the range searched ({:.4g} to {:.4g})'.format(
+                name, lo, hi))
+        return '\n'.join(lines)
+
+
+def _near_bound(value, lo, hi, margin):
+    '''
+    whether value is within margin of either end of (lo, hi), measured
+    on a log scale for ranges of positive numbers
+    '''
+    if hi <= lo:
+        return False
+    if lo > 0:
+        value, lo, hi = np.log(value), np.log(lo), np.log(hi)
+    return value - lo <= margin * (hi - lo) or hi - value <= margin * (hi - lo)
+
+
+def grid_search(plant, P, I, D, **kwargs):
+    '''
+    tries every combination of the given P, I and D values.  Extra
+    keyword arguments go to evaluate().
+    '''
+    grid = np.array(np.meshgrid(P, I, D, indexing='ij')).reshape(3, -1).T
+    return TuningResult(plant, grid, evaluate(plant, grid[:, 0], grid[:, 1], grid[:, 2], **kwargs))
+
+
+def random_search(plant, n=2000, P=(1e-3, 100.0), I=(1e-5, 10.0), D=(1e-5, 10.0), seed=None, **kwargs):
+    '''
+    tries n gain sets drawn log-uniformly from the (low, high) ranges.
+    Extra keyword arguments go to evaluate().  Check the result's
+    at_bounds - a gain at the edge of its range wants a wider one.
+    '''
+    rng = np.random.RandomState(seed)
+    gains = np.exp(np.column_stack([rng.uniform(np.log(lo), np.log(hi), n)
+                                    for lo, hi in (P, I, D)]))
+    return TuningResult(plant, gains, evaluate(plant, gains[:, 0], gains[:, 1], gains[:, 2], **kwargs),
+                        bounds=(P, I, D))
+
+
+##############################################################################
+## Main  -- only run when we execute this file directly.  Tunes the PIDs
+##          of the other demos against their plant models.  No game needed.
+##############################################################################
+def main():
+    for plant in (VerticalSpeedPlant(), DescentPlant(), TranslationPlant(), RoverThrottlePlant()):
+        result = random_search(plant, n=4000, seed=1)
+        print(result.report())
+        print('')
+
+
+if __name__ == '__main__':
+    main()
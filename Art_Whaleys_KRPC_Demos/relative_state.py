@@ -0,0 +1,140 @@
+######################################################################
+### Relative State Library and Example
+######################################################################
+###   Like all of the scripts in my folder here, this file contains
+###   functions you might want to include into your own scripts for
+###   actual use and a demo in the 'main' function that you can just
+###   run to see how it works.
+###
+###   Helpers like rendezvous.dist(v, t) and speed(v, t) each look up
+###   the body's reference frame and then ask for both vessels'
+###   positions or velocities - and an approach loop that calls two or
+###   three of them a tick makes ten or more round trips to find out
+###   where the target is.
+###
+###   A RelativeState streams the two vessels' positions and velocities
+###   in one frame, looked up once, and works everything else out here:
+###
+###       relative = RelativeState(conn, vessel, target)
+###       s = relative.snapshot()
+###       s.distance, s.range_rate     # how far, and how fast that's changing
+###       s.position, s.velocity       # the target, as seen from the vessel
+###
+###   Each snapshot reads all four streams - and the game clock, as
+###   s.ut - at the same physics tick.  Call remove() when you're done
+###   with it.
+######################################################################
+
+import math
+from collections import namedtuple
+
+from vessel_context import context_for
+
+RelativeSnapshot = namedtuple('RelativeSnapshot',
+                              'position velocity distance speed range_rate direction closing_direction ut')
+
+
+def _unit(v, size):
+    return tuple(x / size for x in v) if size else (0.0, 0.0, 0.0)
+
+
+class RelativeState(object):
+    '''
+    Where target is and how it's moving, relative to vessel.  conn can
+    be a connection or a vessel_context.VesselContext; vessel defaults
+    to the active vessel and target to the target vessel.
+    reference_frame defaults to vessel's body's non-rotating frame.
+
+    With streaming=False nothing is streamed and each snapshot makes
+    four calls instead, and conn can be None if you pass both vessels.
+    Those snapshots don't read the clock - their ut is None.
+    '''
+    def __init__(self, conn, vessel=None, target=None, reference_frame=None, streaming=True):
+        self.conn = conn
+        if conn is not None:
+            ctx = context_for(conn)
+            self.conn = ctx.conn
+            vessel = vessel or ctx.vessel
+            target = target or ctx.space_center.target_vessel
+        self.vessel = vessel
+        self.target = target
+        self.reference_frame = reference_frame or vessel.orbit.body.non_rotating_reference_frame
+        self.streams = None
+        if streaming:
+            self.streams = [self.conn.add_stream(*source) for source in self._sources()]
+            self.streams.append(self.conn.add_stream(getattr, self.conn.space_center, 'ut'))
+
+    def _sources(self):
+        rf = self.reference_frame
+        return [(self.vessel.position, rf),
+                (self.vessel.velocity, rf),
+                (self.target.position, rf),
+                (self.target.velocity, rf)]
+
+    @property
+    def streaming(self):
+        return self.streams is not None
+
+    def remove(self):
+        if self.streaming:
+            for stream in self.streams:
+                stream.remove()
+            self.streams = None
+
+    def snapshot(self):
+        '''
+        Returns a RelativeSnapshot.  position and velocity are the
+        target's relative to the vessel (so position points at the
+        target and velocity is what the vessel has to burn to match it),
+        distance and speed are their sizes, and range_rate is how fast
+        the distance is changing - negative while closing.  direction is
+        position and closing_direction the way the vessel is moving
+        relative to the target, both as unit vectors.  ut is the game
+        time of the readings (None when not streaming).
+        '''
+        if self.streaming:
+            with self.conn.stream_update_condition:
+                vp, vv, tp, tv, ut = [stream() for stream in self.streams]
+        else:
+            vp, vv, tp, tv = [source[0](*source[1:]) for source in self._sources()]
+            ut = None
+        position = (tp[0] - vp[0], tp[1] - vp[1], tp[2] - vp[2])
+        velocity = (tv[0] - vv[0], tv[1] - vv[1], tv[2] - vv[2])
+        distance = math.sqrt(sum(x * x for x in position))
+        speed = math.sqrt(sum(x * x for x in velocity))
+        range_rate = sum(p * v for p, v in zip(position, velocity)) / distance if distance else 0.0
+        return RelativeSnapshot(position, velocity, distance, speed, range_rate,
+                                _unit(position, distance), _unit(velocity, -speed), ut)
+
+    def distance(self):
+        return self.snapshot().distance
+
+    def speed(self):
+        return self.snapshot().speed
+
+
+##############################################################################
+## Main  -- only run when we execute this file directly.  Reports the
+##          range and range rate to the target vessel twice a second.
+##############################################################################
+def main():
+    import krpc
+    from scheduler import FixedRateLoop
+
+    conn = krpc.connect(name='Relative State')
+    relative = RelativeState(conn)
+    ticks = [0]
+
+    def tick():
+        s = relative.snapshot()
+        print('range {:10.1f}m   range rate {:8.2f}m/s   relative speed {:8.2f}m/s'.format(
+            s.distance, s.range_rate, s.speed))
+        ticks[0] += 1
+        return ticks[0] >= 20
+
+    FixedRateLoop(2).run(tick)
+    relative.remove()
+
+
+if __name__ == '__main__':
+    main()
@@ -17,7 +17,11 @@ import krpc
 import time
 import math
 
+from kepler import KeplerOrbit, closest_approaches
 from node_executor import execute_next_node
+from relative_state import RelativeState
+from scheduler import FixedRateLoop
+from vessel_performance import VesselPerformance
 
 ###############################################################################
 ##                      Main Function
@@ -103,12 +107,17 @@ def get_closer(conn):
     ap = v.auto_pilot
     rf = v.orbit.body.non_rotating_reference_frame
     ap.reference_frame=rf
+    performance = VesselPerformance(conn, v)
+    relative = RelativeState(conn, v, t, rf)
 
-    matchv(sc, v, t)
-    while dist(v, t) > 200:
-        close_dist(sc, v, t)
-        
-        matchv(sc, v, t)
+    try:
+        matchv(sc, v, t, performance, relative)
+        while relative.distance() > 200:
+            close_dist(sc, v, t, relative)
+
+            matchv(sc, v, t, performance, relative)
+    finally:
+        relative.remove()
         
     
 
@@ -134,8 +143,11 @@ def get_phase_angle(vessel, target):
 def orbital_progress(vessel, ut):
     '''
     returns the orbital progress in radians, referenced to the planet's origin
-    of longitude.
+    of longitude.  vessel can also be a kepler.KeplerOrbit, which answers
+    without asking the game.
     '''
+    if isinstance(vessel, KeplerOrbit):
+        return vessel.mean_longitude_at(ut)
     lan = vessel.orbit.longitude_of_ascending_node
     arg_p = vessel.orbit.argument_of_periapsis
     ma_ut = vessel.orbit.mean_anomaly_at_ut(ut)
@@ -143,27 +155,54 @@ def orbital_progress(vessel, ut):
 
 def time_transfer(vessel, target, ut, phase_angle):
     '''
-    Performs an iterative search for the next time vessel and target
-    have the given relative phase_angle after ut
+    Finds the next time after ut that vessel and target have the given
+    relative phase_angle.  Both orbits are fetched once; after that the
+    phase angle changes at a fixed rate - the difference of their mean
+    motions - so the window is solved for directly, then refined on the
+    true positions (which is where eccentric orbits differ) by bisection
+    on the locally propagated orbits.  It takes the first window after
+    ut, looking from ut to a little past the mean one, and a synodic
+    period further if the true window was just before ut - and raises
+    ValueError if it still can't find one.
+    '''
+    mu = vessel.orbit.body.gravitational_parameter
+    try:
+        vessel, target = KeplerOrbit.from_orbit(vessel.orbit, mu), KeplerOrbit.from_orbit(target.orbit, mu)
+    except ValueError:      # not elliptical - no fixed rate to solve with
+        return scan_transfer(vessel, target, ut, phase_angle)
+    rate = target.n - vessel.n
+    if rate == 0:
+        raise ValueError('vessel and target have the same period - the phase angle never changes')
+    synodic_period = 2 * math.pi / abs(rate)
+
+    # mean longitudes move linearly, so this is exact for circular orbits
+    error = phase_error(vessel.mean_longitude_at(ut), target.mean_longitude_at(ut), phase_angle)
+    guess = ut + (-error / rate) % synodic_period
+
+    # the true longitudes lead or lag the mean ones by up to 2e radians each
+    width = min(synodic_period / 2,
+                (4 * max(vessel.eccentricity, target.eccentricity) + .01) / abs(rate))
+    true_error = lambda t: phase_error(vessel.true_longitude_at(t),
+                                       target.true_longitude_at(t), phase_angle)
+    for end, samples in ((guess + width, 64), (guess + synodic_period + width, 128)):
+        found = bracketed_root(true_error, ut, end, ut, samples=samples)   # the earliest root
+        if found is not None:
+            return found
+    raise ValueError('no transfer window found in the next two synodic periods')
+
+def scan_transfer(vessel, target, ut, phase_angle):
+    '''
+    The slow way to do what time_transfer does, for orbits KeplerOrbit
+    can't handle: steps forward from ut asking the game where both
+    vessels are, ten seconds at a time and then one, until the phase
+    angle is right.  Several calls a step.
     '''
     print("Doing Coarse Search for Transfer Time...")
-    #coarse unbound search
-    while True:        
-        v_pos = orbital_progress(vessel, ut)
-        t_pos =  orbital_progress(target, ut)
-        angle_error = math.fabs(t_pos - (v_pos - math.pi) - phase_angle)
-        if  angle_error < .01:
-            break
+    while abs(phase_error(orbital_progress(vessel, ut), orbital_progress(target, ut), phase_angle)) >= .01:
         ut += 10
     ut -= 10
-    #fine unbound search
     print("Doing Fine Search for Transfer Time...")
-    while True:        
-        v_pos = orbital_progress(vessel, ut)
-        t_pos =  orbital_progress(target, ut)
-        angle_error = math.fabs(t_pos - (v_pos - math.pi) - phase_angle)
-        if  angle_error < .001:
-            break
+    while abs(phase_error(orbital_progress(vessel, ut), orbital_progress(target, ut), phase_angle)) >= .001:
         ut += 1
     return ut
 
@@ -196,37 +235,53 @@ def circularize_at_apoapsis(vessel, ut):
     time = vessel.orbit.time_to_apoapsis + ut
     return vessel.control.add_node(time, prograde = dv)
 
-def matchv(sc, v, t):
+def matchv(sc, v, t, performance=None, relative=None, hz=10, revolutions=1):
     '''
     function to match active vessel's velocity to target's at the
-    point of closest approach
+    point of closest approach - the closest in the next revolutions
+    orbits, found locally with kepler.closest_approaches.  performance
+    is a VesselPerformance and relative a relative_state.RelativeState
+    for v and t to reuse - ones that don't stream are made if they
+    aren't passed.
     '''
     print ("Matching Velocites...")
 
     # Calculate the length and start of burn
-    m = v.mass
-    isp = v.specific_impulse
-    dv = speed(v, t)
-    F = v.available_thrust
-    G = 9.81
-    burn_time = (m - (m / math.exp(dv / (isp * G)))) / (F / (isp * G))
+    performance = performance or VesselPerformance(None, v)
+    relative = relative or RelativeState(None, v, t, streaming=False)
+    burn_time = performance.burn_time(relative.speed())
 
     ## Orient vessel to negative target relative velocity
     ap = v.auto_pilot
+    ap.reference_frame = relative.reference_frame
     ap.engage()
-    ap.target_direction = target_vminus(v,t)
+    ap.target_direction = relative.snapshot().velocity
     ap.wait()
 
     #wait for the time to burn
-    burn_start = v.orbit.time_of_closest_approach(t) - (burn_time/1.9)
+    mu = v.orbit.body.gravitational_parameter
+    try:
+        approaches = closest_approaches(KeplerOrbit.from_orbit(v.orbit, mu),
+                                        KeplerOrbit.from_orbit(t.orbit, mu), sc.ut, revolutions)
+    except ValueError:      # not elliptical - ask the game instead
+        approaches = None
+    closest = approaches[0].ut if approaches else v.orbit.time_of_closest_approach(t)
+    burn_start = closest - (burn_time/1.9)
     sc.warp_to(burn_start - 10)
-    while sc.ut < burn_start:
-        ap.target_direction = target_vminus(v,t)
-        time.sleep(.5)
+    def wait():
+        s = relative.snapshot()
+        ap.target_direction = s.velocity
+        return (sc.ut if s.ut is None else s.ut) >= burn_start
+    FixedRateLoop(2).run(wait)
+
     #burn
-    while speed(v, t) > .1:
-        ap.target_direction = target_vminus(v,t)
-        v.control.throttle = speed(v, t) / 20.0
+    def burn():
+        s = relative.snapshot()
+        if s.speed <= .1:
+            return True
+        ap.target_direction = s.velocity
+        v.control.throttle = s.speed / 20.0
+    FixedRateLoop(hz).run(burn)
         
     #restore user control    
     v.control.throttle = 0.0
@@ -235,26 +290,33 @@ def matchv(sc, v, t):
 
 
 
-def close_dist(sc, v, t):
+def close_dist(sc, v, t, relative=None, hz=10):
     '''
     Function to close distance between active and target vessels.
     Sets approach speed to 1/200 of separation at time of burn.
+    relative is a relative_state.RelativeState for v and t to reuse.
     '''
     print ("Closing Distance...")
+    relative = relative or RelativeState(None, v, t, streaming=False)
 
     # orient vessel to target
     ap = v.auto_pilot
+    ap.reference_frame = relative.reference_frame
     ap.engage()
     time.sleep(.1)
-    ap.target_direction = target(v, t)
+    ap.target_direction = relative.snapshot().position
     time.sleep(.1)
     ap.wait()
 
     #calculate and burn
-    targetspeed = dist(v,t) / 200.0
-    while targetspeed - speed(v, t) > .1:
-        ap.target_direction = target(v,t)
-        v.control.throttle = (targetspeed - speed(v, t)) / 20.0
+    targetspeed = relative.distance() / 200.0
+    def burn():
+        s = relative.snapshot()
+        if targetspeed - s.speed <= .1:
+            return True
+        ap.target_direction = s.position
+        v.control.throttle = (targetspeed - s.speed) / 20.0
+    FixedRateLoop(hz).run(burn)
 
     #restore user control
     v.control.throttle = 0.0
@@ -277,6 +339,44 @@ def clamp_2pi(x):
         x -= (2 * math.pi)
     return x
 
+def phase_error(v_pos, t_pos, phase_angle):
+    '''
+    how far target's orbital progress is from phase_angle ahead of the
+    point opposite vessel's, in radians from -pi to pi
+    '''
+    return (t_pos - (v_pos - math.pi) - phase_angle + math.pi) % (2 * math.pi) - math.pi
+
+def bracketed_root(f, lo, hi, guess, tolerance=.001, samples=64):
+    '''
+    the root of f between lo and hi nearest to guess, to within
+    tolerance seconds.  f may wrap around (like an angle) - a jump of
+    more than pi between samples isn't taken as a root.  Returns None
+    if there's no root in the bracket.
+    '''
+    step = (hi - lo) / samples
+    roots = []
+    t0, f0 = lo, f(lo)
+    for k in range(1, samples + 1):
+        t1 = lo + k * step
+        f1 = f(t1)
+        if f0 == 0:
+            roots.append((t0, t0))
+        elif f0 * f1 < 0 and abs(f1 - f0) < math.pi:
+            roots.append((t0, t1))
+        t0, f0 = t1, f1
+    if not roots:
+        return None
+    a, b = min(roots, key=lambda r: abs((r[0] + r[1]) / 2 - guess))
+    fa = f(a)
+    while b - a > tolerance:
+        mid = (a + b) / 2
+        fm = f(mid)
+        if fa * fm <= 0:
+            b = mid
+        else:
+            a, fa = mid, fm
+    return (a + b) / 2
+
 def v3minus(v,t):
     '''
     vector subtraction
@@ -16,11 +16,13 @@
 
 import krpc
 import time
-import math
 from collections import namedtuple
-from math import atan2,degrees,cos,sqrt,asin,sin,radians
 
-from pid import PID  #imports my PID controller from the PID example file!
+from conditions import Value, attr, wait_until
+import geodesy
+from pid import PIDBank  #imports my PID controllers from the PID example file!
+from scheduler import FixedRateLoop
+from vessel_context import context_for
 
 latlon =  namedtuple('latlon', 'lat lon')  #create a named tuple
 
@@ -44,39 +46,41 @@ def main():
 ##############################################################################
 ##  And here's the function that's actually interesting! 
 ##############################################################################
-def rover_go(conn, waypoint, speed = 10.0, savetime = 300 ):
+def rover_go(conn, waypoint, speed = 10.0, savetime = 300, hz = 20 ):
     '''
     Function to drive a rover to the specified waypoint.  Must be called with
     an active KRPC connection and a valid waypoint.   Attempts to bring rover
     to a complete stop and quicksave a file called "rover_ap" at a regular 
     interval.  Defaults to 5 minutes.   This and rover speed can be specified
-    as optional arguments.  A savetime of 0 turns this feature off.
+    as optional arguments.  A savetime of 0 turns this feature off.  The
+    controls are updated hz times a second.
+    conn can also be a vessel_context.VesselContext.
     '''
 
     ## grab hold of the krpc functions we'll need to drive the rover
-    v=conn.space_center.active_vessel  
-    ground_telem=v.flight(v.orbit.body.reference_frame)
-    surf_telem=v.flight(v.surface_reference_frame)
+    ctx = context_for(conn)
+    v=ctx.vessel  
+    body=ctx.body
+    ground_telem=ctx.flight(ctx.reference_frame)
+    surf_telem=ctx.flight(ctx.surface_reference_frame)
     target=latlon(waypoint.latitude, waypoint.longitude)
+    radius = body.equatorial_radius
     
     autosave.lastsave = time.time()
     partslist = v.parts.all
-    there_yet = False;
 
-    ## Setup the PID controllers for steering and throttle.   The steering 
-    ## setpoint is locked to 0 since we'll be feeding in an error number to
-    ## the update function.   
-    steering= PID(.01,.01,.001)
-    throttle = PID(.5,.01,.001)
-    steering.setpoint(0) 
-    throttle.setpoint(speed)
+    ## Setup the PID controllers for steering and throttle, as one bank of
+    ## two.   The steering setpoint is locked to 0 since we'll be feeding
+    ## in an error number to the update function.   
+    controllers = PIDBank(2, P=(.01, .5), I=.01, D=.001)
+    controllers.setpoint((0, speed))
 
 
-    #The main loop that drives to the way point
-    while not there_yet:
+    #The main loop that drives to the way point - returns True once we're there
+    def tick():
 
-        autosave(conn, savetime, partslist)  ##call autosave to see if we should save yet
-        recharge(conn)
+        autosave(ctx, savetime, partslist)  ##call autosave to see if we should save yet
+        recharge(ctx)
 
     ##  Steering control - handles selecting a bearing, comparing it to 
     ##  current heading and feeding that error in degrees to the PID to
@@ -84,17 +88,18 @@ def rover_go(conn, waypoint, speed = 10.0, savetime = 300 ):
         location = latlon(ground_telem.latitude, ground_telem.longitude)
         target_heading = heading_for_latlon(target, location)
         course_correct= course_correction(surf_telem.heading, target_heading)
-        steer_correct = steering.update(course_correct)
-        v.control.wheel_steering= steer_correct
 
         #Throttle control  -  tries to maintain the given speed!
-        v.control.brakes = False
-        throttsetting=   throttle.update(ground_telem.speed)
-        v.control.wheel_throttle = throttsetting
+        steer_correct, throttsetting = controllers.update(
+            (course_correct, ground_telem.speed))
+        ctx.control.wheel_steering= float(steer_correct)
+        ctx.control.brakes = False
+        ctx.control.wheel_throttle = float(throttsetting)
 
         #Check if we're there to end the loop
-        if distance(target, location, v.orbit.body) < 50:
-            there_yet=True
+        return geodesy.distance(location.lat, location.lon, target.lat, target.lon, radius) < 50
+
+    FixedRateLoop(hz).run(tick)
 
 ##############################################################################
 ###  Autosave function.   Saves if the vessel appears stable and isn't already
@@ -106,26 +111,26 @@ def autosave(conn, savetime, partslist):
     if savetime == 0:
         return
     if time.time() - autosave.lastsave > savetime:
-        v=conn.space_center.active_vessel
-        telem=v.flight(v.orbit.body.reference_frame)
-
-        if safetosave(conn , partslist): 
-            v.control.throttle = 0.0  ## Stop the rover then save
-            v.control.brakes = True
-            while telem.speed > 0.01:
-                pass
+        ctx = context_for(conn)
+        telem=ctx.flight(ctx.reference_frame)
+
+        if safetosave(ctx , partslist): 
+            ctx.control.throttle = 0.0  ## Stop the rover then save
+            ctx.control.brakes = True
+            wait_until(ctx.conn, attr(telem, 'speed') <= 0.01)
             time.sleep(.1)  
-            conn.space_center.save('rover_ap')
-            v.control.brakes = False
+            ctx.space_center.save('rover_ap')
+            ctx.control.brakes = False
         autosave.lastsave = time.time()
 
 # function called by autosave to determine if it's safe to save the file!
 # tries to avoid overwriting a good save with one we take AFTER the rover 
 # has crashed or flipped or run into a space tree.
 def safetosave(conn, partslist):
-    v=conn.space_center.active_vessel
-    ground_telem=v.flight(v.orbit.body.reference_frame)
-    surf_telem=v.flight(v.surface_reference_frame)
+    ctx = context_for(conn)
+    v=ctx.vessel
+    ground_telem=ctx.flight(ctx.reference_frame)
+    surf_telem=ctx.flight(ctx.surface_reference_frame)
 
     if ground_telem.speed < .1: # We might be stuck! 
         print("stuck")
@@ -143,64 +148,37 @@ def safetosave(conn, partslist):
 ##  and deploys solar panels until charge is above 85% then resumes travel.
 ##############################################################################
 def recharge(conn):
-    vessel = conn.space_center.active_vessel
-    telem=vessel.flight(vessel.orbit.body.reference_frame)
-    Max_EC = vessel.resources.max('ElectricCharge')
-    EC = vessel.resources.amount('ElectricCharge')
+    ctx = context_for(conn)
+    telem=ctx.flight(ctx.reference_frame)
+    resources = ctx.resources
+    control = ctx.control
+    Max_EC = resources.max('ElectricCharge')
+    EC = resources.amount('ElectricCharge')
     if EC / Max_EC < .05:   #less than 5% charge - Stop the rover
-        vessel.control.wheel_throttle = 0
-        vessel.control.brakes = True
-        while telem.speed > 0.01:
-                pass
-        vessel.control.solar_panels = True
-        while EC / Max_EC < .85:   #less than 85% charge
-            Max_EC = vessel.resources.max('ElectricCharge')
-            EC = vessel.resources.amount('ElectricCharge')
-        vessel.control.solar_panels = False  ##pack up and get moving again
-        vessel.control.brakes = False
+        control.wheel_throttle = 0
+        control.brakes = True
+        wait_until(ctx.conn, attr(telem, 'speed') <= 0.01)
+        control.solar_panels = True
+        wait_until(ctx.conn, Value(resources.amount, 'ElectricCharge', kind='float')
+                   >= .85 * Max_EC)   #charge back up to 85%
+        control.solar_panels = False  ##pack up and get moving again
+        control.brakes = False
         
 
 ##############################################################################
 ##  Navigation Math Functions
 ##############################################################################
+##  These work on one point at a time - see geodesy.py for the same math
+##  over whole arrays of points.
 def heading_for_latlon(target, location):
-
-    lat1 = math.radians(location.lat)
-    lat2 = math.radians(target.lat)
-
-    diffLong = math.radians(target.lon - location.lon)
-
-    x = math.sin(diffLong) * math.cos(lat2)
-    y = math.cos(lat1) * math.sin(lat2) - (math.sin(lat1)
-            * math.cos(lat2) * math.cos(diffLong))
-
-    initial_bearing = math.atan2(x, y)
-
-    initial_bearing = math.degrees(initial_bearing)
-    compass_bearing = (initial_bearing + 360) % 360
-
-    return compass_bearing
+    return geodesy.initial_bearing(location.lat, location.lon, target.lat, target.lon)
 
 def distance(target, location, body):
-  R = body.equatorial_radius # Earth radius in kilometers
- 
-  dLat = radians(target.lat - location.lat)
-  dLon = radians(target.lon - location.lon)
-  lat1 = radians(location.lat)
-  lat2 = radians(target.lat)
- 
-  a = sin(dLat/2)**2 + cos(lat1)*cos(lat2)*sin(dLon/2)**2
-  c = 2*asin(sqrt(a))
- 
-  return R * c
+    return geodesy.distance(location.lat, location.lon, target.lat, target.lon,
+                            body.equatorial_radius)
 
 def course_correction(myheading, targetbearing):
-    unadjusted= targetbearing-myheading
-    if unadjusted < -180:
-        return unadjusted +360
-    if unadjusted > 180:
-        return unadjusted -360
-    return unadjusted
+    return geodesy.bearing_difference(myheading, targetbearing)
 
 
 # ----------------------------------------------------------------------------
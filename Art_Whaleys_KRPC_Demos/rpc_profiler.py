@@ -0,0 +1,257 @@
+######################################################################
+### RPC Call Profiler Library and Example
+######################################################################
+###   Like all of the scripts in my folder here, this file contains
+###   functions you might want to include into your own scripts for
+###   actual use and a demo in the 'main' function that you can just
+###   run to see how it works.
+###
+###   Every property you read from a kRPC object is a round trip to the
+###   game, and a control loop that reads a dozen of them every tick can
+###   spend most of its time waiting on the network.  The RPCProfiler
+###   below wraps a connection and counts every remote procedure call by
+###   name, keeps a latency histogram for each, and attributes the calls
+###   to the control loop iteration and flight phase they happened in.
+###
+###   It is opt-in and needs no changes to the code being measured:
+###
+###       profiler = RPCProfiler(conn)
+###       profiler.start_phase('gravity turn')
+###       while climbing:
+###           profiler.iteration()
+###           ...
+###       print(profiler.report())
+###
+###   The demo in main profiles the launch script's ascent.
+######################################################################
+
+import bisect
+import collections
+import contextlib
+import threading
+import time
+
+_clock = getattr(time, 'monotonic', time.time)
+
+# Histogram bucket upper bounds in seconds - four per decade, 10us to 10s
+BUCKETS = tuple(10 ** (k / 4.0) for k in range(-20, 5))
+
+
+class CallStats(object):
+    '''
+    Count, total time and latency histogram for one procedure.
+    '''
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.worst = 0.0
+        self.histogram = [0] * (len(BUCKETS) + 1)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.worst = max(self.worst, seconds)
+        self.histogram[bisect.bisect_left(BUCKETS, seconds)] += 1
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, fraction):
+        '''
+        upper bound of the histogram bucket holding the given fraction of calls
+        '''
+        wanted = fraction * self.count
+        seen = 0
+        for i, n in enumerate(self.histogram):
+            seen += n
+            if n and seen >= wanted:
+                return BUCKETS[i] if i < len(BUCKETS) else self.worst
+        return 0.0
+
+
+class PhaseStats(object):
+    def __init__(self, name):
+        self.name = name
+        self.iterations = 0
+        self.calls = collections.defaultdict(CallStats)
+        self.start = _clock()
+        self.elapsed = 0.0
+        self.tick_calls = 0      # calls in the open iteration
+        self.flushed = None      # where flush() put it in iteration_calls
+
+    @property
+    def call_count(self):
+        return sum(s.count for s in self.calls.values())
+
+    @property
+    def rpc_time(self):
+        return sum(s.total for s in self.calls.values())
+
+
+class RPCProfiler(object):
+    '''
+    Counts and times every remote procedure call made on a connection.
+
+    Works by wrapping conn._invoke, the single method every call (and
+    every stream creation) passes through in the krpc python client -
+    and in krpc_sim.  Call detach() to put the connection back.
+    '''
+    def __init__(self, conn, attach=True):
+        self.conn = conn
+        self.phases = collections.OrderedDict()
+        self.phase = None
+        self.iteration_calls = []  # (phase name, iteration, calls) per tick
+        self._lock = threading.Lock()
+        self._original = None
+        self.start_phase('setup')
+        if attach:
+            self.attach()
+
+    def attach(self):
+        if self._original is not None:
+            return
+        self._original = self.conn._invoke
+        original = self._original
+
+        def invoke(service, procedure, *args, **kwargs):
+            start = _clock()
+            try:
+                return original(service, procedure, *args, **kwargs)
+            finally:
+                self.record('{}.{}'.format(service, procedure), _clock() - start)
+
+        self.conn._invoke = invoke
+
+    def detach(self):
+        if self._original is not None:
+            self.conn._invoke = self._original
+            self._original = None
+        self.phase.elapsed = _clock() - self.phase.start
+        self.flush()
+
+    def record(self, name, seconds):
+        with self._lock:
+            self.phase.calls[name].add(seconds)
+            self.phase.tick_calls += 1
+
+    def start_phase(self, name):
+        '''
+        attribute the calls from now on to the named phase
+        '''
+        with self._lock:
+            if self.phase is not None:
+                self.phase.elapsed = _clock() - self.phase.start
+            if name not in self.phases:
+                self.phases[name] = PhaseStats(name)
+            self.phase = self.phases[name]
+            self.phase.start = _clock() - self.phase.elapsed
+
+    @contextlib.contextmanager
+    def phase_of(self, name):
+        previous = self.phase.name
+        self.start_phase(name)
+        try:
+            yield self.phase
+        finally:
+            self.start_phase(previous)
+
+    def iteration(self):
+        '''
+        call once at the top of every control loop iteration
+        '''
+        with self._lock:
+            phase = self.phase
+            if phase.iterations:
+                self._close(phase)
+            phase.iterations += 1
+            phase.tick_calls = 0
+            phase.flushed = None
+
+    def flush(self):
+        '''
+        adds each phase's still open iteration to iteration_calls - the
+        last tick of a loop has no iteration() after it.  detach() and
+        report() call this; a later iteration() updates the entry.
+        '''
+        with self._lock:
+            for phase in self.phases.values():
+                if phase.iterations:
+                    self._close(phase)
+
+    def _close(self, phase):
+        entry = (phase.name, phase.iterations, phase.tick_calls)
+        if phase.flushed is None:
+            phase.flushed = len(self.iteration_calls)
+            self.iteration_calls.append(entry)
+        else:
+            self.iteration_calls[phase.flushed] = entry
+
+    def total_calls(self):
+        return sum(p.call_count for p in self.phases.values())
+
+    def report(self, top=10):
+        '''
+        returns a text report of the hottest calls in each phase
+        '''
+        self.phase.elapsed = _clock() - self.phase.start
+        self.flush()
+        lines = []
+        for phase in self.phases.values():
+            if not phase.call_count:
+                continue
+            lines.append('=' * 78)
+            summary = '{}: {} calls, {:.2f}s in RPCs of {:.2f}s'.format(
+                phase.name, phase.call_count, phase.rpc_time, phase.elapsed)
+            if phase.iterations:
+                summary += ', {} iterations, {:.1f} calls/iteration'.format(
+                    phase.iterations, float(phase.call_count) / phase.iterations)
+            lines.append(summary)
+            lines.append('{:<44}{:>7}{:>7}{:>7}{:>6}{:>6}'.format(
+                'procedure', 'calls', '/iter', 'ms', 'p50', 'p95'))
+            hottest = sorted(phase.calls.items(), key=lambda kv: -kv[1].total)
+            for name, stats in hottest[:top]:
+                lines.append('{:<44}{:>7}{:>7.1f}{:>7.1f}{:>6.1f}{:>6.1f}'.format(
+                    name[:43], stats.count,
+                    float(stats.count) / phase.iterations if phase.iterations else 0.0,
+                    stats.total * 1000, stats.percentile(.5) * 1000,
+                    stats.percentile(.95) * 1000))
+        return '\n'.join(lines)
+
+
+class NullProfiler(object):
+    '''
+    Stands in when no profiler is wanted, so instrumented loops don't
+    need an if around every call.
+    '''
+    def start_phase(self, name):
+        pass
+
+    @contextlib.contextmanager
+    def phase_of(self, name):
+        yield None
+
+    def iteration(self):
+        pass
+
+
+##############################################################################
+## Main  -- only run when we execute this file directly.  Profiles the
+##          launch script.   Run krpc_sim.install() first to profile it
+##          against the simulator instead of the game.
+##############################################################################
+def main():
+    import krpc
+    from Simple_Launch_Script import ascent, MissionParameters
+
+    conn = krpc.connect(name='Profiler')
+    profiler = RPCProfiler(conn)
+    try:
+        ascent(conn, MissionParameters(), profiler)
+    finally:
+        profiler.detach()
+        print(profiler.report())
+
+
+if __name__ == '__main__':
+    main()
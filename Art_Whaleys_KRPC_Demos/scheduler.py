@@ -0,0 +1,182 @@
+######################################################################
+### Fixed Rate Control Loop Library and Example
+######################################################################
+###   Like all of the scripts in my folder here, this file contains
+###   functions you might want to include into your own scripts for
+###   actual use and a demo in the 'main' function that you can just
+###   run to see how it works.
+###
+###   A control loop paced with time.sleep(.1) after its work doesn't run
+###   at 10 Hz - it runs at 1 / (.1 + however long the RPCs took), and
+###   that changes every tick.  A loop with no sleep at all runs as fast
+###   as the network allows and spends most of that traffic on readings
+###   that haven't changed since the last physics tick.
+###
+###   FixedRateLoop runs a tick function on a fixed schedule instead.
+###   Deadlines are kept on a monotonic clock and counted from the start
+###   of the loop, so one slow tick doesn't push every later tick back.
+###   When a tick runs over a whole period, the missed ticks are skipped
+###   rather than run back to back.  It keeps count of all of that in a
+###   LoopStats, so you can see whether your loop keeps up:
+###
+###       loop = FixedRateLoop(20)
+###       loop.run(tick)          # tick() returns True when it's done
+###       print(loop.stats.summary())
+###
+###   Pass ut= a stream of space_center.ut to also wait for the game's
+###   clock to move before each tick, so each tick sees new physics.
+######################################################################
+
+import math
+import time
+
+_clock = getattr(time, 'monotonic', time.time)
+
+
+class LoopStats(object):
+    '''
+    Timing record of a FixedRateLoop.
+
+    lateness is how far past its deadline a tick started, overruns counts
+    ticks that took longer than one period, and skipped counts deadlines
+    dropped to catch up after an overrun.
+    '''
+    def __init__(self, hz):
+        self.hz = hz
+        self.ticks = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.total_lateness = 0.0
+        self.worst_lateness = 0.0
+        self.total_busy = 0.0
+        self.worst_busy = 0.0
+        self.start = None
+        self.elapsed = 0.0
+
+    def add(self, lateness, busy, period):
+        self.ticks += 1
+        self.total_lateness += lateness
+        self.worst_lateness = max(self.worst_lateness, lateness)
+        self.total_busy += busy
+        self.worst_busy = max(self.worst_busy, busy)
+        if busy > period:
+            self.overruns += 1
+
+    @property
+    def mean_lateness(self):
+        return self.total_lateness / self.ticks if self.ticks else 0.0
+
+    @property
+    def achieved_hz(self):
+        return self.ticks / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def load(self):
+        '''
+        fraction of the loop's time spent inside the tick function
+        '''
+        return self.total_busy / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        return ('{} ticks at {:.1f} Hz (target {:.1f}), {} overruns, {} skipped, '
+                'jitter {:.1f} ms mean {:.1f} ms worst, load {:.0%}').format(
+                    self.ticks, self.achieved_hz, self.hz, self.overruns,
+                    self.skipped, self.mean_lateness * 1000,
+                    self.worst_lateness * 1000, self.load)
+
+
+class FixedRateLoop(object):
+    '''
+    Runs a tick function hz times a second.
+
+    loop = FixedRateLoop(hz, ut=None)
+    loop.run(tick)
+
+    tick is called with no arguments and the loop ends when it returns
+    anything true - True, a numpy.bool_, a non-zero number - or when
+    stop() is called.  Returning None (falling off the end) or anything
+    false keeps it going.  run() returns the loop's LoopStats.
+
+    ut is an optional callable returning the game's universal time -
+    normally conn.add_stream(getattr, conn.space_center, 'ut').  With it
+    each tick also waits until ut has changed since the previous tick.
+    '''
+    def __init__(self, hz, ut=None, clock=_clock, sleep=time.sleep):
+        self.hz = float(hz)
+        self.period = 1.0 / self.hz
+        self.ut = ut
+        self.clock = clock
+        self.sleep = sleep
+        self.stats = LoopStats(self.hz)
+        self.running = False
+        self.last_ut = None
+
+    def stop(self):
+        self.running = False
+
+    def run(self, tick):
+        self.running = True
+        self.stats.start = start = self.clock()
+        deadline = start
+        try:
+            while self.running:
+                self._wait_until(deadline)
+                if not self.running:
+                    break
+                began = self.clock()
+                done = tick()
+                finished = self.clock()
+                self.stats.add(max(0.0, began - deadline), finished - began, self.period)
+                if done:
+                    break
+                deadline += self.period
+                if finished > deadline:
+                    # drop the deadlines we've already missed instead of
+                    # running a burst of back to back ticks
+                    missed = int(math.floor((finished - deadline) / self.period))
+                    self.stats.skipped += missed
+                    deadline += missed * self.period
+        finally:
+            self.running = False
+            self.stats.elapsed = self.clock() - start
+        return self.stats
+
+    def _wait_until(self, deadline):
+        remaining = deadline - self.clock()
+        if remaining > 0:
+            self.sleep(remaining)
+        if self.ut is None:
+            return
+        # poll the (free) stream until the game clock ticks over
+        poll = min(self.period / 10.0, 0.005)
+        ut = self.ut()
+        while ut == self.last_ut and self.running:
+            self.sleep(poll)
+            ut = self.ut()
+        self.last_ut = ut
+
+
+##############################################################################
+## Main  -- only run when we execute this file directly.  Logs the active
+##          vessel's altitude at 5 Hz, lined up with the game clock, for
+##          ten seconds and reports how well the loop kept time.
+##############################################################################
+def main():
+    import krpc
+
+    conn = krpc.connect(name='Fixed Rate Loop')
+    sc = conn.space_center
+    flight = sc.active_vessel.flight()
+    ut = conn.add_stream(getattr, sc, 'ut')
+    end = ut() + 10
+
+    def tick():
+        print('UT {:10.2f}   altitude {:10.1f}'.format(ut(), flight.mean_altitude))
+        return ut() >= end
+
+    loop = FixedRateLoop(5, ut=ut)
+    print(loop.run(tick).summary())
+
+
+if __name__ == '__main__':
+    main()
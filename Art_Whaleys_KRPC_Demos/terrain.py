@@ -0,0 +1,346 @@
+######################################################################
+### Terrain Height Cache Library and Example
+######################################################################
+###   Like all of the scripts in my folder here, this file contains
+###   functions you might want to include into your own scripts for
+###   actual use and a demo in the 'main' function that you can just
+###   run to see how it works.
+###
+###   body.surface_height(lat, lon) is a round trip to the game for
+###   every single point, and the answer never changes - terrain doesn't
+###   move.  A TerrainCache remembers every height it has asked for:
+###
+###       terrain = terrain_cache(body)       # one shared cache per body
+###       terrain.height(lat, lon)            # numbers or numpy arrays
+###
+###   height() gives the height at exactly the points asked for.  Ones
+###   it hasn't seen before cost one round trip each, all fetched in one
+###   batch, and cost nothing the next time.  kRPC has no way to ask for
+###   many heights in one call, so there's nothing cheaper to do on a
+###   miss than ask for just the points wanted.
+###
+###   For ground that has been surveyed ahead of time there's also a
+###   regular latitude / longitude grid of heights, kept in square
+###   tiles: interpolated_height() answers any point from the four grid
+###   heights around it, prefetch() fills whole tiles for a region, and
+###   when there are more than max_tiles tiles the least recently used
+###   ones are dropped.  Give a cache a store (see heightmap.py) and grid
+###   heights it doesn't have are looked for there before asking the
+###   game, and anything it does ask the game for is kept there.
+###   height() uses the grid too, for points that are exactly on it.
+###   Interpolation smooths peaks and hollows smaller than the grid
+###   (0.01 degrees is ~35m on the Mun and ~105m on Kerbin), so don't
+###   use it where the exact height matters.
+###
+###   highest() finds the highest ground between two points, looking
+###   closer only where higher ground could still be hiding.  With a
+###   store it looks at the grid points nearest the line, so ground
+###   that has been surveyed costs no round trips.
+######################################################################
+
+import collections
+
+import numpy as np
+
+import geodesy
+from geodesy import normalize_longitude
+
+_caches = {}
+
+TerrainProfile = collections.namedtuple('TerrainProfile', 'height lat lon bound lookups fetched')
+
+
+def terrain_cache(body):
+    '''
+    returns the TerrainCache shared by everything flying over body
+    '''
+    if body not in _caches:
+        _caches[body] = TerrainCache(body)
+    return _caches[body]
+
+
+def grid_columns(lon1, lon2, resolution, extra=0):
+    '''
+    grid columns from one longitude to the other the short way round -
+    wrapped at the antimeridian when that way crosses it - plus extra
+    columns on the east end
+    '''
+    ncols = int(round(360.0 / resolution))
+    west, east = sorted(int(np.floor(normalize_longitude(lon) / resolution)) for lon in (lon1, lon2))
+    if east - west > ncols // 2:
+        west, east = east, west + ncols
+    return (np.arange(west, east + 1 + extra) + ncols // 2) % ncols - ncols // 2
+
+
+class TerrainCache(object):
+    '''
+    Interpolated, tiled, LRU bounded cache of one body's surface heights.
+
+    Exact heights are kept for up to max_points points, least recently
+    used dropped first.  resolution is the grid spacing in degrees,
+    tile_size the number of grid points along each side of a tile.
+    fetch(lats, lons), if given, replaces body.surface_height as the
+    source of heights - it gets two arrays and returns an array of
+    heights.  store, if given, is a heightmap.HeightmapStore on the same
+    grid.
+
+    lookups, loaded, fetched and evicted count the points asked for,
+    the grid heights read from the store, the heights fetched from the
+    game (one round trip each) and the tiles dropped.
+
+    radius is the body's radius in meters, for highest() - it's asked
+    for the first time it's needed if not given.
+    '''
+    def __init__(self, body, resolution=0.01, tile_size=16, max_tiles=512, fetch=None,
+                 store=None, radius=None, max_points=100000):
+        self.body = body
+        self.max_points = max_points
+        self.points = collections.OrderedDict()  # (lat, lon) -> height
+        self._radius = radius
+        self.resolution = float(resolution)
+        self.tile_size = tile_size
+        self.max_tiles = max_tiles
+        self.fetch = fetch or self._fetch_from_body
+        self.store = store
+        self.tiles = collections.OrderedDict()   # (tile row, tile col) -> heights, NaN if unknown
+        self.lookups = 0
+        self.loaded = 0
+        self.fetched = 0
+        self.evicted = 0
+
+    @property
+    def radius(self):
+        if self._radius is None:
+            self._radius = self.body.equatorial_radius
+        return self._radius
+
+    def _fetch_from_body(self, lats, lons):
+        return np.array([self.body.surface_height(float(lat), float(lon))
+                         for lat, lon in zip(lats, lons)])
+
+    def height(self, lat, lon):
+        '''
+        terrain height at exactly lat, lon.  Takes numbers or arrays and
+        returns the same.  Points that aren't cached are fetched in one
+        batch, a round trip each - except ones on the grid, which come
+        from the tiles or the store if they're there (and are written to
+        the store if not).
+        '''
+        lat, keys = self._keys(lat, lon)
+        missing = sorted(set(key for key in keys if key not in self.points))
+        if missing:
+            lats, lons = (np.array(a) for a in zip(*missing))
+            heights = np.empty(len(missing))
+            i, j, on_grid = self._on_grid(lats, lons)
+            if on_grid.any():
+                heights[on_grid] = self.grid(i[on_grid], j[on_grid])
+            if not on_grid.all():
+                heights[~on_grid] = self.fetch(lats[~on_grid], lons[~on_grid])
+                self.fetched += int((~on_grid).sum())
+            for key, h in zip(missing, heights):
+                self.points[key] = float(h)
+        heights = np.array([self._point(key) for key in keys]).reshape(lat.shape)
+        while len(self.points) > self.max_points:
+            self.points.popitem(last=False)
+        self.lookups += heights.size
+        return float(heights) if heights.ndim == 0 else heights
+
+    def cached(self, lat, lon):
+        '''
+        True for each point height() already has - asking for those
+        costs nothing
+        '''
+        lat, keys = self._keys(lat, lon)
+        return np.array([key in self.points for key in keys], dtype=bool).reshape(lat.shape)
+
+    def _keys(self, lat, lon):
+        lat, lon = np.broadcast_arrays(np.asarray(lat, dtype=float),
+                                       np.asarray(normalize_longitude(lon), dtype=float))
+        # rounded so the same point always makes the same key
+        return lat, list(zip(np.round(lat.ravel(), 9).tolist(), np.round(lon.ravel(), 9).tolist()))
+
+    def _on_grid(self, lats, lons):
+        '''
+        grid rows and columns nearest each point, and which points are
+        on them
+        '''
+        x = lats / self.resolution
+        y = normalize_longitude(lons) / self.resolution
+        i = np.round(x).astype(int)
+        j = np.round(y).astype(int)
+        return i, j, (np.abs(x - i) < 1e-6) & (np.abs(y - j) < 1e-6)
+
+    def _point(self, key):
+        h = self.points.pop(key)
+        self.points[key] = h      # newest at the end
+        return h
+
+    def interpolated_height(self, lat, lon):
+        '''
+        terrain height at lat, lon - bilinear between the grid heights.
+        Takes numbers or arrays and returns the same.
+        '''
+        lat = np.asarray(lat, dtype=float)
+        x = lat / self.resolution
+        y = normalize_longitude(lon) / self.resolution
+        x, y = np.broadcast_arrays(x, y)
+        i = np.floor(x).astype(int)
+        j = np.floor(y).astype(int)
+        fx = x - i
+        fy = y - j
+        corners = self.grid(np.stack([i, i, i + 1, i + 1]), np.stack([j, j + 1, j, j + 1]))
+        heights = ((corners[0] * (1 - fy) + corners[1] * fy) * (1 - fx)
+                   + (corners[2] * (1 - fy) + corners[3] * fy) * fx)
+        self.lookups += heights.size
+        return float(heights) if heights.ndim == 0 else heights
+
+    def highest(self, lat1, lon1, lat2, lon2, tolerance=10.0, segments=8,
+                min_spacing=10.0, slope_factor=1.5, max_lookups=500, snap=None):
+        '''
+        Highest terrain along the great circle between two points, as a
+        TerrainProfile: the highest height sampled and where, an
+        estimated upper bound on the height anywhere along the way, the
+        number of heights looked up and how many of those were fetched
+        from the game - the round trips it cost.
+
+        It starts with segments evenly spaced pieces.  Between two
+        heights a segment can't rise higher than the ground's steepness
+        allows - estimated from that segment and its neighbours, times
+        slope_factor - so each pass splits only the segments that could
+        still hide ground more than tolerance meters above the highest
+        found, which puts the lookups around peaks and steep slopes.  It
+        stops when none could, or segments are down to min_spacing
+        meters, or it has used max_lookups heights.
+
+        With snap (the default when there's a store) each height is
+        taken at the grid point nearest the line instead, and segments
+        stop at the grid spacing - within half a grid cell of the line,
+        but still exact heights, and free over surveyed ground.
+        '''
+        if snap is None:
+            snap = self.store is not None
+        if snap:
+            min_spacing = max(min_spacing, np.radians(self.resolution) * self.radius)
+
+        def along(t):
+            lat, lon = geodesy.interpolate(lat1, lon1, lat2, lon2, t)
+            if snap:
+                lat = np.round(np.asarray(lat) / self.resolution) * self.resolution
+                lon = np.round(normalize_longitude(lon) / self.resolution) * self.resolution
+            return lat, lon
+
+        length = geodesy.distance(lat1, lon1, lat2, lon2, self.radius)
+        fetched = self.fetched
+        t = np.linspace(0.0, 1.0, segments + 1)
+        h = np.atleast_1d(self.height(*along(t)))
+        lookups = t.size
+        while True:
+            span = np.diff(t) * length
+            grade = np.abs(np.diff(h)) / np.maximum(span, 1e-9)
+            padded = np.concatenate([grade[:1], grade, grade[-1:]])
+            steepest = slope_factor * np.maximum(np.maximum(padded[:-2], padded[1:-1]), padded[2:])
+            ceiling = (h[:-1] + h[1:]) / 2 + steepest * span / 2
+            best = h.max()
+            split = np.nonzero((ceiling > best + tolerance) & (span > min_spacing))[0]
+            budget = max_lookups - lookups
+            if not split.size or budget <= 0:
+                break
+            split = split[np.argsort(-ceiling[split])][:budget]   # most promising first
+            mids = (t[split] + t[split + 1]) / 2
+            heights = np.atleast_1d(self.height(*along(mids)))
+            lookups += mids.size
+            order = np.argsort(np.concatenate([t, mids]), kind='mergesort')
+            t = np.concatenate([t, mids])[order]
+            h = np.concatenate([h, heights])[order]
+        k = np.argmax(h)
+        lat, lon = along(t[k])
+        return TerrainProfile(float(h[k]), float(lat), float(lon), float(max(h[k], ceiling.max())), lookups,
+                              self.fetched - fetched)
+
+    def grid(self, i, j):
+        '''
+        heights at grid rows i, columns j (integer arrays), fetching any
+        that aren't cached yet in a single batch
+        '''
+        n = self.tile_size
+        i = np.asarray(i)
+        j = np.asarray(j)
+        flat_i = i.ravel()
+        flat_j = j.ravel()
+        keys = list(zip((flat_i // n).tolist(), (flat_j // n).tolist()))
+        tiles = dict((key, self._tile(key)) for key in set(keys))
+        rows = (flat_i % n).tolist()
+        cols = (flat_j % n).tolist()
+
+        values = np.array([tiles[key][r, c] for key, r, c in zip(keys, rows, cols)])
+        missing = np.isnan(values)
+        if missing.any():
+            points = sorted(set(zip(flat_i[missing].tolist(), flat_j[missing].tolist())))
+            rows_to_fetch, cols_to_fetch = (np.array(a) for a in zip(*points))
+            heights = np.full(len(points), np.nan)
+            if self.store is not None:
+                heights = self.store.read(rows_to_fetch, cols_to_fetch)
+                self.loaded += int((~np.isnan(heights)).sum())
+            unknown = np.isnan(heights)
+            if unknown.any():
+                heights[unknown] = self.fetch(rows_to_fetch[unknown] * self.resolution,
+                                              cols_to_fetch[unknown] * self.resolution)
+                self.fetched += int(unknown.sum())
+                if self.store is not None:
+                    self.store.write(rows_to_fetch[unknown], cols_to_fetch[unknown],
+                                     heights[unknown])
+            for (r, c), h in zip(points, heights):
+                tiles[(r // n, c // n)][r % n, c % n] = h
+            values = np.array([tiles[key][r, c] for key, r, c in zip(keys, rows, cols)])
+        self._evict()
+        return values.reshape(i.shape)
+
+    def prefetch(self, lat1, lon1, lat2, lon2):
+        '''
+        fills every tile overlapping the box between the two corners,
+        taking the short way round in longitude
+        '''
+        n = self.tile_size
+        r1, r2 = sorted(int(np.floor(lat / self.resolution)) // n for lat in (lat1, lat2))
+        columns = np.unique(grid_columns(lon1, lon2, self.resolution) // n)
+        i, j = np.meshgrid(np.arange(r1 * n, (r2 + 1) * n),
+                           (columns[:, None] * n + np.arange(n)).ravel(), indexing='ij')
+        self.grid(i, j)
+
+    def _tile(self, key):
+        tile = self.tiles.pop(key, None)
+        if tile is None:
+            tile = np.full((self.tile_size, self.tile_size), np.nan)
+        self.tiles[key] = tile    # newest at the end
+        return tile
+
+    def _evict(self):
+        while len(self.tiles) > self.max_tiles:
+            self.tiles.popitem(last=False)
+            self.evicted += 1
+
+
+##############################################################################
+## Main  -- only run when we execute this file directly.  Looks up the
+##          terrain around the active vessel twice, to show that the
+##          second pass costs no round trips.
+##############################################################################
+def main():
+    import krpc
+
+    conn = krpc.connect(name='Terrain Cache')
+    vessel = conn.space_center.active_vessel
+    body = vessel.orbit.body
+    flight = vessel.flight(body.reference_frame)
+    lat, lon = flight.latitude, flight.longitude
+    terrain = terrain_cache(body)
+
+    lats, lons = np.mgrid[lat - .05:lat + .05:11j, lon - .05:lon + .05:11j]
+    for attempt in range(2):
+        heights = terrain.height(lats, lons)
+        print('pass {}: highest {:.0f}m lowest {:.0f}m, {} heights fetched so far'.format(
+            attempt + 1, heights.max(), heights.min(), terrain.fetched))
+
+
+if __name__ == '__main__':
+    main()
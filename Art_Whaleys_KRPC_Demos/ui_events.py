@@ -0,0 +1,148 @@
+######################################################################
+### UI Button Events Library and Example
+######################################################################
+###   Like all of the scripts in my folder here, this file contains
+###   functions you might want to include into your own scripts for
+###   actual use and a demo in the 'main' function that you can just
+###   run to see how it works.
+###
+###   The usual way to wait for an on-screen button is
+###
+###       while True:
+###           if button_clicked():
+###               ...
+###
+###   which keeps a CPU core flat out forever to watch one stream, and
+###   only gets harder to read with more buttons.  A ButtonDispatcher
+###   watches any number of buttons, on any panels, with a callback on
+###   each one's clicked stream.  The callbacks just queue the click, and
+###   one thread - whichever calls run() - sleeps on that queue and
+###   runs the handlers one at a time:
+###
+###       buttons = ButtonDispatcher(conn)
+###       buttons.add(go_button, execute_next_node, conn)
+###       buttons.add(quit_button, lambda: True)
+###       buttons.run()        # until a handler returns True
+###
+###   Handlers run on the thread that called run(), not the stream
+###   thread, so they can make calls and take as long as they like.
+######################################################################
+
+import threading
+
+try:
+    import queue
+except ImportError:     # python 2
+    import Queue as queue
+
+
+class ButtonDispatcher(object):
+    '''
+    Runs a handler whenever one of a set of UI buttons is clicked.
+
+    add(button, handler, *args) calls handler(*args) for each click of
+    button - the button's clicked flag is reset first, so a click
+    during a long handler isn't lost.  run() dispatches clicks until a
+    handler returns True or stop() is called.  close() removes the
+    streams.
+    '''
+    def __init__(self, conn):
+        self.conn = conn
+        self.clicks = queue.Queue()
+        self.buttons = {}       # button -> (stream, handler, args)
+        self.queued = set()     # buttons with a click waiting in clicks
+        self.lock = threading.Lock()
+        self.dispatched = 0
+
+    def add(self, button, handler, *args):
+        stream = self.conn.add_stream(getattr, button, 'clicked')
+        with self.lock:
+            self.buttons[button] = (stream, handler, args)
+        stream.add_callback(lambda clicked: clicked and self._queue(button))
+        if stream():        # clicked before we were watching
+            self._queue(button)
+        return button
+
+    def _queue(self, button):
+        '''
+        queues a click unless one is already waiting - the callback and
+        the check in add() can both see the same click
+        '''
+        with self.lock:
+            if button in self.queued:
+                return
+            self.queued.add(button)
+        self.clicks.put(button)
+
+    def remove(self, button):
+        with self.lock:
+            stream, _, _ = self.buttons.pop(button)
+        stream.remove()
+
+    def stop(self):
+        '''
+        ends run() once the handler running now (if any) returns - safe
+        to call from any thread
+        '''
+        self.clicks.put(None)
+
+    def run(self, timeout=None):
+        '''
+        Dispatches clicks until a handler returns True, stop() is called
+        or, if timeout is given, no click comes for timeout seconds.
+        Returns the number of clicks handled.
+        '''
+        handled = 0
+        while True:
+            try:
+                button = self.clicks.get(timeout=timeout)
+            except queue.Empty:
+                return handled
+            if button is None:
+                return handled
+            with self.lock:
+                self.queued.discard(button)
+                entry = self.buttons.get(button)
+            if entry is None:
+                continue        # removed while the click was queued
+            _, handler, args = entry
+            button.clicked = False
+            handled += 1
+            self.dispatched += 1
+            if handler(*args) is True:
+                return handled
+
+    def close(self):
+        for button in list(self.buttons):
+            self.remove(button)
+
+
+##############################################################################
+## Main  -- only run when we execute this file directly.  A small panel
+##          with three buttons that report clicks until Quit is pressed.
+##############################################################################
+def main():
+    import krpc
+
+    conn = krpc.connect(name='UI Buttons')
+    canvas = conn.ui.stock_canvas
+    panel = canvas.add_panel()
+    panel.rect_transform.size = (120, 110)
+    panel.rect_transform.position = (130 - (canvas.rect_transform.size[0] / 2), 0)
+
+    buttons = ButtonDispatcher(conn)
+    for k, name in enumerate(('Hello', 'World')):
+        button = panel.add_button(name)
+        button.rect_transform.position = (0, 35 - 35 * k)
+        buttons.add(button, lambda name=name: conn.ui.message('{} clicked'.format(name)))
+    quit_button = panel.add_button('Quit')
+    quit_button.rect_transform.position = (0, -35)
+    buttons.add(quit_button, lambda: True)
+
+    print('{} clicks handled'.format(buttons.run()))
+    buttons.close()
+    panel.remove()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+######################################################################
+### Vessel Context Library
+######################################################################
+###   Getting anything useful out of kRPC usually starts with a chain
+###   like conn.space_center.active_vessel.orbit.body.reference_frame,
+###   and every link in that chain is a round trip to the game.  Helper
+###   functions that take a connection and resolve the chain themselves
+###   pay for it again on every call - often several times a tick.
+###
+###   A VesselContext resolves those handles once and keeps them.  It
+###   watches the active vessel with a stream and drops everything it
+###   has cached when that changes, so it stays correct across vessel
+###   switches.  Call invalidate() yourself after anything else that
+###   changes the handles, such as leaving a body's sphere of influence.
+###
+###   Helpers that used to take a connection can take a context
+###   instead - or still take the connection - by starting with
+###
+###       ctx = context_for(conn)
+###
+###   which returns the one shared context for that connection.  Pass
+###   context_for(conn, vessel) for a vessel that may not be the active
+###   one - that gets a context of its own that always means that vessel.
+######################################################################
+
+
+def context_for(conn, vessel=None):
+    '''
+    returns the shared VesselContext for a connection, or the argument
+    itself if it is already a context, so helpers can take either one.
+    With a vessel, returns the context for that vessel instead - the
+    argument itself if it's already that vessel's context.
+    '''
+    if isinstance(conn, VesselContext):
+        if vessel is None or vessel == conn.vessel:
+            return conn
+        conn = conn.conn
+    # kept on the connection itself, so they go when it does - a module
+    # level dict would keep every connection alive through its contexts
+    contexts = getattr(conn, '_vessel_contexts', None)
+    if contexts is None:
+        contexts = conn._vessel_contexts = {}
+    ctx = contexts.get(vessel)
+    if ctx is None:
+        ctx = contexts[vessel] = VesselContext(conn, vessel)
+    return ctx
+
+
+class VesselContext(object):
+    '''
+    Cached proxy handles for the active vessel, or for vessel if one is
+    given.
+
+    ctx.vessel costs no round trip (it is read from a stream) and every
+    other handle is fetched the first time it is asked for, then reused
+    until the active vessel changes.
+    '''
+    def __init__(self, conn, vessel=None):
+        self.conn = conn
+        self.space_center = conn.space_center
+        self._active_vessel = None
+        if vessel is None:
+            self._active_vessel = conn.add_stream(getattr, self.space_center, 'active_vessel')
+        self._fixed = vessel
+        self._vessel = vessel
+        self._handles = {}
+
+    @property
+    def vessel(self):
+        if self._active_vessel is None:
+            return self._fixed
+        active = self._active_vessel()
+        if active != self._vessel:
+            self._vessel = active
+            self._handles = {}
+        return active
+
+    def _cached(self, key, fetch):
+        vessel = self.vessel
+        if key not in self._handles:
+            self._handles[key] = fetch(vessel)
+        return self._handles[key]
+
+    @property
+    def orbit(self):
+        return self._cached('orbit', lambda v: v.orbit)
+
+    @property
+    def body(self):
+        return self._cached('body', lambda v: self.orbit.body)
+
+    @property
+    def control(self):
+        return self._cached('control', lambda v: v.control)
+
+    @property
+    def auto_pilot(self):
+        return self._cached('auto_pilot', lambda v: v.auto_pilot)
+
+    @property
+    def resources(self):
+        return self._cached('resources', lambda v: v.resources)
+
+    @property
+    def reference_frame(self):
+        '''
+        the body's rotating reference frame
+        '''
+        return self._cached('reference_frame', lambda v: self.body.reference_frame)
+
+    @property
+    def non_rotating_reference_frame(self):
+        return self._cached('non_rotating_reference_frame',
+                            lambda v: self.body.non_rotating_reference_frame)
+
+    @property
+    def surface_reference_frame(self):
+        return self._cached('surface_reference_frame', lambda v: v.surface_reference_frame)
+
+    def flight(self, reference_frame=None):
+        '''
+        vessel.flight(reference_frame), created once per reference frame
+        '''
+        def fetch(v):
+            if reference_frame is None:
+                return v.flight()
+            return v.flight(reference_frame)
+        return self._cached(('flight', reference_frame), fetch)
+
+    def invalidate(self):
+        '''
+        forget every cached handle
+        '''
+        self._vessel = self._fixed
+        self._handles = {}
+
+    def close(self):
+        if self._active_vessel is not None:
+            self._active_vessel.remove()
+        contexts = getattr(self.conn, '_vessel_contexts', {})
+        if contexts.get(self._fixed) is self:
+            del contexts[self._fixed]
@@ -0,0 +1,218 @@
+######################################################################
+### Vessel Performance Model Library and Example
+######################################################################
+###   Like all of the scripts in my folder here, this file contains
+###   functions you might want to include into your own scripts for
+###   actual use and a demo in the 'main' function that you can just
+###   run to see how it works.
+###
+###   The usual burn time estimate
+###
+###       burn_time = (m - m / exp(dv / (isp * g))) / (F / (isp * g))
+###
+###   asks the game for mass, Isp and thrust every time it's used, and
+###   it's wrong as soon as a burn needs more than the stage that's
+###   lit - the next stage has a different engine and starts lighter.
+###
+###   A VesselPerformance walks the vessel's parts once and works out,
+###   for every stage still to come, how heavy the vessel is, how much
+###   propellant it will burn, and with what thrust and Isp.  After that
+###
+###       perf.burn_time(dv)     # seconds to burn dv, across stages
+###       perf.delta_v()         # how much is left in the vessel
+###
+###   are answered locally.  The walk is done again when the vessel
+###   stages; in between only the vessel's mass is read (from a stream
+###   if you ask for one) to know how much of the lit stage is left.
+###
+###   It's the simple model: each stage's engines burn the propellant
+###   in the parts that are dropped when the next stage fires, and
+###   everything that isn't dry mass counts as propellant.
+######################################################################
+
+import math
+from collections import namedtuple
+
+from constants import G0
+from vessel_context import context_for
+
+Stage = namedtuple('Stage', 'number mass propellant thrust isp delta_v burn_time twr')
+
+
+class VesselPerformance(object):
+    '''
+    Per-stage delta-v, burn time and TWR for a vessel, stage numbers
+    counting down from the current stage to 0 like the staging list.
+    conn can be a connection or a vessel_context.VesselContext and
+    vessel defaults to the active vessel.  If you pass the vessel and
+    don't want streams, conn can be None.
+
+    With streaming=True the current stage and mass are streamed and
+    nothing after the first walk costs a round trip until the vessel
+    stages.  Call remove() when you're done with a streaming model.
+    TWRs are against the surface gravity of the body the vessel was
+    at when it last staged.
+    '''
+    def __init__(self, conn, vessel=None, streaming=False):
+        self.conn = conn
+        if conn is not None:
+            ctx = context_for(conn)
+            self.conn = ctx.conn
+            vessel = vessel or ctx.vessel
+        self.vessel = vessel
+        self.control = self.vessel.control
+        self.stages = []
+        self.current_stage = None
+        self.walks = 0
+        self.streams = None
+        if streaming:
+            self.streams = [self.conn.add_stream(getattr, self.control, 'current_stage'),
+                            self.conn.add_stream(getattr, self.vessel, 'mass')]
+
+    @property
+    def streaming(self):
+        return self.streams is not None
+
+    def remove(self):
+        if self.streaming:
+            for stream in self.streams:
+                stream.remove()
+            self.streams = None
+
+    def _read(self):
+        if self.streaming:
+            with self.conn.stream_update_condition:
+                return self.streams[0](), self.streams[1]()
+        return self.control.current_stage, self.vessel.mass
+
+    def refresh(self, current_stage=None):
+        '''
+        Walks the parts and rebuilds the stage list.  Done for you the
+        first time and whenever the vessel stages.
+        '''
+        if current_stage is None:
+            current_stage = self.control.current_stage
+        parts = []
+        for part in self.vessel.parts.all:
+            engine = part.engine
+            thrust = isp = 0.0
+            if engine is not None:
+                thrust = engine.max_thrust
+                isp = engine.vacuum_specific_impulse
+            parts.append((part.stage, part.decouple_stage, part.mass, part.dry_mass, thrust, isp))
+        g = self.vessel.orbit.body.surface_gravity
+
+        self.stages = []
+        for number in range(current_stage, -1, -1):
+            # everything still attached after staging to number, the
+            # parts dropped at the next stage and the engines that are lit
+            mass = sum(p[2] for p in parts if p[1] < number)
+            propellant = sum(p[2] - p[3] for p in parts if p[1] == number - 1)
+            engines = [p for p in parts if p[4] > 0 and p[0] >= number and p[1] < number]
+            thrust = sum(p[4] for p in engines)
+            flow = sum(p[4] / p[5] for p in engines if p[5] > 0)
+            isp = thrust / flow if flow else 0.0
+            self.stages.append(self._stage(number, mass, propellant, thrust, isp, g))
+        self.current_stage = current_stage
+        self.mass = self.stages[0].mass if self.stages else 0.0
+        self.g = g
+        self.walks += 1
+
+    def _stage(self, number, mass, propellant, thrust, isp, g):
+        if thrust > 0 and isp > 0 and 0 < propellant < mass:
+            ve = isp * G0
+            delta_v = ve * math.log(mass / (mass - propellant))
+            burn_time = propellant * ve / thrust
+        else:
+            delta_v = burn_time = 0.0
+        twr = thrust / (mass * g) if mass > 0 else 0.0
+        return Stage(number, mass, propellant, thrust, isp, delta_v, burn_time, twr)
+
+    def current(self):
+        '''
+        The stage list as it stands now: re-walked if the vessel has
+        staged, with the lit stage cut down to the propellant it has left.
+        '''
+        stage, mass = self._read()
+        if stage != self.current_stage:
+            self.refresh(stage)
+        if not self.stages:
+            return []
+        lit = self.stages[0]
+        burnt = min(max(self.mass - mass, 0.0), lit.propellant)
+        lit = self._stage(lit.number, lit.mass - burnt, lit.propellant - burnt,
+                          lit.thrust, lit.isp, self.g)
+        return [lit] + self.stages[1:]
+
+    def delta_v(self):
+        '''
+        delta-v left in every stage together, in m/s
+        '''
+        return sum(s.delta_v for s in self.current())
+
+    def twr(self):
+        '''
+        thrust to weight of the lit stage right now
+        '''
+        stages = self.current()
+        return stages[0].twr if stages else 0.0
+
+    def acceleration(self):
+        '''
+        acceleration at full thrust of the lit stage right now, in m/s^2
+        '''
+        stages = self.current()
+        if not stages or not stages[0].mass:
+            return 0.0
+        return stages[0].thrust / stages[0].mass
+
+    def burn_time(self, dv):
+        '''
+        Seconds of full thrust to change velocity by dv, staging as each
+        stage runs dry (not counting the time it takes to stage).  If the
+        vessel hasn't got that much delta-v the last stage that burns is
+        taken to keep going, so the answer is still usable to time a burn;
+        with no engines at all it's infinite.
+        '''
+        time = 0.0
+        last = None
+        for stage in self.current():
+            if not stage.delta_v:
+                continue
+            last = stage
+            if dv <= stage.delta_v:
+                return time + self._partial(stage.mass, stage.thrust, stage.isp, dv)
+            dv -= stage.delta_v
+            time += stage.burn_time
+        if last is None:
+            return float('inf')
+        return time + self._partial(last.mass - last.propellant, last.thrust, last.isp, dv)
+
+    @staticmethod
+    def _partial(mass, thrust, isp, dv):
+        ve = isp * G0
+        return mass * (1 - math.exp(-dv / ve)) * ve / thrust
+
+
+##############################################################################
+## Main  -- only run when we execute this file directly.  Prints the
+##          active vessel's stages and what the next node will take.
+##############################################################################
+def main():
+    import krpc
+
+    conn = krpc.connect(name='Vessel Performance')
+    perf = VesselPerformance(conn, streaming=True)
+    for stage in perf.current():
+        print('stage {:2d}: {:7.0f}m/s over {:5.1f}s, TWR {:4.2f}'.format(
+            stage.number, stage.delta_v, stage.burn_time, stage.twr))
+    print('{:.0f}m/s in all'.format(perf.delta_v()))
+    nodes = perf.vessel.control.nodes
+    if nodes:
+        dv = nodes[0].delta_v
+        print('next node: {:.1f}m/s, a {:.1f}s burn'.format(dv, perf.burn_time(dv)))
+    perf.remove()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,3 @@
+"""Physical constants shared by the ksppynet modules."""
+
+G0 = 9.80665  # standard gravity in m/s^2, what Isp in seconds is measured against
@@ -2,6 +2,8 @@ import asyncio
 import krpc
 import time
 import math
+from ksppynet.kepler import KeplerOrbit
+from ksppynet.vessel_performance import VesselPerformance
 
 def total_area(orbit):
     a = orbit.semi_major_axis
@@ -163,18 +165,20 @@ class ManeuverNode(object):
     def hohmann_transfer(self, target):
         conn = self.conn
         vessel = self.vessel
-        orbit = vessel.orbit
-        mu = orbit.body.gravitational_parameter
-        r1 = orbit.radius
-        r2 = target.orbit.radius
+        now = conn.space_center.ut
+        orbit = KeplerOrbit(vessel.orbit, now)
+        target_orbit = KeplerOrbit(target.orbit, now)
+        mu = orbit.gravitational_parameter
+        r1 = orbit.radius_at(now)
+        r2 = target_orbit.radius_at(now)
 
         transfer_time = math.pi * math.sqrt(((r1+r2)**3)/(8*mu))
         transfer_angle = math.pi * (1 - (1/(2*math.sqrt(2))) * math.sqrt(((r1/r2)+1)**3))
 
         Mv = orbit.mean_anomaly
-        Mt = target.orbit.mean_anomaly
+        Mt = target_orbit.mean_anomaly
         av = orbit.semi_major_axis
-        at = target.orbit.semi_major_axis
+        at = target_orbit.semi_major_axis
         nv = math.sqrt(mu/(av**3))
         nt = math.sqrt(mu/(at**3))
 
@@ -184,11 +188,11 @@ class ManeuverNode(object):
 
         print(Mt, Mv, transfer_angle, transfer_angle - Mt + Mv, nt - nv, time_until_transfer)
 
-        ut = conn.space_center.ut + time_until_transfer
+        ut = now + time_until_transfer
 
         a1 = orbit.semi_major_axis
         v1 = math.sqrt(mu*((2./r1)-(1./a1)))
-        a2 = (target.orbit.radius + r1) / 2
+        a2 = (r2 + r1) / 2
         v2 = math.sqrt(mu*((2./r1)-(1./a2)))
         delta_v = v2 - v1
 
@@ -198,12 +202,13 @@ class ManeuverNode(object):
     def change_inclination(self, new_inclination):
         conn = self.conn
         vessel = self.vessel
-        orbit = vessel.orbit
+        now = conn.space_center.ut
+        orbit = KeplerOrbit(vessel.orbit, now)
         i = new_inclination - orbit.inclination
-        v = orbit.speed
+        ut = now + time_to_ascending_node(orbit)
+        v = orbit.speed_at(ut)
         normal = v*math.sin(i)
         prograde = v*math.cos(i) - v
-        ut = conn.space_center.ut + time_to_ascending_node(orbit)
         self.node = vessel.control.add_node(ut, normal=normal, prograde=prograde)
 
     @asyncio.coroutine
@@ -219,13 +224,9 @@ class ManeuverNode(object):
         self.remaining_burn = conn.add_stream(node.remaining_burn_vector, node.reference_frame)
         self.node_ut = node.ut
 
-        # Calculate burn time using rocket equation
-        F = vessel.available_thrust
-        Isp = vessel.specific_impulse * 9.82
-        m0 = vessel.mass
-        m1 = m0 / math.exp(node.delta_v/Isp)
-        flow_rate = F / Isp
-        self.burn_time = (m0 - m1) / flow_rate
+        # Calculate burn time from the stages' rocket equations
+        self.performance = VesselPerformance(conn, vessel)
+        self.burn_time = self.performance.burn_time(node.delta_v)
 
         # Orientate ship
         ap = vessel.auto_pilot
@@ -244,14 +245,8 @@ class ManeuverNode(object):
                 continue
 
             # Burn time remaining
-            try:
-                F = self.vessel.available_thrust
-                Isp = self.vessel.specific_impulse * 9.82
-                m0 = self.vessel.mass
-                m1 = m0 / math.exp(self.remaining_burn()[1]/Isp)
-                flow_rate = F / Isp
-                remaining_burn_time = (m0 - m1) / flow_rate
-            except ZeroDivisionError:
+            remaining_burn_time = self.performance.burn_time(self.remaining_burn()[1])
+            if math.isinf(remaining_burn_time):
                 continue
 
             if remaining_burn_time > 2:
@@ -262,13 +257,13 @@ class ManeuverNode(object):
                 # Burn at a throttle setting that maintains a
                 # remaining burn time of t seconds
                 t = 2
-                F = ((m0 - m1) / t) * Isp
-                throttle = F / self.vessel.available_thrust # XXX Divide by zero!
+                throttle = remaining_burn_time / t
                 self.vessel.control.throttle = max(0.005, throttle)
                 continue
             else:
                 # Burn complete
                 self.vessel.control.throttle = 0
+                self.performance.remove()
                 self.node.remove()
                 self.node = None
                 return
@@ -0,0 +1,51 @@
+import math
+
+TWO_PI = 2 * math.pi
+
+
+class KeplerOrbit(object):
+    """An elliptical orbit's elements, fetched from a kRPC Orbit in one go.
+
+    Has the same attribute names as the Orbit it was made from, so it
+    can be passed to the helpers in flight_plan_node in its place, with
+    mean_anomaly being the mean anomaly at ut.  The *_at(ut) methods
+    propagate it to any other time without asking the server.
+    """
+    def __init__(self, orbit, ut):
+        self.ut = ut
+        self.gravitational_parameter = orbit.body.gravitational_parameter
+        self.semi_major_axis = a = orbit.semi_major_axis
+        self.eccentricity = e = orbit.eccentricity
+        self.inclination = orbit.inclination
+        self.longitude_of_ascending_node = orbit.longitude_of_ascending_node
+        self.argument_of_periapsis = orbit.argument_of_periapsis
+        self.mean_anomaly = orbit.mean_anomaly_at_ut(ut)
+        self.semi_minor_axis = a * math.sqrt(1 - e * e)
+        self.n = math.sqrt(self.gravitational_parameter / a ** 3)
+        self.period = TWO_PI / self.n
+
+    def mean_anomaly_at(self, ut):
+        return (self.mean_anomaly + self.n * (ut - self.ut)) % TWO_PI
+
+    def eccentric_anomaly_at(self, ut):
+        e = self.eccentricity
+        M = self.mean_anomaly_at(ut)
+        E = M if e < 0.8 else math.pi
+        for _ in range(30):
+            delta = (E - e * math.sin(E) - M) / (1 - e * math.cos(E))
+            E -= delta
+            if abs(delta) < 1e-12:
+                break
+        return E
+
+    def true_anomaly_at(self, ut):
+        e = self.eccentricity
+        E = self.eccentric_anomaly_at(ut)
+        return math.atan2(math.sqrt(1 - e * e) * math.sin(E), math.cos(E) - e) % TWO_PI
+
+    def radius_at(self, ut):
+        return self.semi_major_axis * (1 - self.eccentricity * math.cos(self.eccentric_anomaly_at(ut)))
+
+    def speed_at(self, ut):
+        return math.sqrt(self.gravitational_parameter
+                         * (2. / self.radius_at(ut) - 1. / self.semi_major_axis))
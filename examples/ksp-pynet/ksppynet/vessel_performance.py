@@ -0,0 +1,110 @@
+import math
+from collections import namedtuple
+
+from ksppynet.constants import G0
+
+Stage = namedtuple('Stage', 'number mass propellant thrust isp delta_v burn_time')
+
+
+class VesselPerformance(object):
+    """Per-stage delta-v and burn times for a vessel, worked out locally.
+
+    The parts are walked once, and again whenever the vessel stages.
+    Between walks only the current stage and the vessel's mass are read,
+    from streams, to know how much of the lit stage is left.  Each
+    stage's engines are taken to burn the propellant in the parts
+    dropped at the next stage.
+
+    A port of Art_Whaleys_KRPC_Demos/vessel_performance.py, which this
+    package can't import.  The stage and mass streams are read together
+    under the connection's stream_update_condition, so both come from
+    the same physics tick.
+    """
+    def __init__(self, conn, vessel):
+        self.conn = conn
+        self.vessel = vessel
+        self.current_stage = None
+        self.stages = []
+        self.mass = 0.0
+        self.stage_stream = conn.add_stream(getattr, vessel.control, 'current_stage')
+        self.mass_stream = conn.add_stream(getattr, vessel, 'mass')
+
+    def remove(self):
+        self.stage_stream.remove()
+        self.mass_stream.remove()
+
+    def refresh(self, current_stage):
+        parts = []
+        for part in self.vessel.parts.all:
+            engine = part.engine
+            thrust = isp = 0.0
+            if engine is not None:
+                thrust = engine.max_thrust
+                isp = engine.vacuum_specific_impulse
+            parts.append((part.stage, part.decouple_stage, part.mass, part.dry_mass, thrust, isp))
+
+        self.stages = []
+        for number in range(current_stage, -1, -1):
+            mass = sum(p[2] for p in parts if p[1] < number)
+            propellant = sum(p[2] - p[3] for p in parts if p[1] == number - 1)
+            engines = [p for p in parts if p[4] > 0 and p[0] >= number and p[1] < number]
+            thrust = sum(p[4] for p in engines)
+            flow = sum(p[4] / p[5] for p in engines if p[5] > 0)
+            isp = thrust / flow if flow else 0.0
+            self.stages.append(self._stage(number, mass, propellant, thrust, isp))
+        self.current_stage = current_stage
+        self.mass = self.stages[0].mass if self.stages else 0.0
+
+    @staticmethod
+    def _stage(number, mass, propellant, thrust, isp):
+        if thrust > 0 and isp > 0 and 0 < propellant < mass:
+            ve = isp * G0
+            delta_v = ve * math.log(mass / (mass - propellant))
+            burn_time = propellant * ve / thrust
+        else:
+            delta_v = burn_time = 0.0
+        return Stage(number, mass, propellant, thrust, isp, delta_v, burn_time)
+
+    def _read(self):
+        with self.conn.stream_update_condition:
+            return self.stage_stream(), self.mass_stream()
+
+    def current(self):
+        stage, mass = self._read()
+        if stage != self.current_stage:
+            self.refresh(stage)
+        if not self.stages:
+            return []
+        lit = self.stages[0]
+        burnt = min(max(self.mass - mass, 0.0), lit.propellant)
+        lit = self._stage(lit.number, lit.mass - burnt, lit.propellant - burnt,
+                          lit.thrust, lit.isp)
+        return [lit] + self.stages[1:]
+
+    def delta_v(self):
+        return sum(s.delta_v for s in self.current())
+
+    def burn_time(self, dv):
+        """Seconds at full thrust to burn dv, staging as stages run dry.
+
+        Past the vessel's delta-v the last stage is taken to keep going;
+        with no engines at all the answer is infinite.
+        """
+        time = 0.0
+        last = None
+        for stage in self.current():
+            if not stage.delta_v:
+                continue
+            last = stage
+            if dv <= stage.delta_v:
+                return time + self._partial(stage.mass, stage.thrust, stage.isp, dv)
+            dv -= stage.delta_v
+            time += stage.burn_time
+        if last is None:
+            return float('inf')
+        return time + self._partial(last.mass - last.propellant, last.thrust, last.isp, dv)
+
+    @staticmethod
+    def _partial(mass, thrust, isp, dv):
+        ve = isp * G0
+        return mass * (1 - math.exp(-dv / ve)) * ve / thrust